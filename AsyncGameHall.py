@@ -0,0 +1,177 @@
+import asyncio
+import concurrent.futures
+import signal
+import sys
+import time
+import BinaryProtocol
+import GameHallServer
+import Player
+
+
+class TransportSock:
+    """
+    Socket stand-in owned by a Player, the asyncio transport does the real socket work
+    """
+    def __init__(self, transport):
+        self.transport = transport
+
+    def setblocking(self, flag):
+        pass
+
+    def fileno(self):
+        sock = self.transport.get_extra_info('socket')
+        return sock.fileno() if sock is not None else -1
+
+    def close(self):
+        self.transport.close()  # pending data is still flushed by the transport
+
+
+class PlayerProtocol(asyncio.Protocol):
+    def __init__(self, hall):
+        self.hall = hall
+        self.player = None
+
+    def connection_made(self, transport):
+        self.player = self.hall.handle_new_transport(transport)
+
+    def data_received(self, data):
+        self.hall.bytes_received.value += len(data)
+        if self.hall.capture is not None:
+            self.hall.capture.data(self.player, data)
+        lines = self.player.framer.feed(data)
+        self.hall.mark_active(self.player, lines)
+        self.hall.dispatch_lines(self.player, lines)
+
+    def connection_lost(self, exc):
+        if not self.player.closed:
+            self.hall.handle_player_disconnect(self.player)
+
+
+class AsyncGameHall(GameHallServer.GameHall):
+    """
+    GameHall served by an asyncio event loop
+
+    Every connection is a protocol/transport pair, the 21 point game rounds of each room run on loop
+    timers and the database is queried by a single executor thread and the auth worker threads, so
+    the loop never waits for SQLite.
+    """
+    def __init__(self, *args, **kwargs):
+        GameHallServer.GameHall.__init__(self, *args, **kwargs)
+        self.loop = None
+        self.server = None
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)  # the sqlite connection stays in one thread
+        self.close_scheduled = False
+        self.flush_scheduled = False
+
+    def run(self):
+        signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))  # run the cleanup in shutdown
+        try:
+            asyncio.run(self.serve_forever())
+        finally:
+            signal.signal(signal.SIGTERM, signal.SIG_IGN)  # do not interrupt the final flush
+            self.executor.shutdown()
+            self.shutdown()
+
+    async def start(self):
+        """
+        Start serving in the running loop, usable from other asyncio applications
+        """
+        self.loop = asyncio.get_running_loop()
+        await self.run_db(self.check_and_create_user_login_table)
+        self.load_solution_index()
+        self.start_metrics_server()
+        self.auth_pool.start(self.auth_done)
+        self.server = await self.loop.create_server(lambda: PlayerProtocol(self), self.host or None, self.port,
+                                                    backlog=self.max_connect_num, reuse_address=True)
+        print("Server is listening at %s (asyncio)" % ((self.host, self.port),))
+
+    async def serve_forever(self):
+        await self.start()
+        async with self.server:
+            await self.server.serve_forever()
+
+    def run_db(self, func, *args):
+        return self.loop.run_in_executor(self.executor, func, *args)
+
+    def auth_done(self):
+        """
+        Called by an auth worker thread, the callbacks run in the loop
+        """
+        if not self.loop.is_closed():  # jobs still queued at shutdown have nobody to answer
+            self.loop.call_soon_threadsafe(self.auth_pool.run_completions)
+
+    def call_at(self, when, callback, *args):
+        return self.loop.call_later(when - time.time(), callback, *args)  # the loop timers use the monotonic clock
+
+    def handle_new_transport(self, transport):
+        new_player = Player.Player(TransportSock(transport), self.max_line_len)
+        self.all_socks.append(new_player)
+        self.connections_accepted.value += 1
+        self.track_idle(new_player)
+        if self.capture is not None:
+            self.capture.connect(new_player)
+        self.send_msg_to_player(new_player, "Welcome to KGameHall\nType $help to get instructions\n")
+        return new_player
+
+    def send_bytes_to_player(self, player, data):
+        if player.closed or player in self.players_to_close:
+            return
+        pending = player.pending_output_size()
+        if pending + player.sock.transport.get_write_buffer_size() + len(data) > self.max_output_buffer:  # slow consumer
+            self.slow_consumer_events.value += 1
+            if self.slow_consumer_policy != 'drop':
+                self.close_later(player)
+            return
+        player.queue_output(data)
+        if pending == 0:
+            self.dirty_players.append(player)
+            if not self.flush_scheduled:  # write everything queued by the current callback at once
+                self.flush_scheduled = True
+                self.loop.call_soon(self.flush_dirty_players)
+
+    def flush_dirty_players(self):
+        self.flush_scheduled = False
+        players, self.dirty_players = self.dirty_players, []
+        for player in players:
+            if not player.closed:
+                self.flush_player_output(player)
+
+    def flush_player_output(self, player):
+        if player.out_buffer is not None:
+            data = player.take_output()
+            player.sock.transport.write(data)
+            self.bytes_sent.value += len(data)
+        return True
+
+    def close_later(self, player):
+        GameHallServer.GameHall.close_later(self, player)
+        if not self.close_scheduled:
+            self.close_scheduled = True
+            self.loop.call_soon(self.close_pending_players)
+
+    def close_pending_players(self):
+        self.close_scheduled = False
+        GameHallServer.GameHall.close_pending_players(self)
+
+    def stop_reading(self, player):
+        player.sock.transport.pause_reading()
+
+    def start_reading(self, player):
+        player.sock.transport.resume_reading()
+
+    def close_player_socket(self, player):
+        self.flush_player_output(player)
+        player.closed = True
+        player.sock.close()
+
+    def handle_history_online_time_command(self, player, msg, args):
+        self.pause_player(player)
+
+        def done(future):
+            if player.closed:
+                return
+            self.replying_to = player
+            self.send_online_time(player, BinaryProtocol.ONLINE_HISTORY, future.result())
+            self.replying_to = None
+            self.resume_player(player)
+        self.run_db(self.get_history_online_time, player.get_username()).add_done_callback(done)
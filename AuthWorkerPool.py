@@ -0,0 +1,149 @@
+import binascii
+import collections
+import hashlib
+import hmac
+import os
+import sqlite3
+import threading
+import traceback
+from Fanout import to_bytes
+try:
+    import queue
+except ImportError:  # python 2
+    import Queue as queue
+
+HASH_NAME = 'pbkdf2_sha256'
+
+
+def hash_password(password, iterations, salt=None):
+    """
+    Return the stored form of a password, 'pbkdf2_sha256$iterations$salt$hash' in hex
+    """
+    if salt is None:
+        salt = binascii.hexlify(os.urandom(16)).decode('ascii')
+    dk = hashlib.pbkdf2_hmac('sha256', to_bytes(password), to_bytes(salt), iterations)
+    return "%s$%d$%s$%s" % (HASH_NAME, iterations, salt, binascii.hexlify(dk).decode('ascii'))
+
+
+def verify_password(password, stored):
+    """
+    Check a password against its stored form, return (valid, needs_rehash), a stored form that
+    is neither a PBKDF2 nor a sha256 hash matches no password
+    """
+    stored = str(stored)
+    if not stored.startswith(HASH_NAME + '$'):  # accounts created before PBKDF2, plain sha256
+        legacy = hashlib.sha256(to_bytes(password)).hexdigest()
+        return hmac.compare_digest(to_bytes(legacy), to_bytes(stored)), True
+    parts = stored.split('$')
+    if len(parts) != 4 or not parts[1].isdigit() or not 0 < int(parts[1]) < 1 << 31:
+        return False, False
+    computed = hash_password(password, int(parts[1]), parts[2])
+    return hmac.compare_digest(to_bytes(computed), to_bytes(stored)), False
+
+
+class AuthWorkerPool:
+    """
+    Threads hashing passwords and querying the accounts away from the event loop
+
+    Results are appended to a completion queue, notify() is called after each one so the loop
+    can call run_completions, the callbacks then run on the loop thread. PBKDF2 releases the GIL
+    while hashing, so the threads hash in parallel with the loop.
+    """
+    def __init__(self, database, num_threads=4, iterations=100000):
+        self.database = database
+        self.num_threads = num_threads
+        self.iterations = iterations
+        self.jobs = queue.Queue()
+        self.completions = collections.deque()
+        self.notify = None
+        self.threads = []
+
+    def start(self, notify):
+        self.notify = notify
+        for i in range(self.num_threads):
+            t = threading.Thread(target=self.worker, name="auth-worker-%d" % i)
+            t.daemon = True
+            t.start()
+            self.threads.append(t)
+
+    def stop(self):
+        for t in self.threads:
+            self.jobs.put(None)
+        for t in self.threads:
+            t.join()
+        self.threads = []
+
+    def login(self, username, password, callback):
+        """
+        Check the credentials, callback(msg) gets None on success or the reason of the failure
+        """
+        self.jobs.put((self.authenticate, username, password, callback))
+
+    def register(self, username, password, callback):
+        """
+        Create an account, callback(msg) gets None on success or the reason of the failure
+        """
+        self.jobs.put((self.add_user, username, password, callback))
+
+    def online_time(self, username, callback):
+        """
+        Read the online time of a user, callback(result) gets the seconds or the reason of the failure
+        """
+        self.jobs.put((self.get_online_time, username, None, callback))
+
+    def run_completions(self):
+        """
+        Run the callbacks of the finished jobs, called on the loop thread
+        """
+        while self.completions:
+            callback, result = self.completions.popleft()
+            callback(result)
+
+    def run_pending(self):
+        """
+        Run the queued jobs on the calling thread, for a pool without threads, return their number
+        """
+        count = 0
+        while not self.jobs.empty():
+            self.run_job(self.jobs.get())
+            count += 1
+        return count
+
+    def worker(self):
+        while True:
+            job = self.jobs.get()
+            if job is None:
+                break
+            self.run_job(job)
+
+    def run_job(self, job):
+        func, username, password, callback = job
+        try:
+            result = func(username, password)
+        except sqlite3.Error:  # the player is still waiting for an answer
+            result = "Database error, try again later\n"
+        except Exception:  # the worker goes on and the player gets an answer
+            traceback.print_exc()
+            result = "Server error, try again later\n"
+        self.completions.append((callback, result))
+        self.notify()
+
+    def authenticate(self, username, password):
+        res = self.database.get_user(username)
+        if res is None:
+            return "Player %s doesn't exist\n" % username
+        valid, needs_rehash = verify_password(password, res[0])
+        if not valid:
+            return "Invalid password\n"
+        if needs_rehash:  # upgrade the old sha256 hash now that the password is known
+            self.database.set_password(username, hash_password(password, self.iterations))
+        return None
+
+    def get_online_time(self, username, password):
+        res = self.database.get_user(username)
+        return res[1] if res is not None else 0
+
+    def add_user(self, username, password):
+        if not self.database.add_user(username, hash_password(password, self.iterations)):
+            return "Player %s already exist\n" % username
+        return None
@@ -0,0 +1,245 @@
+"""
+Compact binary protocol, negotiated with "$protocol binary" or "$protocol zlib" before logging in
+
+Every message is a frame: the payload length, one byte if it is below 128 and four bytes with the
+top bit set otherwise, a byte holding the opcode and the flags, then the payload. The client sends
+the opcode of a command and its arguments separated by NUL bytes, the server answers with reply
+frames for the commands of the connection, push frames for chats and game broadcasts, and
+structured frames for $rooms, $online_time and the heartbeat. A command may carry a request id,
+which is then echoed by its replies and by an OP_DONE frame once it has finished. With "zlib", a
+payload of at least COMPRESS_MIN bytes is sent compressed when that makes it smaller, a broadcast
+is framed and compressed once for all its recipients.
+"""
+import struct
+import zlib
+
+SHORT_HEADER = struct.Struct('>BB')  # payload length below 128, opcode and flags
+LONG_HEADER = struct.Struct('>IB')  # payload length with the top bit set, opcode and flags
+LONG_LENGTH = 0x80000000
+OPCODE_MASK = 0x3f
+FLAG_COMPRESSED = 0x80
+FLAG_REQUEST_ID = 0x40  # the payload is preceded by REQUEST_ID
+REQUEST_ID = struct.Struct('>I')
+COMPRESS_MIN = 256
+
+# opcodes of the commands sent by the client, in the order of COMMANDS starting at 1
+COMMANDS = ('$help', '$register', '$login', '$logout', '$quit', '$online_time', '$history_online_time', '$chat',
+            '$chatall', '$chat@', '$build', '$join', '$rooms', '$leave', '$21game', '$stats', '$pong',
+            '$history', '$leaderboard', '$rank', '$resume')
+OPCODES = dict((name, i + 1) for i, name in enumerate(COMMANDS))
+TEXT_COMMANDS = ('$chat', '$chatall', '$chat@', '$21game')  # the rest of the line is a single argument
+OP_PONG = OPCODES['$pong']
+
+# opcodes of the frames sent by the server
+OP_REPLY = 0x30  # text answering a command of this connection
+OP_PUSH = 0x31  # text sent by the server or other players
+OP_ROOMS = 0x32  # ROOMS_HEADER then ROOM_ENTRY and the name of each room
+OP_ONLINE_TIME = 0x33  # ONLINE_TIME
+OP_PING = 0x34  # heartbeat, answered with $pong
+OP_DONE = 0x35  # the command with the request id of the frame has finished
+
+ROOMS_HEADER = struct.Struct('>III')  # number of rooms, page, number of pages
+ROOM_ENTRY = struct.Struct('>IH')  # number of players, length of the name
+ONLINE_TIME = struct.Struct('>BI')  # ONLINE_CURRENT or ONLINE_HISTORY, seconds
+ONLINE_CURRENT = 0
+ONLINE_HISTORY = 1
+
+
+def header(size, opcode):
+    if size < 0x80:
+        return SHORT_HEADER.pack(size, opcode)
+    return LONG_HEADER.pack(size | LONG_LENGTH, opcode)
+
+
+def build_frame(opcode, payload, request_id=None):
+    """
+    Frame of an encoded payload, opcode may hold FLAG_COMPRESSED
+    """
+    if request_id is None:
+        return header(len(payload), opcode) + payload
+    return header(len(payload) + REQUEST_ID.size, opcode | FLAG_REQUEST_ID) + REQUEST_ID.pack(request_id) + payload
+
+
+class Codec:
+    """
+    Encoder of the server frames of one protocol variant, shared by all its connections
+    """
+    def __init__(self, name, compress):
+        self.name = name
+        self.compress = compress
+
+    def encode(self, opcode, payload):
+        """
+        Return the opcode with its flags and the payload, compressed if that is worth it
+        """
+        if self.compress and len(payload) >= COMPRESS_MIN:
+            compressed = zlib.compress(payload)
+            if len(compressed) < len(payload):
+                return opcode | FLAG_COMPRESSED, compressed
+        return opcode, payload
+
+    def frame(self, opcode, payload, request_id=None):
+        opcode, payload = self.encode(opcode, payload)
+        return build_frame(opcode, payload, request_id)
+
+    def push(self, data):
+        return self.frame(OP_PUSH, data)
+
+    def create_framer(self, max_len):
+        return BinaryFramer(max_len)
+
+
+CODECS = {'binary': Codec('binary', False), 'zlib': Codec('zlib', True)}
+
+
+class BinaryFramer(object):  # a new style class for __slots__
+    """
+    Incremental splitter turning a stream of received bytes into (opcode, payload, request id)
+    frames, with the same interface as LineFramer, data is a bytearray. A frame whose payload, once
+    decompressed, exceeds max_len is skipped and reported once as None
+    """
+    __slots__ = ('max_len', 'partial', 'skip')
+
+    def __init__(self, max_len=4096):
+        self.max_len = max_len
+        self.partial = None  # bytearray of the unfinished frame carried over from previous segments
+        self.skip = 0  # bytes left of a frame that is too long
+
+    def feed(self, data, length=None):
+        if length is None:
+            length = len(data)
+        if self.partial is not None:
+            self.partial += memoryview(data)[:length]
+            data, length = self.partial, len(self.partial)
+            self.partial = None
+        frames = []
+        pos = min(self.skip, length)
+        self.skip -= pos
+        while pos < length:
+            size = data[pos]
+            if size < 0x80:
+                start = pos + SHORT_HEADER.size
+            else:
+                start = pos + LONG_HEADER.size
+                if start > length:
+                    break
+                size = LONG_HEADER.unpack_from(data, pos)[0] & ~LONG_LENGTH
+            end = start + size
+            if size > self.max_len:
+                frames.append(None)
+                self.skip = max(end - length, 0)
+                pos = min(end, length)
+                continue
+            if end > length:
+                break
+            opcode = data[start - 1]
+            request_id = None
+            if opcode & FLAG_REQUEST_ID and size >= REQUEST_ID.size:
+                request_id = REQUEST_ID.unpack_from(data, start)[0]
+                start += REQUEST_ID.size
+            payload = bytes(data[start:end])
+            pos = end
+            if opcode & FLAG_COMPRESSED:
+                payload = self.decompress(payload)
+            frames.append((opcode & OPCODE_MASK, payload, request_id) if payload is not None else None)
+        if pos < length:
+            self.partial = bytearray(memoryview(data)[pos:length])
+        return frames
+
+    def decompress(self, payload):
+        d = zlib.decompressobj()
+        try:
+            payload = d.decompress(payload, self.max_len + 1)
+        except zlib.error:
+            return None
+        if len(payload) > self.max_len or d.unconsumed_tail:
+            return None
+        return payload
+
+    def pending_size(self):
+        return len(self.partial) if self.partial is not None else 0
+
+    def pending_data(self):
+        return bytes(self.partial) if self.partial is not None else b''
+
+    @staticmethod
+    def join_lines(frames):
+        """
+        Encode frames returned by feed again, e.g. to hand them over to another process
+        """
+        return b''.join(build_frame(f[0], f[1], f[2]) for f in frames if f is not None)
+
+    @staticmethod
+    def is_heartbeat(frame):
+        return frame is not None and frame[0] == OP_PONG
+
+
+def encode_command(line, request_id=None):
+    """
+    Frame of a text command line for the server, None if the command has no opcode
+    """
+    words = line.split()
+    if not words:
+        return None
+    name = words[0]
+    rest = line.lstrip()[len(name):].strip()
+    if name.startswith('$chat@') and len(name) > len('$chat@'):
+        fields = [name[len('$chat@'):], rest]
+        name = '$chat@'
+    elif name in TEXT_COMMANDS:
+        fields = [rest] if rest else []
+    else:
+        fields = words[1:]
+    opcode = OPCODES.get(name)
+    if opcode is None:
+        return None
+    payload = '\0'.join(fields)
+    if not isinstance(payload, bytes):
+        payload = payload.encode('utf-8')
+    return build_frame(opcode, payload, request_id)
+
+
+def encode_room(name, num_players):
+    """
+    Entry of a room in OP_ROOMS, name is encoded
+    """
+    return ROOM_ENTRY.pack(num_players, len(name)) + name
+
+
+def encode_rooms(total, page, num_pages, entries):
+    """
+    Payload of OP_ROOMS with the entries built by encode_room
+    """
+    return ROOMS_HEADER.pack(total, page, num_pages) + b''.join(entries)
+
+
+def decode_rooms(payload):
+    total, page, num_pages = ROOMS_HEADER.unpack_from(payload, 0)
+    pos = ROOMS_HEADER.size
+    rooms = []
+    while pos < len(payload):
+        num_players, name_len = ROOM_ENTRY.unpack_from(payload, pos)
+        pos += ROOM_ENTRY.size
+        rooms.append((payload[pos:pos + name_len].decode('utf-8'), num_players))
+        pos += name_len
+    return total, page, num_pages, rooms
+
+
+def decode_text(opcode, payload):
+    """
+    Text of a server frame as the text protocol shows it
+    """
+    if opcode in (OP_REPLY, OP_PUSH):
+        return payload.decode('utf-8', 'replace')
+    if opcode == OP_ROOMS:
+        total, page, num_pages, rooms = decode_rooms(payload)
+        return "Num of rooms: %d, page %d/%d\n" % (total, page, num_pages) + ''.join(
+            "%s(%d players)\n" % room for room in rooms)
+    if opcode == OP_ONLINE_TIME:
+        kind, seconds = ONLINE_TIME.unpack(payload)
+        return "%s time: %d seconds\n" % ("History online" if kind == ONLINE_HISTORY else "Online", seconds)
+    if opcode == OP_PING:
+        return "$ping\n"
+    if opcode == OP_DONE:
+        return ""
+    return "Unknown frame %d\n" % opcode
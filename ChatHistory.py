@@ -0,0 +1,83 @@
+import collections
+
+
+class HistoryBuffer(object):  # a new style class for __slots__
+    """
+    Ring buffer of the last messages of one channel, already encoded
+    """
+    __slots__ = ('lines', 'size', 'last')
+
+    def __init__(self):
+        self.lines = collections.deque()
+        self.size = 0  # bytes of the messages
+        self.last = 0  # sequence number of the last message, orders the channels by activity
+
+
+class ChatHistory:
+    """
+    Recent messages of the game hall, of each room and of private conversations, kept as the
+    encoded bytes that were sent so a replay is a join
+
+    Each channel keeps its last max_lines messages. When all of them together exceed max_bytes
+    the least recently active channels are dropped until 7/8 of max_bytes is left, so the history
+    of idle rooms goes first, the memory stays bounded and the sort is paid once per batch of drops.
+    """
+    def __init__(self, max_lines=50, max_bytes=8 << 20):
+        self.max_lines = max_lines  # 0 disables the history
+        self.max_bytes = max_bytes
+        self.channels = {}  # mapping from channel key to HistoryBuffer
+        self.size = 0
+        self.sequence = 0
+
+    def record(self, key, data):
+        """
+        Append an encoded message to the history of a channel
+        """
+        if not self.max_lines:
+            return
+        buf = self.channels.get(key)
+        if buf is None:
+            buf = self.channels[key] = HistoryBuffer()
+        self.sequence += 1
+        buf.last = self.sequence
+        buf.lines.append(data)
+        buf.size += len(data)
+        self.size += len(data)
+        if len(buf.lines) > self.max_lines:
+            self.trim(buf)
+        if self.size > self.max_bytes:
+            self.evict(key)
+
+    def evict(self, key):
+        """
+        Drop the least recently active channels but key, then the oldest messages of key if it is still too big
+        """
+        target = self.max_bytes - self.max_bytes // 8
+        for other in sorted(self.channels, key=lambda k: self.channels[k].last):
+            if self.size <= target:
+                break
+            if other != key:
+                self.drop(other)
+        buf = self.channels[key]
+        while self.size > self.max_bytes and buf.lines:
+            self.trim(buf)
+
+    def trim(self, buf):
+        old = buf.lines.popleft()
+        buf.size -= len(old)
+        self.size -= len(old)
+
+    def replay(self, key):
+        """
+        Return the recent messages of a channel joined, empty if there are none
+        """
+        buf = self.channels.get(key)
+        return b''.join(buf.lines) if buf is not None else b''
+
+    def drop(self, key):
+        buf = self.channels.pop(key, None)
+        if buf is not None:
+            self.size -= buf.size
+
+    def __len__(self):
+        return len(self.channels)
@@ -0,0 +1,98 @@
+import timeit
+
+
+class Command:
+    def __init__(self, name, handler, min_args, max_args, login_required, rate_class=None):
+        self.name = name
+        self.handler = handler  # called as handler(player, msg, args)
+        self.min_args = min_args
+        self.max_args = max_args  # None means no upper limit
+        self.login_required = login_required
+        self.rate_class = rate_class  # RateLimiter class of the command, None if it is not limited
+        self.calls = 0
+        self.total_time = 0.0  # cumulative handler time in seconds
+
+    def accept_args(self, num_args):
+        return num_args >= self.min_args and (self.max_args is None or num_args <= self.max_args)
+
+
+class CommandDispatcher:
+    """
+    Registry mapping command names to their handlers
+
+    A command is looked up by its first word, a prefix command such as '$chat@' matches every word
+    starting with the prefix, e.g. '$chat@username'.
+    """
+    def __init__(self, not_login_handler, wrong_command_handler):
+        self.commands = {}  # mapping from command name to Command
+        self.prefix_commands = {}  # mapping from prefix(ending with '@') to Command
+        self.not_login_handler = not_login_handler  # called as handler(player) when login is required
+        self.wrong_command_handler = wrong_command_handler  # called as handler(player) for unknown commands
+        self.admit = None  # called as admit(player, command) for rate limited commands, False skips the command
+        self.timer = timeit.default_timer
+
+    def register(self, name, handler, arity=0, login_required=True, prefix=False, rate_class=None):
+        """
+        Register a command, arity is the exact number of arguments, a (min, max) tuple or None for any
+        """
+        if arity is None:
+            min_args, max_args = 0, None
+        elif isinstance(arity, tuple):
+            min_args, max_args = arity
+        else:
+            min_args, max_args = arity, arity
+        command = Command(name, handler, min_args, max_args, login_required, rate_class)
+        if prefix:
+            self.prefix_commands[name] = command
+        else:
+            self.commands[name] = command
+        return command
+
+    def lookup(self, word):
+        command = self.commands.get(word)
+        if command is None:
+            at = word.find('@')
+            if at > 0:  # "$chat@" alone too, answered like an unknown player
+                command = self.prefix_commands.get(word[:at + 1])
+        return command
+
+    def dispatch(self, player, msg, msg_list):
+        """
+        Run the command named by msg_list[0]
+        """
+        self.run(player, self.lookup(msg_list[0]), msg, msg_list[1:])
+
+    def run(self, player, command, msg, args):
+        """
+        Run the handler of a command, found by name or by binary opcode, and record its latency
+        """
+        if command is None or not command.accept_args(len(args)):
+            self.wrong_command_handler(player)
+            return
+        if command.login_required and not player.is_already_login():
+            self.not_login_handler(player)
+            return
+        if command.rate_class is not None and self.admit is not None and not self.admit(player, command):
+            return
+        start = self.timer()
+        try:
+            command.handler(player, msg, args)
+        finally:
+            command.calls += 1
+            command.total_time += self.timer() - start
+
+    def get_stats(self):
+        """
+        Return (name, calls, total_time) of every command, the most expensive first
+        """
+        stats = [(c.name, c.calls, c.total_time) for c in self.commands.values()]
+        stats += [(c.name, c.calls, c.total_time) for c in self.prefix_commands.values()]
+        stats.sort(key=lambda x: x[2], reverse=True)
+        return stats
+
+    def format_stats(self):
+        lines = ["%-22s %10s %12s %12s" % ("command", "calls", "total(ms)", "avg(us)")]
+        for name, calls, total_time in self.get_stats():
+            avg = total_time / calls * 1e6 if calls else 0.0
+            lines.append("%-22s %10d %12.1f %12.1f" % (name, calls, total_time * 1e3, avg))
+        return "\n".join(lines) + "\n"
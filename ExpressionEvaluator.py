@@ -0,0 +1,159 @@
+import fractions
+
+SYMBOLS = '0123456789+-*/()'
+
+
+class ExpressionError(Exception):
+    """
+    The expression can not be evaluated, reason is 'symbol', 'syntax', 'complex' or 'zero'
+    """
+    def __init__(self, reason):
+        Exception.__init__(self, reason)
+        self.reason = reason
+
+
+class ExpressionEvaluator:
+    """
+    Sandboxed evaluator of 21 point game answers
+
+    Only integers, + - * / and parentheses are accepted. The text is parsed once into a small
+    tree of tuples and computed exactly with Fractions, so 10/4 is 5/2 on every python version.
+    Expressions are limited in length and nesting depth, and each number has at most max_digits
+    digits, so an answer can not keep the loop busy. Results, errors included, are cached by the
+    expression without whitespace.
+    """
+    def __init__(self, max_length=64, max_depth=16, max_digits=2, cache_size=4096):
+        self.max_length = max_length
+        self.max_depth = max_depth
+        self.max_digits = max_digits
+        self.cache_size = cache_size
+        self.cache = {}  # mapping from normalized expression to (value, numbers) or ExpressionError
+
+    def evaluate(self, text):
+        """
+        Return (value, sorted tuple of the numbers used), raise ExpressionError if the text is invalid
+        """
+        expr = ''.join(text.split())
+        res = self.cache.get(expr)
+        if res is None:
+            try:
+                res = self.compute(expr)
+            except ExpressionError as e:
+                res = e
+            if len(self.cache) >= self.cache_size:
+                self.cache.clear()
+            self.cache[expr] = res
+        if isinstance(res, ExpressionError):
+            raise res
+        return res
+
+    def compute(self, expr):
+        for c in expr:
+            if c not in SYMBOLS:
+                raise ExpressionError('symbol')
+        if not expr:
+            raise ExpressionError('syntax')
+        if len(expr) > self.max_length:
+            raise ExpressionError('complex')
+        parser = Parser(expr, self.max_depth, self.max_digits)
+        tree = parser.parse()
+        return evaluate_tree(tree), tuple(sorted(parser.numbers))
+
+
+class Parser:
+    """
+    Recursive descent parser, the tree nodes are ('num', n), ('neg', x) and (op, left, right)
+
+        expr    := term (('+' | '-') term)*
+        term    := unary (('*' | '/') unary)*
+        unary   := ('+' | '-') unary | primary
+        primary := number | '(' expr ')'
+    """
+    def __init__(self, expr, max_depth, max_digits):
+        self.expr = expr
+        self.pos = 0
+        self.depth = 0
+        self.max_depth = max_depth
+        self.max_digits = max_digits
+        self.numbers = []
+
+    def parse(self):
+        tree = self.parse_expr()
+        if self.pos != len(self.expr):
+            raise ExpressionError('syntax')
+        return tree
+
+    def peek(self):
+        return self.expr[self.pos] if self.pos < len(self.expr) else None
+
+    def parse_expr(self):
+        tree = self.parse_term()
+        while self.peek() in ('+', '-'):
+            op = self.expr[self.pos]
+            self.pos += 1
+            tree = (op, tree, self.parse_term())
+        return tree
+
+    def parse_term(self):
+        tree = self.parse_unary()
+        while self.peek() in ('*', '/'):
+            op = self.expr[self.pos]
+            self.pos += 1
+            tree = (op, tree, self.parse_unary())
+        return tree
+
+    def parse_unary(self):
+        c = self.peek()
+        if c in ('+', '-'):
+            self.pos += 1
+            self.enter()
+            tree = self.parse_unary()
+            self.depth -= 1
+            return ('neg', tree) if c == '-' else tree
+        return self.parse_primary()
+
+    def parse_primary(self):
+        c = self.peek()
+        if c == '(':
+            self.pos += 1
+            self.enter()
+            tree = self.parse_expr()
+            self.depth -= 1
+            if self.peek() != ')':
+                raise ExpressionError('syntax')
+            self.pos += 1
+            return tree
+        start = self.pos
+        while self.pos < len(self.expr) and self.expr[self.pos].isdigit():
+            self.pos += 1
+        if self.pos == start:
+            raise ExpressionError('syntax')
+        if self.pos - start > self.max_digits:
+            raise ExpressionError('complex')
+        n = int(self.expr[start:self.pos])
+        self.numbers.append(n)
+        return ('num', n)
+
+    def enter(self):
+        self.depth += 1
+        if self.depth > self.max_depth:
+            raise ExpressionError('complex')
+
+
+def evaluate_tree(tree):
+    kind = tree[0]
+    if kind == 'num':
+        return fractions.Fraction(tree[1])
+    if kind == 'neg':
+        return -evaluate_tree(tree[1])
+    left = evaluate_tree(tree[1])
+    right = evaluate_tree(tree[2])
+    if kind == '+':
+        return left + right
+    if kind == '-':
+        return left - right
+    if kind == '*':
+        return left * right
+    if right == 0:
+        raise ExpressionError('zero')
+    return left / right
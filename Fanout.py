@@ -0,0 +1,71 @@
+def to_bytes(msg):
+    """
+    Messages are built as native strings, sockets want bytes
+    """
+    if isinstance(msg, bytes):
+        return msg
+    return msg.encode('utf-8')
+
+
+def to_str(data):
+    if isinstance(data, str):
+        return data
+    return data.decode('utf-8', 'replace')
+
+
+class Channel:
+    """
+    Explicit set of players receiving the same messages, e.g. the game hall or a room
+    """
+    def __init__(self, name):
+        self.name = name
+        self.members = set()
+
+    def add(self, player):
+        self.members.add(player)
+
+    def remove(self, player):
+        self.members.discard(player)
+
+    def __contains__(self, player):
+        return player in self.members
+
+    def __len__(self):
+        return len(self.members)
+
+    def __iter__(self):
+        return iter(self.members)
+
+
+class Fanout:
+    """
+    Broadcast engine, a message is encoded once and its bytes are queued for every member of a
+    channel, the queues are written in one batch at the end of the loop iteration
+    """
+    def __init__(self, send_bytes, send_msg):
+        self.send_bytes = send_bytes  # function queueing encoded data for a player, i.e. GameHall.send_bytes_to_player
+        self.send_msg = send_msg  # function sending a reply to a player, i.e. GameHall.send_msg_to_player
+        self.hall = Channel('hall')  # logged in players who are not in a room
+        self.everyone = Channel('everyone')  # all logged in players
+
+    def publish(self, channel, msg, except_player=None):
+        data = to_bytes(msg)
+        protocol = frame = frames = None  # the message framed for the binary protocols, built once for each
+        send_bytes = self.send_bytes
+        for player in channel.members:
+            if player is not except_player:
+                if player.protocol is None:
+                    send_bytes(player, data)
+                    continue
+                if player.protocol is not protocol:
+                    protocol = player.protocol
+                    if frames is None:
+                        frames = {}
+                    frame = frames.get(protocol)
+                    if frame is None:
+                        frame = frames[protocol] = protocol.push(data)
+                send_bytes(player, frame)
+        return data
+
+    def send(self, player, msg):
+        self.send_msg(player, msg)
@@ -0,0 +1,139 @@
+"""
+asyncio client of the game hall keeping many commands in flight on one connection (python 3)
+
+Every command is sent with a request id, "#id command" in the text protocol or FLAG_REQUEST_ID in
+the binary protocol. The server echoes the id on the replies of the command and marks its end, so
+the replies are matched to their command whatever the number of commands in flight, and the
+messages without an id (chats, game broadcasts, notices) are handed to on_push.
+
+    client = GameHallClient('127.0.0.1', 34567, protocol='binary', on_push=print)
+    await client.connect()
+    await client.request('$login alice secret')
+    times = await asyncio.gather(*[client.request('$online_time') for i in range(100)])
+"""
+import asyncio
+import re
+import BinaryProtocol
+
+TAGGED = re.compile(r'#(\d+) ')  # echo of a tagged command, a push may start with # too, e.g. chats of "#1"
+
+
+class GameHallClient:
+    def __init__(self, host='127.0.0.1', port=34567, protocol=None, on_push=None):
+        self.host = host
+        self.port = port
+        self.protocol = protocol  # 'binary' or 'zlib' for the binary protocol, None for text
+        self.on_push = on_push  # called with the text of every message that is not a reply
+        self.reader = None
+        self.writer = None
+        self.framer = None  # BinaryProtocol.BinaryFramer in binary mode
+        self.reader_task = None
+        self.next_id = 1
+        self.pending = {}  # mapping from request id to (future, reply texts received so far)
+
+    async def connect(self):
+        self.reader, self.writer = await asyncio.open_connection(self.host, self.port, limit=1 << 20)
+        if self.protocol is not None:
+            self.writer.write(('$protocol %s\n' % self.protocol).encode('ascii'))
+            ack = 'Protocol %s\n' % self.protocol
+            while True:  # the server answers in text, frames follow
+                line = (await self.reader.readline()).decode('utf-8', 'replace')
+                if line == ack:
+                    break
+                if not line or line.startswith('Wrong command') or line.startswith('Unknown protocol'):
+                    raise ConnectionError("The server does not accept the %s protocol" % self.protocol)
+                self.push(line)
+            self.framer = BinaryProtocol.BinaryFramer(1 << 24)
+        self.reader_task = asyncio.ensure_future(self.read_loop())
+
+    def request(self, command):
+        """
+        Send a command without waiting, the returned future gets the text of its replies
+        """
+        future = asyncio.get_event_loop().create_future()
+        request_id = self.next_id
+        self.next_id = (self.next_id + 1) & 0xffffffff or 1
+        if self.framer is None:
+            data = ('#%d %s\n' % (request_id, command)).encode('utf-8')
+        else:
+            data = BinaryProtocol.encode_command(command, request_id)
+            if data is None:
+                future.set_exception(ValueError("Unknown command: %s" % command))
+                return future
+        self.pending[request_id] = (future, [])
+        self.writer.write(data)
+        return future
+
+    async def drain(self):
+        """
+        Wait until the commands sent so far are in the socket, for callers that send a lot
+        """
+        await self.writer.drain()
+
+    async def read_loop(self):
+        try:
+            if self.framer is None:
+                while True:
+                    line = await self.reader.readline()
+                    if not line:
+                        break
+                    self.handle_line(line.decode('utf-8', 'replace'))
+            else:
+                while True:
+                    data = await self.reader.read(65536)
+                    if not data:
+                        break
+                    for frame in self.framer.feed(bytearray(data)):
+                        if frame is not None:
+                            self.handle_frame(*frame)
+        finally:
+            pending, self.pending = self.pending, {}
+            for future, replies in pending.values():
+                if not future.done():
+                    future.set_exception(ConnectionError("Connection closed"))
+
+    def handle_line(self, line):
+        tagged = TAGGED.match(line)
+        if tagged is not None:
+            text = line[tagged.end():]
+            if text == '$done\n':
+                self.done(int(tagged.group(1)))
+            else:
+                self.reply(int(tagged.group(1)), text)
+        elif line == '$ping\n':  # heartbeat of the server
+            self.writer.write(b'$pong\n')
+        else:
+            self.push(line)
+
+    def handle_frame(self, opcode, payload, request_id):
+        if opcode == BinaryProtocol.OP_PING:
+            self.writer.write(BinaryProtocol.encode_command('$pong'))
+        elif request_id is None:
+            self.push(BinaryProtocol.decode_text(opcode, payload))
+        elif opcode == BinaryProtocol.OP_DONE:
+            self.done(request_id)
+        else:
+            self.reply(request_id, BinaryProtocol.decode_text(opcode, payload))
+
+    def reply(self, request_id, text):
+        entry = self.pending.get(request_id)
+        if entry is not None:
+            entry[1].append(text)
+
+    def done(self, request_id):
+        entry = self.pending.pop(request_id, None)
+        if entry is not None and not entry[0].done():
+            entry[0].set_result(''.join(entry[1]))
+
+    def push(self, text):
+        if self.on_push is not None:
+            self.on_push(text)
+
+    async def close(self):
+        if self.writer is not None:
+            self.writer.close()
+        if self.reader_task is not None:
+            try:
+                await self.reader_task
+            except (ConnectionError, asyncio.CancelledError):
+                pass
@@ -1,70 +1,485 @@
 import socket
-import select
-import sqlite3
+import errno
+import os
+import base64
+import AuthWorkerPool
+import BinaryProtocol
+import ChatHistory
 import Player
+import PlayerDatabase
+import Poller
+import CommandDispatcher
+import ExpressionEvaluator
+import Fanout
+import HotRestart
+import Leaderboard
+import LineFramer
+import Metrics
+import RateLimiter
+import ResumeToken
+import ShardBus
 import Room
+import RoomDirectory
+import Scheduler
+import SolutionIndex
+import TimingWheel
+import TrafficCapture
 import argparse
+import itertools
+import signal
 import sys
+import time
+import timeit
+import zlib
+
+
+to_bytes = Fanout.to_bytes
+to_str = Fanout.to_str
+
+DEFAULT_SOLUTION_INDEX = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'solutions21.idx')
 
 
 class GameHall:
 
-    def __init__(self, host, port, max_connect_num, dbname, game_time_delta, game_time_duration):
+    def __init__(self, host, port, max_connect_num, dbname, game_time_delta, game_time_duration, poller_backend='auto',
+                 max_output_buffer=1048576, slow_consumer_policy='disconnect', max_line_len=4096,
+                 flush_interval=1.0, auth_threads=4, hash_iterations=100000, round_spread=1.0,
+                 solution_index=DEFAULT_SOLUTION_INDEX, metrics_address=None, admins=(), login_timeout=0,
+                 hall_timeout=0, room_timeout=0, heartbeat=0, handoff_path=None, rate_limits=None,
+                 rate_policy='defer', history_lines=50, history_memory=8388608, private_history=False,
+                 resume_grace=0, resume_secret=None, capture_path=None, clock=None):
         """ Initialize GameHall class"""
         self.max_connect_num = max_connect_num
         self.dbname = dbname
         self.buffer_len = 2048
+        self.recv_buffer = bytearray(self.buffer_len)  # shared by all players, data is framed right after recv
+        self.max_line_len = max_line_len
         self.game_time_delta = game_time_delta # means game start at every GAME_TIME_DELTA minutes, GAME_TIME_DELTA=30 means game start at 00:00, 00:30, 01:00, ... , 23:30
         self.game_time_duration = game_time_duration
-        self.conn = None
+        self.round_spread = round_spread  # rooms start their games within round_spread seconds of the start time
+        self.clock = clock  # None for the system clock, a TrafficCapture.VirtualClock when replaying
+        self.scheduler = Scheduler.Scheduler(clock.time if clock is not None else time.time)
+        self.evaluator = ExpressionEvaluator.ExpressionEvaluator()
+        self.solution_index = solution_index  # path of the precomputed 21 point game answers
+        self.solutions = None
+        self.database = PlayerDatabase.PlayerDatabase(dbname, flush_interval)
+        self.leaderboard = Leaderboard.Leaderboard()  # wins of the players, loaded from the database and kept in sync
+        self.auth_pool = AuthWorkerPool.AuthWorkerPool(self.database, auth_threads, hash_iterations)
+        self.waker = None  # wakes the poll up when an authentication is done
         self.server_sock = None
         self.host = host
         self.port = port
+        self.poller_backend = poller_backend
+        self.poller = None
+        self.max_output_buffer = max_output_buffer  # high-water mark of the outbound buffer of each player
+        self.slow_consumer_policy = slow_consumer_policy  # 'disconnect' or 'drop' players exceeding max_output_buffer
         self.all_socks = []
+        self.players_to_close = set()  # players that failed while writing, closed at the end of the loop iteration
+        self.dirty_players = []  # players with queued data, written in one batch at the end of the loop iteration
+        self.fanout = Fanout.Fanout(self.send_bytes_to_player, self.send_msg_to_player)
+        self.replying_to = None  # player whose command is running, the messages sent to it are replies
+        # rate_limits maps a command class to (rate, burst)
+        self.rate_limiter = RateLimiter.RateLimiter(rate_limits or {},
+                                                    clock.monotonic if clock is not None else Player.monotonic)
+        self.rate_policy = rate_policy  # 'defer' or 'reject' the commands over the rate limit
+        self.rate_deferred = False  # the command being dispatched is over its rate limit and deferred
+        self.dispatcher = CommandDispatcher.CommandDispatcher(
+            lambda player: self.send_msg_to_player(player, "You are not yet logged in\n"),
+            lambda player: self.send_msg_to_player(player, "Wrong command, type $help to get instructions\n"))
+        self.register_commands()
+        d = self.dispatcher
+        if rate_limits:
+            d.admit = self.admit_command
+        # mapping from binary protocol opcode to Command
+        self.frame_commands = dict((opcode, d.commands.get(name) or d.prefix_commands.get(name))
+                                   for name, opcode in BinaryProtocol.OPCODES.items())
         self.room_map = {} # mapping from room name to room object
         self.player_map = {} # mapping from player name to player object
         self.player_to_room = {} # mapping from player name to room name
+        self.bus = None  # ShardBus connecting the worker processes in multi-core mode
+        self.remote_players = {}  # mapping from player name to the shard where the player is logged in
+        self.remote_rooms = {}  # mapping from room name to number of players, for rooms on other shards
+        self.room_directory = RoomDirectory.RoomDirectory()  # listing of the local and remote rooms for $rooms
+        self.chat_history = ChatHistory.ChatHistory(history_lines, history_memory)  # recent chats, see ChatHistory
+        self.private_history = private_history  # also keep the private conversations
+        self.resume_grace = resume_grace  # seconds a disconnected session waits for $resume, 0 means never
+        self.resume_secret = resume_secret or os.urandom(32)  # signs the resume tokens, see ResumeToken
+        self.session_nonces = {}  # mapping from player name to the nonce of its current resume token
+        self.nonce_counter = itertools.count()
+        self.detached = {}  # mapping from player name to (player, expiry timer, disconnect time in ms)
+        self.remote_detached = set()  # players of the other shards waiting for $resume
+        self.admins = set(admins)  # players allowed to run $stats
+        # idle timeouts in seconds, 0 means never
+        self.login_timeout = login_timeout  # connections that are not logged in
+        self.hall_timeout = hall_timeout  # players in the game hall
+        self.room_timeout = room_timeout  # players in a room
+        self.heartbeat = heartbeat  # send $ping after this many idle seconds, disconnect if still silent after as long
+        longest = max(login_timeout, hall_timeout, room_timeout, 2 * heartbeat)
+        self.idle_wheel = TimingWheel.TimingWheel(min(longest + 2, 4096))  # one slot per second
+        self.idle_timer = None
+        self.metrics = Metrics.Metrics()
+        self.metrics_address = metrics_address  # unix socket path or host:port serving the Prometheus metrics
+        self.metrics_server = None
+        self.timer = timeit.default_timer
+        self.register_metrics()
+        self.handoff_path = handoff_path  # unix socket where a new server takes the connections over, see HotRestart
+        self.handoff_listener = None
+        self.handoff_conn = None  # connection of the new server while handing over
+        self.handoff_start = None
+        self.handed_over = False
+        self.capture = None  # TrafficCapture.CaptureWriter of the received traffic
+        if capture_path is not None:
+            self.capture = TrafficCapture.CaptureWriter(capture_path, self.scheduler.clock)
 
     def run(self):
         """
         Start the game hall server
         """
-        import datetime
+        start = time.time()
         self.check_and_create_user_login_table()
-        self.create_server_socket((self.host, self.port))
-        self.all_socks.append(self.server_sock)
-        is_game_start = False
-        game_start_time = None
+        self.load_solution_index()
+        self.poller = Poller.create_poller(self.poller_backend)
+        self.waker = Poller.Waker()
+        self.poller.register(self.waker)
+        self.auth_pool.start(self.waker.wake)
+        previous = HotRestart.connect(self.handoff_path) if self.handoff_path else None
+        if previous is not None:  # a server is running, continue its sessions
+            self.take_over(previous, start)
+        else:
+            self.create_server_socket((self.host, self.port))
+            self.all_socks.append(self.server_sock)
+            self.poller.register(self.server_sock)
+        if self.handoff_path:
+            self.handoff_listener = HotRestart.listen(self.handoff_path)
+            self.poller.register(self.handoff_listener)
+        if self.bus is not None:
+            self.bus.attach(self)
+        self.start_metrics_server()
+        if hasattr(signal, 'SIGUSR1'):  # kill -USR1 prints the time spent in each command
+            signal.signal(signal.SIGUSR1, lambda signum, frame: sys.stdout.write(self.dispatcher.format_stats()))
+        signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))  # run the cleanup in shutdown
+        try:
+            self.serve()
+        finally:
+            signal.signal(signal.SIGTERM, signal.SIG_IGN)  # do not interrupt the final flush
+            self.shutdown()
+
+    def serve(self):
         # start the server
         while True:
-            tim = datetime.datetime.now()
-            if not is_game_start and tim.minute % self.game_time_delta == 0 and tim.second == 0 \
-                    and (game_start_time is None or (tim - game_start_time).seconds >= self.game_time_delta * 60):  # game may be finished in less than 1 seconds
-                is_game_start = True
-                game_start_time = tim
-                for r in self.room_map.values():
-                    r.start_21game()
-            if is_game_start and (tim - game_start_time).seconds >= self.game_time_duration: # game end
-                is_game_start = False
-                for r in self.room_map.values():
-                    r.end_21game()
-            # Get message from players
-            read_socks, write_socks, error_socks = select.select(self.all_socks, [], self.all_socks, 0.5)
+            # Get message from players, sleep at most until the next game deadline
+            read_socks, write_socks, error_socks = self.poller.poll(self.scheduler.next_timeout())
+            start = self.timer()
             for player in read_socks:
                 if player is self.server_sock:  # a new connection request received
-                    new_sock, address = player.accept()
+                    try:
+                        new_sock, address = player.accept()
+                    except socket.error:  # connection already gone
+                        continue
                     self.handle_new_player(new_sock)
+                elif player is self.waker:  # password checks finished by the auth workers
+                    self.waker.drain()
+                    self.auth_pool.run_completions()
+                elif player is self.handoff_listener:  # a new server asks for the connections
+                    self.begin_handoff()
+                elif self.handoff_conn is not None:  # handing over, the data is left for the new server
+                    self.stop_reading(player)  # or the level-triggered poll returns at once until the handoff
+                    continue
+                elif self.bus is not None and self.bus.owns(player):  # message from another shard
+                    self.bus.handle_read(player)
                 else:  # receive message from a player
                     try:
-                        msg = player.sock.recv(self.buffer_len)
-                        if msg:
-                            self.handle_msg(player, msg)
+                        recv_len = player.sock.recv_into(self.recv_buffer)
+                        if recv_len:
+                            self.handle_received_data(player, recv_len)
                         else:  # close socket
                             self.handle_player_disconnect(player)
                     except socket.error:
                         pass
+            for player in write_socks:
+                if self.bus is not None and self.bus.owns(player):
+                    self.bus.handle_write(player)
+                elif not player.closed and self.flush_player_output(player):
+                    self.poller.modify(player, read=player.throttle is None and self.handoff_conn is None,
+                                       write=False)
             for player in error_socks:
-                self.handle_player_disconnect(player)
+                if player is not self.server_sock and not player.closed:  # not yet removed while reading
+                    self.handle_player_disconnect(player)
+            self.scheduler.run_due()
+            self.flush_dirty_players()
+            self.close_pending_players()
+            self.loop_time.observe(self.timer() - start)
+            if self.handoff_conn is not None and self.hand_over():
+                return
+
+    def shutdown(self):
+        """
+        Record the online time of the players still logged in and flush it to the database
+        """
+        self.auth_pool.stop()
+        if self.metrics_server is not None:
+            self.metrics_server.stop()
+        if self.handoff_listener is not None:
+            self.handoff_listener.close()
+            if not self.handed_over:  # otherwise the path belongs to the new server
+                os.unlink(self.handoff_path)
+        if not self.handed_over:  # otherwise the sessions go on in the new server
+            for player, timer, detached_at in self.detached.values():  # offline since the disconnect
+                player.login_time += Player.now_ms() - detached_at
+            for name, player in self.player_map.items():
+                self.update_history_online_time(name, player.get_online_time())
+        self.database.close()
+        if self.capture is not None:
+            self.capture.close_file()
+
+    def begin_handoff(self):
+        """
+        A new server connected to the handoff socket: stop accepting and reading, the connections
+        are handed over once no asynchronous command is running
+        """
+        try:
+            conn, address = self.handoff_listener.accept()
+        except socket.error:
+            return
+        if self.handoff_conn is not None:  # already handing over to another one
+            conn.close()
+            return
+        self.handoff_conn = conn
+        self.handoff_start = time.time()
+        self.poller.unregister(self.server_sock)
+
+    def hand_over(self):
+        """
+        Send the snapshot of the sessions and rooms and the sockets to the new server, return True
+        once it took them over. When it fails the server goes on as if nothing happened
+        """
+        players = [p for p in self.all_socks if p is not self.server_sock]
+        if any(player.paused for player in players):  # e.g. a login waiting for its password check
+            return False
+        self.database.flush_now()  # the new server loads the leaderboard with the last results
+        now = self.now_tick()
+        # only the connected sessions are handed over, the detached ones end here once the new server took over
+        detached = set(player for player, timer, detached_at in self.detached.values())
+        rooms = [room.snapshot(detached) for room in self.room_map.values()]
+        state = {'paused_at': self.handoff_start, 'players': [self.snapshot_player(p, now) for p in players],
+                 'rooms': [room for room in rooms if room['players']],
+                 'resume': {'secret': base64.b64encode(self.resume_secret).decode('ascii'),
+                            'nonces': dict((name, nonce) for name, nonce in self.session_nonces.items()
+                                           if name not in self.detached)}}
+        if self.metrics_server is not None:  # the new server serves the metrics on the same address
+            self.metrics_server.stop()
+            self.metrics_server = None
+        conn, self.handoff_conn = self.handoff_conn, None
+        fds = [self.server_sock.fileno()] + [player.fileno() for player in players]
+        taken_over = HotRestart.send_state(conn, state, fds)
+        conn.close()
+        if taken_over:
+            self.handed_over = True
+            # the detached sessions end without a broadcast, the sockets belong to the new server
+            for name, (player, timer, detached_at) in self.detached.items():
+                timer.cancel()
+                self.update_history_online_time(name, (detached_at - player.login_time) // 1000)
+            self.detached = {}
+            print("Handed %d connections and %d rooms over to the new server in %.1f ms" % (
+                len(players), len(self.room_map), (time.time() - self.handoff_start) * 1000))
+            return True
+        print("The new server did not take the connections over, still serving")
+        self.poller.register(self.server_sock)
+        for player in players:
+            if not player.closed and player.throttle is None:
+                self.start_reading(player)
+        self.start_metrics_server()
+        return False
+
+    def snapshot_player(self, player, now):
+        """
+        Session of a connection for the new server, the unread data stays in the socket. Most
+        connections are idle, only the fields that are set are written
+        """
+        state = {'idle': now - player.last_active, 'silent': now - player.last_seen}
+        if player.is_already_login():
+            state['name'] = player.get_username()
+            state['online_time'] = (Player.now_ms() - player.login_time) / 1000.0
+        if player.protocol is not None:
+            state['protocol'] = player.protocol.name
+        if player.pinged:
+            state['pinged'] = True
+        if player.framer.pending_size():
+            state['input'] = base64.b64encode(player.framer.pending_data()).decode('ascii')
+        if player.out_buffer is not None:
+            state['output'] = base64.b64encode(bytes(player.out_buffer)).decode('ascii')
+        return state
+
+    def take_over(self, sock, start):
+        """
+        Continue the sessions, rooms and games of the server that was running at handoff_path
+        """
+        state, fds = HotRestart.recv_state(sock)
+        sock.close()
+        self.leaderboard.load(self.database.load_leaderboard())  # with the results flushed by the previous server
+        if 'resume' in state:  # the resume tokens given by the previous server stay valid
+            self.resume_secret = base64.b64decode(state['resume']['secret'])
+            self.session_nonces = state['resume']['nonces']
+        self.server_sock = HotRestart.socket_from_fd(fds[0])
+        self.all_socks.append(self.server_sock)
+        self.poller.register(self.server_sock)
+        players = []
+        for p, fd in zip(state['players'], fds[1:]):
+            player = Player.Player(HotRestart.socket_from_fd(fd), self.max_line_len)
+            if 'protocol' in p:
+                player.protocol = BinaryProtocol.CODECS[p['protocol']]
+                player.framer = player.protocol.create_framer(self.max_line_len)
+            if 'name' in p:
+                player.restore_login(p['name'], p['online_time'])
+                self.player_map[p['name']] = player
+                self.fanout.everyone.add(player)
+                self.fanout.hall.add(player)
+            self.all_socks.append(player)
+            self.poller.register(player)
+            players.append((player, p))
+        for r in state['rooms']:
+            room = Room.Room(r['name'], self.fanout, self.evaluator, self.solutions, self.record_result)
+            room.restore(r, self.player_map)
+            for player in room.players:
+                self.fanout.hall.remove(player)
+                self.player_to_room[player.get_username()] = room.get_name()
+            self.room_map[room.get_name()] = room
+            if r['round_at'] is None:
+                self.schedule_round(room)
+            else:
+                room.round_timer = self.call_at(r['round_at'], self.end_round if room.is_game_start else self.start_round,
+                                                room)
+            self.announce_room(room.get_name())
+        now = self.now_tick()
+        for player, p in players:  # the idle timeout depends on the room
+            player.last_active = now - p['idle']
+            player.last_seen = now - p['silent']
+            player.pinged = p.get('pinged', False)
+            self.schedule_idle_check(player, now)
+        print("Server is listening at %s, took %d connections and %d rooms over, %.1f ms without serving, "
+              "started in %.1f ms" % (self.server_sock.getsockname(), len(players), len(self.room_map),
+                                      (time.time() - state['paused_at']) * 1000, (time.time() - start) * 1000))
+        for player, p in players:
+            if 'output' in p:  # already encoded for the connection
+                self.send_bytes_to_player(player, base64.b64decode(p['output']))
+            if 'input' in p:
+                self.dispatch_lines(player, player.framer.feed(bytearray(base64.b64decode(p['input']))))
+
+    def next_game_start_time(self, now):
+        """
+        Return the first time after now when the 21 point game starts, i.e. a whole minute
+        divisible by game_time_delta
+        """
+        import datetime
+        tim = now.replace(second=0, microsecond=0) + datetime.timedelta(minutes=1)
+        while tim.minute % self.game_time_delta != 0:
+            tim += datetime.timedelta(minutes=1)
+        return tim
+
+    def load_solution_index(self):
+        """
+        Load the best answer of every puzzle, rounds only use puzzles where 21 can be reached
+        """
+        self.solutions = SolutionIndex.load_or_build(self.solution_index)
+
+    def register_metrics(self):
+        """
+        Create the counters and histograms updated on the hot path and the values read when collected
+        """
+        m = self.metrics
+        self.loop_time = m.histogram('loop_iteration_seconds', "Time spent handling the events of one loop iteration")
+        self.bytes_received = m.counter('received_bytes_total', "Bytes received from the players")
+        self.bytes_sent = m.counter('sent_bytes_total', "Bytes sent to the players")
+        self.connections_accepted = m.counter('connections_accepted_total', "Connections accepted")
+        self.connections_closed = m.counter('connections_closed_total', "Connections closed")
+        self.idle_disconnects = m.counter('idle_disconnects_total', "Connections closed for inactivity")
+        self.sessions_resumed = m.counter('sessions_resumed_total', "Sessions moved onto a new connection by $resume")
+        self.rate_limited = m.counter('rate_limited_total', "Commands deferred or rejected by the rate limits")
+        self.slow_consumer_events = m.counter('slow_consumer_events_total',
+                                              "Players disconnected or messages dropped for a full output buffer")
+        self.round_start_time = m.histogram('round_start_seconds', "Time spent in start_21game of a room")
+        self.round_end_time = m.histogram('round_end_seconds', "Time spent in end_21game of a room")
+        m.gauge('connections', "Connected players", self.num_connections)
+        m.gauge('logged_in_players', "Players logged in on this server", lambda: len(self.player_map))
+        m.gauge('rooms', "Rooms hosted by this server", lambda: len(self.room_map))
+        m.gauge('detached_sessions', "Disconnected sessions waiting for $resume", lambda: len(self.detached))
+        m.gauge('chat_history_bytes', "Bytes of the recent chats kept for $history", lambda: self.chat_history.size)
+        m.gauge('leaderboard_players', "Players who won a 21 point game", lambda: len(self.leaderboard))
+        m.gauge('chat_history_channels', "Channels with recent chats", lambda: len(self.chat_history))
+        m.gauge('auth_queue_length', "Logins and registrations waiting for an auth worker",
+                lambda: self.auth_pool.jobs.qsize())
+        m.collector('command_calls_total', 'counter', "Commands handled",
+                    lambda: [({'command': name}, calls) for name, calls, total in self.dispatcher.get_stats()])
+        m.collector('command_seconds_total', 'counter', "Time spent in the command handlers",
+                    lambda: [({'command': name}, total) for name, calls, total in self.dispatcher.get_stats()])
+
+    def num_connections(self):
+        return len(self.all_socks) - (1 if self.server_sock is not None else 0)
+
+    def start_metrics_server(self):
+        """
+        Serve the metrics on metrics_address, each shard adds its id to the socket path or the port
+        """
+        if not self.metrics_address:
+            return
+        address = self.metrics_address
+        if self.bus is not None:
+            if '/' in address:
+                address = '%s.%d' % (address, self.bus.shard_id)
+            else:
+                host, port = address.rsplit(':', 1)
+                address = '%s:%d' % (host, int(port) + self.bus.shard_id)
+        self.metrics_server = Metrics.MetricsServer(self.metrics, address)
+        self.metrics_server.start()
+
+    def handle_stats_command(self, player, msg, args):
+        if player.get_username() not in self.admins:
+            self.send_msg_to_player(player, "Permission denied\n")
+            return
+        self.send_msg_to_player(player, self.metrics.format_text() + self.dispatcher.format_stats())
+
+    def call_at(self, when, callback, *args):
+        """
+        Run callback at the unix time when, return a handle with a cancel() method
+        """
+        return self.scheduler.call_at(when, callback, *args)
+
+    def schedule_round(self, room):
+        """
+        Schedule the next 21 point game of a room. Each room gets a fixed offset in [0, round_spread)
+        derived from its name, so the starts and ends of thousands of rooms are spread over many
+        loop iterations instead of one
+        """
+        import datetime
+        start_time = self.next_game_start_time(datetime.datetime.fromtimestamp(self.scheduler.clock()))
+        offset = (zlib.crc32(to_bytes(room.get_name())) & 0xffffffff) % 1000 / 1000.0 * self.round_spread
+        room.round_timer = self.call_at(time.mktime(start_time.timetuple()) + offset, self.start_round, room)
+
+    def start_round(self, room):
+        start = self.timer()
+        try:
+            room.start_21game()
+        finally:  # the room still gets its next deadline if the game failed
+            self.round_start_time.observe(self.timer() - start)
+            room.round_timer = self.call_at(self.scheduler.clock() + self.game_time_duration, self.end_round, room)
+
+    def end_round(self, room):
+        start = self.timer()
+        try:
+            room.end_21game()
+        finally:
+            self.round_end_time.observe(self.timer() - start)
+            self.schedule_round(room)
+
+    def record_result(self, room, winner, expression, value):
+        """
+        A round was won, the result is written by the database thread and the other shards rank the win too
+        """
+        value = float(value)
+        self.database.add_result(room.get_name(), winner, expression, value, self.scheduler.clock())
+        self.leaderboard.add_win(winner, value)
+        if self.bus is not None:
+            self.bus.broadcast({'type': 'win', 'name': winner, 'value': value})
 
     def handle_player_disconnect(self, player):
         """
@@ -72,111 +487,500 @@ class GameHall:
         """
         self.quit(player, player_disconnect=True)
 
+    def handle_received_data(self, player, recv_len):
+        """
+        Dispatch every complete command received, a command may span several segments
+        and a segment may carry several commands
+        """
+        self.bytes_received.value += recv_len
+        if self.capture is not None:
+            self.capture.data(player, self.recv_buffer[:recv_len])
+        lines = player.framer.feed(self.recv_buffer, recv_len)
+        self.mark_active(player, lines)
+        self.dispatch_lines(player, lines)
+
+    def mark_active(self, player, lines):
+        """
+        Data was received from the player, only timestamps are written, the idle wheel checks them lazily.
+        Any data answers a heartbeat but only commands other than $pong end the idle time
+        """
+        now = self.now_tick()
+        player.last_seen = now
+        player.pinged = False
+        for line in lines:
+            if not player.framer.is_heartbeat(line):
+                player.last_active = now
+                break
+
+    def now_tick(self):
+        return int(Player.monotonic())
+
+    def track_idle(self, player):
+        """
+        Start watching a new connection for inactivity
+        """
+        player.last_active = player.last_seen = self.now_tick()
+        self.schedule_idle_check(player, player.last_active)
+
+    def idle_timeout(self, player):
+        if not player.is_already_login():
+            return self.login_timeout
+        if player.get_username() in self.player_to_room:
+            return self.room_timeout
+        return self.hall_timeout
+
+    def schedule_idle_check(self, player, now):
+        """
+        Put the player in the idle wheel at its next deadline: the idle timeout of its state or
+        the next heartbeat step
+        """
+        delays = []
+        timeout = self.idle_timeout(player)
+        if timeout:
+            delays.append(timeout - (now - player.last_active))
+        if self.heartbeat:
+            delays.append((2 if player.pinged else 1) * self.heartbeat - (now - player.last_seen))
+        if not delays:
+            self.idle_wheel.remove(player)
+            return
+        self.idle_wheel.schedule(player, min(delays), now)
+        if self.idle_timer is None:
+            self.idle_timer = self.call_at(self.scheduler.clock() + 1, self.check_idle_players)
+
+    def idle_state_changed(self, player):
+        """
+        The player logged in or out, entered or left a room: its idle timeout changed, a player
+        whose new state has no timeout leaves the wheel and one whose state has a timeout enters it
+        """
+        if not player.closed:  # e.g. the logout of a detached session
+            self.schedule_idle_check(player, self.now_tick())
+
+    def check_idle_players(self):
+        """
+        Called every second while the wheel is not empty, only the players whose slot expired are looked at
+        """
+        self.idle_timer = None
+        now = self.now_tick()
+        for player in self.idle_wheel.advance(now):
+            if player.closed:
+                continue
+            idle = now - player.last_active
+            silent = now - player.last_seen
+            timeout = self.idle_timeout(player)
+            if timeout and idle >= timeout:
+                self.disconnect_idle(player, "Disconnected after %d seconds of inactivity\n" % idle)
+                continue
+            if player.pinged and silent >= 2 * self.heartbeat:
+                self.disconnect_idle(player, "Disconnected, no answer to $ping\n")
+                continue
+            if self.heartbeat and silent >= self.heartbeat and not player.pinged:
+                player.pinged = True
+                self.send_ping(player)
+            self.schedule_idle_check(player, now)
+        if len(self.idle_wheel) and self.idle_timer is None:
+            self.idle_timer = self.call_at(self.scheduler.clock() + 1, self.check_idle_players)
+
+    def send_ping(self, player):
+        if player.protocol is None:
+            self.send_msg_to_player(player, "$ping\n")
+        else:
+            self.send_bytes_to_player(player, player.protocol.frame(BinaryProtocol.OP_PING, b''))
+
+    def disconnect_idle(self, player, msg):
+        self.idle_disconnects.value += 1
+        self.send_msg_to_player(player, msg)
+        self.quit(player, player_disconnect=True)
+
+    def dispatch_lines(self, player, lines):
+        protocol = player.protocol
+        for i, msg in enumerate(lines):
+            if player.closed:  # e.g. $quit followed by other commands
+                break
+            if player.paused:  # an asynchronous command is running, keep the order of the commands
+                player.defer_lines(lines[i:])
+                break
+            self.replying_to = player
+            if msg is None:
+                self.send_msg_to_player(player, "Command too long, at most %d bytes per line\n" % self.max_line_len)
+            elif type(msg) is tuple:  # (opcode, payload, request id) of the binary protocol
+                player.request_id = msg[2]
+                self.handle_frame(player, msg)
+            else:
+                player.request_id, msg = LineFramer.split_request_id(msg)
+                self.handle_msg(player, to_str(msg))
+            self.replying_to = None
+            if self.rate_deferred:  # over the rate limit, the command runs again when the budget refills
+                self.rate_deferred = False
+                player.request_id = None
+                player.defer_lines(lines[i:])
+                break
+            if player.migrate_to is not None:  # the shard owning the room runs this command and the rest
+                self.migrate_player(player, lines[i:])
+                break
+            if player.request_id is not None and not player.paused:  # an asynchronous command ends on resume
+                self.end_request(player)
+            if player.protocol is not protocol:  # negotiated by $protocol, the following data is framed
+                self.switch_framer(player, lines[i + 1:])
+                break
+
+    def switch_framer(self, player, lines):
+        """
+        Parse the data received after $protocol with the framer of the new protocol
+        """
+        data = player.framer.join_lines(lines) + player.framer.pending_data()
+        player.framer = player.protocol.create_framer(self.max_line_len)
+        if data:
+            self.dispatch_lines(player, player.framer.feed(bytearray(data)))
+
+    def pause_player(self, player):
+        """
+        Hold the following commands of the player until resume_player is called
+        """
+        player.paused = True
+
+    def admit_command(self, player, command):
+        """
+        Take a token from the bucket of the command class. Over the limit the command is deferred or
+        rejected, and the connection is not read until the bucket refills
+        """
+        delay = self.rate_limiter.take(player, command.rate_class)
+        if not delay:
+            return True
+        self.rate_limited.value += 1
+        if self.rate_policy == 'reject':
+            self.send_msg_to_player(player, "Too many %s commands, wait %.1f seconds\n" % (command.rate_class, delay))
+        else:
+            self.pause_player(player)
+            self.rate_deferred = True
+        self.throttle(player, delay)
+        return False
+
+    def throttle(self, player, delay):
+        """
+        Stop reading from a player for delay seconds, the data it sends meanwhile waits in the socket
+        """
+        if player.throttle is not None:
+            return
+        self.stop_reading(player)
+        player.throttle = self.call_at(self.scheduler.clock() + delay, self.unthrottle, player)
+
+    def unthrottle(self, player):
+        player.throttle = None
+        if player.closed:
+            return
+        self.start_reading(player)
+        if self.rate_policy != 'reject':  # run the deferred commands
+            self.resume_player(player)
+
+    def stop_reading(self, player):
+        self.poller.modify(player, read=False, write=player.pending_output_size() > 0)
+
+    def start_reading(self, player):
+        self.poller.modify(player, read=True, write=player.pending_output_size() > 0)
+
+    def end_request(self, player):
+        """
+        Tell the client that the tagged command has finished, its replies have all been queued
+        """
+        if player.protocol is None:
+            self.send_bytes_to_player(player, b'#' + player.request_id + b' $done\n')
+        else:
+            self.send_bytes_to_player(player, BinaryProtocol.build_frame(BinaryProtocol.OP_DONE, b'', player.request_id))
+        player.request_id = None
+
+    def resume_player(self, player):
+        player.paused = False
+        if player.request_id is not None and not player.closed:
+            self.end_request(player)
+        lines = player.take_deferred_lines()
+        if lines and not player.closed:
+            self.dispatch_lines(player, lines)
+
+    def close_later(self, player):
+        """
+        Mark a player as broken, it is disconnected once the current loop iteration is done
+        """
+        self.players_to_close.add(player)
+
+    def close_pending_players(self):
+        while self.players_to_close:
+            player = self.players_to_close.pop()
+            if not player.closed:
+                self.handle_player_disconnect(player)
 
     def send_msg_to_player(self, player, msg):
+        """
+        Send a text message, a reply when the player runs a command and a push otherwise. The replies
+        to a tagged command echo its request id
+        """
+        if player is not self.replying_to:
+            if player.protocol is None:
+                self.send_bytes_to_player(player, to_bytes(msg))
+            else:
+                self.send_bytes_to_player(player, player.protocol.push(to_bytes(msg)))
+        elif player.protocol is None:
+            self.send_text_reply(player, to_bytes(msg))
+        else:
+            self.send_bytes_to_player(player, player.protocol.frame(BinaryProtocol.OP_REPLY, to_bytes(msg),
+                                                                    player.request_id))
+
+    def send_text_reply(self, player, data):
+        if player.request_id is not None:
+            data = LineFramer.tag_lines(player.request_id, data)
+        self.send_bytes_to_player(player, data)
+
+    def send_bytes_to_player(self, player, data):
+        """
+        Queue encoded data for the player, the queue is written at the end of the loop iteration
+        and then whenever the socket is writable
+        """
+        if player.closed or player in self.players_to_close:
+            return
+        pending = player.pending_output_size()
+        if pending + len(data) > self.max_output_buffer:  # slow consumer
+            self.slow_consumer_events.value += 1
+            if self.slow_consumer_policy != 'drop':
+                self.close_later(player)
+            return
+        player.queue_output(data)
+        if pending == 0:
+            self.dirty_players.append(player)
+
+    def flush_dirty_players(self):
+        """
+        Write the data queued during this loop iteration, one send per player
+        """
+        players, self.dirty_players = self.dirty_players, []
+        for player in players:
+            if not player.closed and not self.flush_player_output(player):
+                # only wait for writability while there is something to write
+                self.poller.modify(player, read=player.throttle is None and self.handoff_conn is None,
+                                   write=True)
+
+    def flush_player_output(self, player):
+        """
+        Write as much buffered data as the socket accepts, return True if the buffer is empty
+        """
+        if player.out_buffer is None:
+            return True
         try:
-            player.sock.sendall(msg)
-        except Exception: # ignore send error
-            pass
+            sent = player.sock.send(player.out_buffer)
+            player.output_sent(sent)
+            self.bytes_sent.value += sent
+        except socket.error as e:
+            if e.errno not in (errno.EAGAIN, errno.EWOULDBLOCK, errno.EINTR):
+                player.take_output()
+                self.close_later(player)
+                return True
+        return player.pending_output_size() == 0
+
+    def register_commands(self):
+        """
+        Fill the command table, arity is the number of arguments after the command name
+        """
+        d = self.dispatcher
+        d.register('$help', lambda player, msg, args: self.send_help_msg(player), login_required=False)
+        d.register('$register', lambda player, msg, args: self.register(player, args[0], args[1]), arity=2,
+                   login_required=False, rate_class='login')
+        d.register('$login', lambda player, msg, args: self.login(player, args[0], args[1]), arity=2,
+                   login_required=False, rate_class='login')
+        d.register('$resume', lambda player, msg, args: self.resume(player, args[0]), arity=1,
+                   login_required=False, rate_class='login')
+        d.register('$logout', lambda player, msg, args: self.logout(player))
+        d.register('$quit', lambda player, msg, args: self.quit(player), login_required=False)
+        d.register('$online_time', lambda player, msg, args: self.send_online_time(
+            player, BinaryProtocol.ONLINE_CURRENT, player.get_online_time()))
+        d.register('$history_online_time', self.handle_history_online_time_command)
+        d.register('$chat', lambda player, msg, args: self.handle_player_chat(player, msg), arity=None,
+                   rate_class='chat')
+        d.register('$chatall', lambda player, msg, args: self.chat_to_hall(player, msg), arity=None,
+                   rate_class='chatall')
+        d.register('$chat@', lambda player, msg, args: self.chat_to_other_player(player, msg), arity=None, prefix=True,
+                   rate_class='chat')
+        d.register('$build', lambda player, msg, args: self.build_room(player, args[0]), arity=1, rate_class='room')
+        d.register('$join', lambda player, msg, args: self.join_room(player, args[0]), arity=1, rate_class='room')
+        d.register('$rooms', self.handle_rooms_command, arity=(0, 6))
+        d.register('$stats', self.handle_stats_command)
+        d.register('$pong', lambda player, msg, args: None, login_required=False)  # answer to a heartbeat
+        d.register('$protocol', self.handle_protocol_command, arity=1, login_required=False)
+        d.register('$leave', self.handle_leave_command, rate_class='room')
+        d.register('$21game', self.handle_21game_command, arity=(1, None), rate_class='game')
+        d.register('$history', self.handle_history_command, arity=(0, 1))
+        d.register('$leaderboard', self.handle_leaderboard_command, arity=(0, 1))
+        d.register('$rank', self.handle_rank_command, arity=(0, 1))
 
     def handle_msg(self, player, msg):
         msg = msg.lstrip()
         msg_list = msg.split()
         if len(msg_list) <= 0:
             self.send_msg_to_player(player, "Empty command, type $help to get instructions\n")
-        elif msg_list[0] == '$help' and len(msg_list) == 1:
-            self.send_help_msg(player)
-        elif msg_list[0] == '$register' and len(msg_list) == 3:
-            self.register(player, msg_list[1], msg_list[2])
-        elif msg_list[0] == '$login' and len(msg_list) == 3:
-            self.login(player, msg_list[1], msg_list[2])
-        elif msg_list[0] == '$logout' and len(msg_list) == 1:
-            if player.is_already_login():
-                self.logout(player)
-            else:
-                self.send_msg_to_player(player, "You are not yet logged in\n")
-        elif msg_list[0] == '$quit' and len(msg_list) == 1:
-            self.quit(player)
-        elif msg_list[0] == '$online_time' and len(msg_list) == 1:
-            if player.is_already_login():
-                self.send_msg_to_player(player, "Online time: %d seconds\n" % player.get_online_time())
-            else:
-                self.send_msg_to_player(player, "You are not yet logged in\n")
-        elif msg_list[0] == '$history_online_time' and len(msg_list) == 1:
-            if player.is_already_login():
-                self.send_msg_to_player(player, "History online time: %d seconds\n" % self.get_history_online_time(player.get_username()))
-            else:
-                self.send_msg_to_player(player, "You are not yet logged in\n")
-        elif msg_list[0] == '$chat':
-            if player.is_already_login():
-                self.handle_player_chat(player, msg)
-            else:
-                self.send_msg_to_player(player, "You are not yet logged in\n")
-        elif msg_list[0] == '$chatall':
-            if player.is_already_login():
-                self.chat_to_hall(player, msg)
-            else:
-                self.send_msg_to_player(player, "You are not yet logged in\n")
-        elif msg_list[0].startswith('$chat@'):
-            if player.is_already_login():
-                self.chat_to_other_player(player, msg)
-            else:
-                self.send_msg_to_player(player, "You are not yet logged in\n")
-        elif msg_list[0] == '$build' and len(msg_list) == 2:
-            if player.is_already_login():
-                self.build_room(player, msg_list[1])
-            else:
-                self.send_msg_to_player(player, "You are not yet logged in\n")
-        elif msg_list[0] == '$join' and len(msg_list) == 2:
-            if player.is_already_login():
-                self.join_room(player, msg_list[1])
-            else:
-                self.send_msg_to_player(player, "You are not yet logged in\n")
-        elif msg_list[0] == '$rooms' and len(msg_list) == 1:
-            if player.is_already_login():
-                self.show_rooms(player)
-            else:
-                self.send_msg_to_player(player, "You are not yet logged in\n")
-        elif msg_list[0] == '$leave' and len(msg_list) == 1:
-            if player.is_already_login():
-                name = player.get_username()
-                if name in self.player_to_room:
-                    self.leave_room(player)
-                else:
-                    self.send_msg_to_player(player, "You are not in any room\n")
+        else:
+            self.dispatcher.dispatch(player, msg, msg_list)
+
+    def handle_frame(self, player, frame):
+        """
+        Run a command of the binary protocol, the opcode gives the command and the arguments are
+        separated by NUL bytes, so nothing is looked up by name or split on spaces
+        """
+        opcode, payload, request_id = frame
+        command = self.frame_commands.get(opcode)
+        args = to_str(payload).split('\0') if payload else []
+        name = command.name if command is not None else ''
+        if name.endswith('@'):  # $chat@, the first argument completes the name
+            if not args or not args[0]:
+                command = None
             else:
-                self.send_msg_to_player(player, "You are not yet logged in\n")
-        elif msg_list[0] == '$21game' and len(msg_list) > 1:
-            if player.is_already_login():
-                player_name = player.get_username()
-                if player_name in self.player_to_room:
-                    self.room_map[self.player_to_room[player_name]].handle_21game_player_answer(player, msg[len('$21game'):])
-                else:
-                    self.send_msg_to_player(player, "You are not in any room\n")
+                name += args.pop(0)
+        self.dispatcher.run(player, command, ' '.join([name] + args), args)
+
+    def handle_protocol_command(self, player, msg, args):
+        """
+        Switch the connection to the binary protocol, the client waits for the reply before sending frames
+        """
+        protocol = BinaryProtocol.CODECS.get(args[0])
+        if player.protocol is not None or player.is_already_login():
+            self.send_msg_to_player(player, "The protocol is chosen before logging in\n")
+        elif protocol is None:
+            self.send_msg_to_player(player, "Unknown protocol %s, use binary or zlib\n" % args[0])
+        else:
+            self.send_msg_to_player(player, "Protocol %s\n" % protocol.name)
+            player.protocol = protocol
+
+    def send_online_time(self, player, kind, seconds):
+        if player.protocol is not None:
+            self.send_bytes_to_player(player, player.protocol.frame(
+                BinaryProtocol.OP_ONLINE_TIME, BinaryProtocol.ONLINE_TIME.pack(kind, seconds), player.request_id))
+        elif kind == BinaryProtocol.ONLINE_HISTORY:
+            self.send_msg_to_player(player, "History online time: %d seconds\n" % seconds)
+        else:
+            self.send_msg_to_player(player, "Online time: %d seconds\n" % seconds)
+
+    def handle_history_online_time_command(self, player, msg, args):
+        """
+        The database is read by the auth workers, the following commands wait like during a login
+        """
+        self.pause_player(player)
+
+        def done(result):
+            if player.closed:
+                return
+            self.replying_to = player
+            if isinstance(result, str):  # database error
+                self.send_msg_to_player(player, result)
             else:
-                self.send_msg_to_player(player, "You are not yet logged in\n")
-        else: # command error
-            self.send_msg_to_player(player, "Wrong command, type $help to get instructions\n")
+                self.send_online_time(player, BinaryProtocol.ONLINE_HISTORY, result)
+            self.replying_to = None
+            self.resume_player(player)
+        self.auth_pool.online_time(player.get_username(), done)
+
+    def handle_leave_command(self, player, msg, args):
+        if player.get_username() in self.player_to_room:
+            self.leave_room(player)
+        else:
+            self.send_msg_to_player(player, "You are not in any room\n")
+
+    def handle_21game_command(self, player, msg, args):
+        player_name = player.get_username()
+        if player_name in self.player_to_room:
+            self.room_map[self.player_to_room[player_name]].handle_21game_player_answer(player, msg[len('$21game'):])
+        else:
+            self.send_msg_to_player(player, "You are not in any room\n")
+
+    def handle_leaderboard_command(self, player, msg, args):
+        """
+        $leaderboard [N] shows the N players with the most wins, 10 by default and at most 100
+        """
+        try:
+            n = min(int(args[0]), 100) if args else 10
+        except ValueError:
+            n = 0
+        if n <= 0:
+            self.send_msg_to_player(player, "Usage: $leaderboard [N], N between 1 and 100\n")
+            return
+        top = self.leaderboard.top(n)
+        if not top:
+            self.send_msg_to_player(player, "Nobody has won a 21 point game yet\n")
+            return
+        lines = ["Leaderboard, top %d of %d players:\n" % (len(top), len(self.leaderboard))]
+        for i, (name, wins, best) in enumerate(top):
+            lines.append("%d. %s: %d wins, best %g\n" % (i + 1, name, wins, best))
+        self.send_msg_to_player(player, ''.join(lines))
+
+    def handle_rank_command(self, player, msg, args):
+        name = args[0] if args else player.get_username()
+        rank = self.leaderboard.rank(name)
+        if rank is None:
+            self.send_msg_to_player(player, "%s has not won a 21 point game yet\n" % name)
+            return
+        position, wins, best = rank
+        self.send_msg_to_player(player, "%s: rank %d of %d, %d wins, best %g\n" % (
+            name, position, len(self.leaderboard), wins, best))
 
     def build_room(self, player, roomname):
         if player.get_username() in self.player_to_room:
             self.send_msg_to_player(player, "You are already in a room, please leave first\n")
-        elif roomname in self.room_map:
+        elif roomname in self.room_map or roomname in self.remote_rooms:
             self.send_msg_to_player(player, "Room %s already exist, try other room name\n" % roomname)
+        elif self.is_remote_room(roomname):
+            player.migrate_to = self.bus.shard_of_room(roomname)
         else:
-            r = Room.Room(roomname)
+            r = Room.Room(roomname, self.fanout, self.evaluator, self.solutions, self.record_result)
             r.add_player(player)
+            self.fanout.hall.remove(player)
             self.player_to_room[player.get_username()] = roomname
             self.room_map[roomname] = r
+            self.schedule_round(r)
             self.send_msg_to_player(player, "Build room %s success\n" % roomname)
+            self.announce_room(roomname)
+            self.idle_state_changed(player)
+
+    def handle_rooms_command(self, player, msg, args):
+        """
+        $rooms [page N] [prefix TEXT] [sort name|players]
+        """
+        options = {'page': '1', 'prefix': '', 'sort': 'name'}
+        if len(args) % 2 != 0 or any(key not in options for key in args[::2]):
+            self.send_msg_to_player(player, "Usage: $rooms [page N] [prefix TEXT] [sort name|players]\n")
+            return
+        options.update(zip(args[::2], args[1::2]))
+        if not options['page'].isdigit() or options['sort'] not in RoomDirectory.SORT_ORDERS:
+            self.send_msg_to_player(player, "Usage: $rooms [page N] [prefix TEXT] [sort name|players]\n")
+            return
+        self.show_rooms(player, int(options['page']), options['prefix'], options['sort'])
+
+    def show_rooms(self, player, page=1, prefix='', sort='name'):
+        data = self.room_directory.render(page, prefix, sort, player.protocol)
+        if data is None:
+            self.send_msg_to_player(player, "Page %d does not exist\n" % page)
+        elif player.protocol is None:
+            self.send_text_reply(player, data)
+        else:
+            self.send_bytes_to_player(player, BinaryProtocol.build_frame(data[0], data[1], player.request_id))
+
+    def is_remote_room(self, roomname):
+        """
+        In multi-core mode, check whether the room is pinned to another shard
+        """
+        return self.bus is not None and self.bus.shard_of_room(roomname) != self.bus.shard_id
 
-    def show_rooms(self, player):
-        self.send_msg_to_player(player, "Num of rooms: %d\n" % len(self.room_map))
-        for k, v in self.room_map.iteritems():
-            self.send_msg_to_player(player, k + "(" + str(v.num_of_players()) + " players)\n")
+    def announce_room(self, roomname):
+        """
+        Update the room directory and tell the other shards how many players are in a local room,
+        0 means the room is gone
+        """
+        r = self.room_map.get(roomname)
+        num_players = r.num_of_players() if r else 0
+        self.room_directory.update(roomname, num_players)
+        if self.bus is not None:
+            self.bus.broadcast({'type': 'room', 'name': roomname, 'players': num_players})
 
     def join_room(self, player, roomname):
-        if roomname not in self.room_map:
+        if self.is_remote_room(roomname):
+            if roomname in self.remote_rooms:
+                player.migrate_to = self.bus.shard_of_room(roomname)
+            else:
+                self.send_msg_to_player(player, "Room %s does not exist\n" % roomname)
+        elif roomname not in self.room_map:
             self.send_msg_to_player(player, "Room %s does not exist\n" % roomname)
         else:
             player_name = player.get_username()
@@ -187,15 +991,23 @@ class GameHall:
                     self.send_msg_to_player(player, "You are already in room %s\n" % roomname)
                 else:
                     self.leave_room(player)
+                    self.fanout.hall.remove(player)
                     r = self.room_map[roomname]
                     r.add_player(player)
                     self.player_to_room[player_name] = roomname
                     r.boardcast("Welcome to room %s, %s\n" % (roomname, player_name))
+                    self.announce_room(roomname)
+                    self.send_history(player, ('room', roomname), "room %s" % roomname)
+                    self.idle_state_changed(player)
             else: # player not in any room
+                self.fanout.hall.remove(player)
                 r = self.room_map[roomname]
                 r.add_player(player)
                 self.player_to_room[player_name] = roomname
                 r.boardcast("Welcome to room %s, %s\n" % (roomname, player_name))
+                self.announce_room(roomname)
+                self.send_history(player, ('room', roomname), "room %s" % roomname)
+                self.idle_state_changed(player)
 
     def leave_room(self, player):
         """
@@ -206,52 +1018,120 @@ class GameHall:
         del self.player_to_room[player_name]
         r = self.room_map[roomname]
         r.remove_player(player)
+        self.fanout.hall.add(player)
         if r.num_of_players() == 0:
+            r.round_timer.cancel()
             del self.room_map[roomname]
+            self.chat_history.drop(('room', roomname))  # a new room of the same name starts afresh
         else:
             r.boardcast("Player %s has already left the room\n" % player_name)
+        self.announce_room(roomname)
+        self.idle_state_changed(player)
 
     def handle_player_chat(self, player, msg):
         new_msg = player.get_username() + ': ' + msg[len('$chat'):].lstrip()
         if new_msg[-1] != '\n':
             new_msg += '\n'
         if player.get_username() in self.player_to_room: # player in a room, just chat in this room
-            r = self.room_map[self.player_to_room[player.get_username()]]
-            r.boardcast(new_msg, except_player=player)
+            roomname = self.player_to_room[player.get_username()]
+            data = self.room_map[roomname].boardcast(new_msg, except_player=player)
+            self.chat_history.record(('room', roomname), data)
         else: # player is in game hall, talk to other player who is in game hall
-            for name, other in self.player_map.iteritems():
-                if name not in self.player_to_room and other != player:
-                    self.send_msg_to_player(other, new_msg)
+            self.chat_to_local_hall(new_msg, except_player=player)
+            if self.bus is not None:
+                self.bus.broadcast({'type': 'hallchat', 'text': new_msg})
+
+    def chat_to_local_hall(self, msg, except_player=None):
+        data = self.fanout.publish(self.fanout.hall, msg, except_player)
+        self.chat_history.record(('hall',), data)
 
     def chat_to_hall(self, player, msg):
         new_msg = player.get_username() + ': ' + msg[len('$chatall'):].lstrip()
         if new_msg[-1] != '\n':
             new_msg += '\n'
         # send message to other players
-        for other in self.all_socks:
-            if other is not player and other is not self.server_sock:
-                self.send_msg_to_player(other, new_msg)
+        self.chat_to_local_players(new_msg, except_player=player)
+        if self.bus is not None:
+            self.bus.broadcast({'type': 'chatall', 'text': new_msg})
+
+    def chat_to_local_players(self, msg, except_player=None):
+        data = self.fanout.publish(self.fanout.everyone, msg, except_player)
+        self.chat_history.record(('hall',), data)  # kept with the game hall, where $chatall is mostly read
 
     def chat_to_other_player(self, player, msg):
         msg_list = msg.split()
         other_name = msg_list[0][len('$chat@'):]
-        if other_name not in self.player_map:
+        if other_name not in self.player_map and other_name not in self.remote_players:
             self.send_msg_to_player(player, "Player %s is not yet logged in\n" % other_name)
         else:
             new_msg = player.get_username() + ': ' + msg[len('$chat@' + other_name):].lstrip()
             if new_msg[-1] != '\n':
                 new_msg += '\n'
-            self.send_msg_to_player(self.player_map[other_name], new_msg)
+            self.deliver_private_msg(player.get_username(), other_name, new_msg)
+
+    def deliver_private_msg(self, sender, other_name, msg, forwarded=False):
+        """
+        Send a private message to a player of this shard, or forward it once to the shard of the player.
+        Each shard involved keeps the conversation in its history
+        """
+        if other_name in self.player_map:
+            self.send_msg_to_player(self.player_map[other_name], msg)
+        elif not forwarded and other_name in self.remote_players:
+            self.bus.send(self.remote_players[other_name], {'type': 'private', 'from': sender, 'to': other_name,
+                                                            'text': msg})
+        else:
+            return
+        if self.private_history:
+            self.chat_history.record(self.private_key(sender, other_name), to_bytes(msg))
+
+    def private_key(self, name, other_name):
+        return ('private',) + tuple(sorted((name, other_name)))
+
+    def handle_history_command(self, player, msg, args):
+        """
+        $history shows the recent chats of the room or the game hall, $history @username those with a player
+        """
+        name = player.get_username()
+        if args:
+            other_name = args[0].lstrip('@')
+            if not self.private_history:
+                self.send_msg_to_player(player, "The history of private chats is disabled\n")
+                return
+            key, title = self.private_key(name, other_name), "your chat with %s" % other_name
+        elif name in self.player_to_room:
+            roomname = self.player_to_room[name]
+            key, title = ('room', roomname), "room %s" % roomname
+        else:
+            key, title = ('hall',), "the game hall"
+        if not self.send_history(player, key, title):
+            self.send_msg_to_player(player, "No recent messages in %s\n" % title)
+
+    def send_history(self, player, key, title):
+        """
+        Send the recent messages of a channel in one piece, return False if there are none
+        """
+        data = self.chat_history.replay(key)
+        if not data:
+            return False
+        self.send_msg_to_player(player, to_bytes("Recent messages in %s:\n" % title) + data)
+        return True
 
     def handle_new_player(self, new_sock):
-        new_player = Player.Player(new_sock)
+        new_player = Player.Player(new_sock, self.max_line_len)
         self.all_socks.append(new_player)
+        self.connections_accepted.value += 1
+        self.poller.register(new_player)
+        self.track_idle(new_player)
+        if self.capture is not None:
+            self.capture.connect(new_player)
         self.send_msg_to_player(new_player, "Welcome to KGameHall\nType $help to get instructions\n")
+        return new_player
 
     def send_help_msg(self, player):
         self.send_msg_to_player(player, "Commands:\n" +
                             "\t$register username password\n" +
                             "\t$login username password\n" +
+                            "\t$resume token\n" +
                             "\t$chat message\n" +
                             "\t$chat@username message\n" +
                             "\t$chatall message\n" +
@@ -262,8 +1142,12 @@ class GameHall:
                             "\t$build roomname\n" +
                             "\t$join roomname\n" +
                             "\t$leave\n" +
-                            "\t$rooms\n" +
-                            "\t$21game math_expression\n")
+                            "\t$rooms [page N] [prefix TEXT] [sort name|players]\n" +
+                            "\t$21game math_expression\n" +
+                            "\t$history [@username]\n" +
+                            "\t$leaderboard [N]\n" +
+                            "\t$rank [username]\n" +
+                            "\t$protocol binary|zlib\n")
 
     def create_server_socket(self, address):
         """
@@ -271,10 +1155,12 @@ class GameHall:
         """
         self.server_sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         self.server_sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        if self.bus is not None:  # every shard listens on the same port, the kernel balances new connections
+            self.server_sock.setsockopt(socket.SOL_SOCKET, getattr(socket, 'SO_REUSEPORT', 15), 1)
         self.server_sock.bind(address)
         self.server_sock.listen(self.max_connect_num)
         self.server_sock.setblocking(0)
-        print "Server is listening at ", address
+        print("Server is listening at %s (%s backend)" % (address, self.poller.name))
 
     def register(self, player, username, password):
         """
@@ -283,34 +1169,77 @@ class GameHall:
         if player.is_already_login():
             self.send_msg_to_player(player, "You are already logged in, logout out first\n")
             return
-        if self.add_user_to_database(username, password):
-            self.login(player, username, password)
-        else:
-            self.send_msg_to_player(player, "Player %s already exist\n" % username)
+        if username.startswith('#'):  # a reply about user #12 would look tagged, see LineFramer.split_request_id
+            self.send_msg_to_player(player, "Username can not start with #\n")
+            return
+        self.pause_player(player)  # the password is hashed by the auth workers
+
+        def added(msg):
+            if player.closed:
+                return
+            self.replying_to = player
+            if msg:  # register fail
+                self.send_msg_to_player(player, msg)
+            elif self.can_login(player, username):
+                self.complete_login(player, username, True)
+            self.replying_to = None
+            self.resume_player(player)
+        self.auth_pool.register(username, password, added)
 
-    def login(self, player, username, password, is_already_register=False):
+    def login(self, player, username, password):
         """
-        Handle user login
+        Handle user login, the password is checked by the auth workers
         """
-        if player.is_already_login():
-            self.send_msg_to_player(player, "You are already logged in, logout out first\n")
-            return
-        # user already login in
-        if username in self.player_map:
-            self.send_msg_to_player(player, "%s is already logged in\n" % username)
+        if not self.can_login(player, username):
             return
-        if not is_already_register:
-            msg = self.user_authentication(username, password)
+        self.pause_player(player)
+
+        def authenticated(msg):
+            if player.closed:
+                return
+            self.replying_to = player
             if msg:  # login fail
                 self.send_msg_to_player(player, msg)
-                return
-        # valid player
+            elif self.can_login(player, username):  # the name may be taken while waiting
+                self.complete_login(player, username)
+            self.replying_to = None
+            self.resume_player(player)
+        self.auth_pool.login(username, password, authenticated)
+
+    def can_login(self, player, username):
+        """
+        Check that neither the player nor the user is already logged in
+        """
+        if player.is_already_login():
+            self.send_msg_to_player(player, "You are already logged in, logout out first\n")
+            return False
+        # user already login in, a session waiting for $resume gives way
+        if (username in self.player_map and username not in self.detached) or \
+                (username in self.remote_players and username not in self.remote_detached):
+            self.send_msg_to_player(player, "%s is already logged in\n" % username)
+            return False
+        return True
+
+    def complete_login(self, player, username, is_already_register=False):
+        """
+        The player is authenticated, enter the game hall
+        """
+        if username in self.detached:
+            self.expire_session(username)
         player.login(username)
         self.player_map[username] = player
+        self.fanout.everyone.add(player)
+        self.fanout.hall.add(player)
+        if self.bus is not None:
+            self.bus.broadcast({'type': 'login', 'name': username})
         if is_already_register:
             self.send_msg_to_player(player, "Register and login success, you are now in game hall\n")
         else:
             self.send_msg_to_player(player, "Login success\n")
+        if self.resume_grace:
+            self.send_resume_token(player)
+        self.send_history(player, ('hall',), "the game hall")
+        self.idle_state_changed(player)
 
     def logout(self, player, player_disconnect=False):
         """
@@ -322,80 +1251,241 @@ class GameHall:
         time_to_add = player.get_online_time()
         self.update_history_online_time(player.get_username(), time_to_add)
         del self.player_map[player.get_username()]
+        self.session_nonces.pop(name, None)
+        self.fanout.everyone.remove(player)
+        self.fanout.hall.remove(player)
+        if self.bus is not None:
+            self.bus.broadcast({'type': 'logout', 'name': name})
         player.logout()
         if not player_disconnect:
             self.send_msg_to_player(player, "Logout success, online time: %d seconds\n" % time_to_add)
+        self.idle_state_changed(player)
 
     def quit(self, player, player_disconnect=False):
         """
         Logout and destroy socket
         """
         if player.is_already_login():
-            self.logout(player, player_disconnect)
-        player.sock.close()
+            if player_disconnect and self.resume_grace:
+                self.detach_session(player)
+            else:
+                self.logout(player, player_disconnect)
+        self.close_player_socket(player)
         self.all_socks.remove(player)
+        self.idle_wheel.remove(player)
+        self.connections_closed.value += 1
+        if self.capture is not None:
+            self.capture.close(player)
 
-    def check_and_create_user_login_table(self):
+    def send_resume_token(self, player):
         """
-         Create the user login table if it does not exist
+        Give the session a new nonce and its token, the previous token of the session is void
         """
-        self.conn = sqlite3.connect(self.dbname)  # connect to the user information database
-        c = self.conn.cursor()
-        try:
-            # try to create the user_login table
-            c.execute("CREATE TABLE user_login ( username TEXT PRIMARY KEY, password TEXT, online_time INTEGER)")
-            self.conn.commit()
-        except sqlite3.OperationalError:
-            pass  # user_login table already exist
+        name = player.get_username()
+        nonce = '%x-%x' % (int(self.scheduler.clock() * 1000), next(self.nonce_counter))
+        self.session_nonces[name] = nonce
+        self.send_msg_to_player(player, "Resume token: %s\n" % ResumeToken.issue(self.resume_secret, name, nonce))
 
-    def add_user_to_database(self, username, password):
+    def detach_session(self, player):
         """
-        Add a new user into the database
+        The connection of a logged in player is gone, keep its session, room and game answer for
+        resume_grace seconds. Nothing is broadcast and the messages sent to it are dropped
         """
-        import hashlib
-        c = self.conn.cursor()
-        encrypt_password = hashlib.sha256(password).hexdigest()
-        try:
-            c.execute("INSERT INTO user_login VALUES (?, ?, ?)", (username, encrypt_password, 0))
-            self.conn.commit()
-            return True
-        except sqlite3.IntegrityError:
-            return False  # user already exist
+        name = player.get_username()
+        timer = self.call_at(self.scheduler.clock() + self.resume_grace, self.expire_session, name)
+        self.detached[name] = (player, timer, Player.now_ms())
+        if self.bus is not None:
+            self.bus.broadcast({'type': 'detach', 'name': name})
 
-    def user_authentication(self, username, password):
+    def expire_session(self, name):
         """
-        Check to see if the user is valid
+        Logout a detached session, its online time ends at the disconnect
         """
-        import hashlib
-        encrypt_password = hashlib.sha256(password).hexdigest()
-        c = self.conn.cursor()
-        c.execute("SELECT * FROM user_login WHERE username=?", (username, ))
-        res = c.fetchone()
-        if res is None:
-            return "Player %s doesn't exist\n" % username
-        if str(res[1]) != encrypt_password:
-            return "Invalid password\n"
-        return None
+        player, timer, detached_at = self.detached.pop(name)
+        timer.cancel()
+        player.login_time += Player.now_ms() - detached_at
+        self.logout(player, player_disconnect=True)
+
+    def resume(self, player, token):
+        """
+        $resume token moves the session of the token onto this connection: no password check, no
+        database query and nothing broadcast, the player is back in its room or the game hall
+        """
+        if player.is_already_login():
+            self.send_msg_to_player(player, "You are already logged in, logout out first\n")
+            return
+        session = ResumeToken.verify(self.resume_secret, token) if self.resume_grace else None
+        if session is None:
+            self.send_msg_to_player(player, "Invalid resume token\n")
+            return
+        name, nonce = session
+        if name not in self.player_map and name in self.remote_players:  # the shard of the session runs it
+            player.migrate_to = self.remote_players[name]
+            return
+        if self.session_nonces.get(name) != nonce:
+            self.send_msg_to_player(player, "The session of this token is over, login again\n")
+            return
+        if name not in self.detached:  # the old connection is not known to be gone yet
+            self.send_msg_to_player(self.player_map[name], "%s is resumed from another connection\n" % name)
+            self.quit(self.player_map[name], player_disconnect=True)
+        old, timer, detached_at = self.detached.pop(name)
+        timer.cancel()
+        player.login(name)
+        player.login_time = old.login_time + Player.now_ms() - detached_at  # offline while detached
+        player.buckets = old.buckets  # the rate limits go on
+        self.player_map[name] = player
+        for channel in (self.fanout.everyone, self.fanout.hall):
+            if old in channel:
+                channel.remove(old)
+                channel.add(player)
+        roomname = self.player_to_room.get(name)
+        if roomname is not None:
+            self.room_map[roomname].replace_player(old, player)
+        self.sessions_resumed.value += 1
+        if self.bus is not None:
+            self.bus.broadcast({'type': 'owner', 'name': name})
+        where = "room %s" % roomname if roomname is not None else "game hall"
+        self.send_msg_to_player(player, "Resume success, you are now in %s\n" % where)
+        self.send_resume_token(player)
+        if roomname is not None:
+            self.send_history(player, ('room', roomname), where)
+        else:
+            self.send_history(player, ('hall',), "the game hall")
+        self.idle_state_changed(player)
+
+    def close_player_socket(self, player):
+        if player.pending_output_size() > 0:  # last try to deliver the pending messages
+            self.flush_player_output(player)
+        self.poller.unregister(player)
+        player.closed = True
+        player.sock.close()
+
+    def handle_bus_message(self, shard_id, msg):
+        """
+        Handle a message sent by another shard in multi-core mode
+        """
+        kind = msg['type']
+        if kind == 'login':
+            self.remote_detached.discard(msg['name'])
+            self.handle_remote_login(shard_id, msg['name'])
+        elif kind == 'logout':
+            if self.remote_players.get(msg['name']) == shard_id:
+                del self.remote_players[msg['name']]
+                self.remote_detached.discard(msg['name'])
+        elif kind == 'owner':  # a player was handed over to shard_id, or resumed there
+            self.remote_players[msg['name']] = shard_id
+            self.remote_detached.discard(msg['name'])
+        elif kind == 'detach':  # the player of shard_id lost its connection and may resume
+            self.remote_detached.add(msg['name'])
+        elif kind == 'room':
+            if msg['players'] > 0:
+                self.remote_rooms[msg['name']] = msg['players']
+            else:
+                self.remote_rooms.pop(msg['name'], None)
+            self.room_directory.update(msg['name'], msg['players'])
+        elif kind == 'win':
+            self.leaderboard.add_win(msg['name'], msg['value'])
+        elif kind == 'hallchat':
+            self.chat_to_local_hall(msg['text'])
+        elif kind == 'chatall':
+            self.chat_to_local_players(msg['text'])
+        elif kind == 'private':
+            self.deliver_private_msg(msg['from'], msg['to'], msg['text'], forwarded=True)
+        elif kind == 'migrate':
+            self.accept_migrated_player(shard_id, msg)
+
+    def handle_remote_login(self, shard_id, username):
+        """
+        When a name is logged in on two shards at the same time, the lowest shard keeps it. A
+        session waiting for $resume gives way to the new login
+        """
+        if username in self.detached:
+            self.expire_session(username)
+        elif username in self.player_map:
+            if shard_id > self.bus.shard_id:
+                return
+            player = self.player_map[username]
+            self.send_msg_to_player(player, "%s is logged in from another connection\n" % username)
+            self.logout(player, player_disconnect=True)
+        if self.remote_players.get(username, shard_id) >= shard_id:
+            self.remote_players[username] = shard_id
+
+    def migrate_player(self, player, lines):
+        """
+        Hand a player over to the shard in player.migrate_to, with the commands not yet handled. The
+        player is logged in, or runs $resume for a session of that shard
+        """
+        shard_id = player.migrate_to
+        name = player.get_username()
+        if name in self.player_to_room:
+            self.leave_room(player)
+        pending_input = player.framer.join_lines(lines) + player.framer.pending_data()
+        self.bus.send_fd(shard_id, player.fileno())
+        self.bus.send(shard_id, {'type': 'migrate', 'name': name,
+                                 'online_time': player.get_online_time() if name is not None else 0,
+                                 'nonce': self.session_nonces.pop(name, None),
+                                 'input': base64.b64encode(pending_input).decode('ascii'),
+                                 'output': base64.b64encode(player.take_output()).decode('ascii'),
+                                 'protocol': player.protocol.name if player.protocol is not None else None})
+        # the socket lives on in the other shard, drop it here without logging out
+        if name is not None:
+            del self.player_map[name]
+            self.fanout.everyone.remove(player)
+            self.fanout.hall.remove(player)
+            self.remote_players[name] = shard_id
+        self.poller.unregister(player)
+        self.all_socks.remove(player)
+        self.idle_wheel.remove(player)
+        player.closed = True
+        player.sock.close()
+
+    def accept_migrated_player(self, shard_id, msg):
+        """
+        Take over a player handed over by migrate_player and run its pending commands
+        """
+        fd = self.bus.recv_fd(shard_id)
+        sock = socket.fromfd(fd, socket.AF_INET, socket.SOCK_STREAM)
+        os.close(fd)
+        player = Player.Player(sock, self.max_line_len)
+        name = msg['name']
+        if msg['protocol'] is not None:
+            player.protocol = BinaryProtocol.CODECS[msg['protocol']]
+            player.framer = player.protocol.create_framer(self.max_line_len)
+        if name is not None:  # None for a connection resuming a session of this shard
+            self.remote_players.pop(name, None)
+            player.restore_login(name, msg['online_time'])
+            self.player_map[name] = player
+            self.fanout.everyone.add(player)
+            self.fanout.hall.add(player)
+            if msg['nonce'] is not None:
+                self.session_nonces[name] = msg['nonce']
+            self.bus.broadcast({'type': 'owner', 'name': name})
+        self.all_socks.append(player)
+        self.poller.register(player)
+        self.track_idle(player)
+        output = base64.b64decode(msg['output'])
+        if output:  # already encoded for the connection
+            self.send_bytes_to_player(player, output)
+        self.dispatch_lines(player, player.framer.feed(bytearray(base64.b64decode(msg['input']))))
+
+    def check_and_create_user_login_table(self):
+        """
+         Create the user login table if it does not exist and load the leaderboard
+        """
+        self.database.open()
+        self.leaderboard.load(self.database.load_leaderboard())
 
     def update_history_online_time(self, username, time_to_add):
         """
-        Update user online time
+        Update user online time, the database is written by a background thread
         """
-        c = self.conn.cursor()
-        c.execute("SELECT * FROM user_login WHERE username=?", (username,))
-        res = c.fetchone()
-        new_online_time = res[2] + time_to_add
-        c.execute("UPDATE user_login SET online_time=? WHERE username=?", (new_online_time, username))
-        self.conn.commit()
+        self.database.add_online_time(username, time_to_add)
 
     def get_history_online_time(self, username):
         """
-        Get user online time
+        Get user online time, including the time not yet written
         """
-        c = self.conn.cursor()
-        c.execute("SELECT * FROM user_login WHERE username=?", (username,))
-        res = c.fetchone()
-        return res[2]
+        return self.database.get_user(username)[1]
 
 
 def main(sys_args):
@@ -405,6 +1495,32 @@ def main(sys_args):
     dbname = 'player_info.db'
     game_time_delta = 1
     game_time_duration = 30
+    poller_backend = 'auto'
+    max_output_buffer = 1048576
+    slow_consumer_policy = 'disconnect'
+    max_line_len = 4096
+    workers = 1
+    use_asyncio = False
+    flush_interval = 1.0
+    auth_threads = 4
+    hash_iterations = 100000
+    round_spread = 1.0
+    solution_index = DEFAULT_SOLUTION_INDEX
+    metrics_address = None
+    admins = ()
+    login_timeout = 0
+    hall_timeout = 0
+    room_timeout = 0
+    heartbeat = 0
+    handoff_path = None
+    rate_limits = 'none'
+    rate_policy = 'defer'
+    history_lines = 50
+    history_memory = 8388608
+    private_history = False
+    resume_grace = 0
+    resume_secret = os.urandom(32)  # the same for every worker, a token resumes its session on any of them
+    capture_path = None
     parser = argparse.ArgumentParser(description="A game hall server support talking and playing games")
     parser.add_argument("-o", "--host", help="Host name")
     parser.add_argument("-p", "--port", help="Server port")
@@ -412,6 +1528,32 @@ def main(sys_args):
     parser.add_argument("-u", "--connectnum", help="Number of client connection")
     parser.add_argument("-d", "--time_delta", help="21 point game time delta(in minutes)")
     parser.add_argument("-l", "--time_duration", help = "21 point game time duration(in seconds)")
+    parser.add_argument("-b", "--backend", choices=sorted(Poller.BACKENDS) + ['auto'], help="Socket readiness backend(default: auto)")
+    parser.add_argument("-w", "--max_output_buffer", help="Max bytes buffered for a player that does not read(default: 1048576)")
+    parser.add_argument("-s", "--slow_consumer", choices=['disconnect', 'drop'], help="What to do when a player exceeds max_output_buffer(default: disconnect)")
+    parser.add_argument("-m", "--max_line_len", help="Max length of a command line in bytes(default: 4096)")
+    parser.add_argument("-c", "--workers", help="Number of worker processes sharing the port(default: 1)")
+    parser.add_argument("-a", "--asyncio", action="store_true", help="Serve with the asyncio event loop(python 3)")
+    parser.add_argument("-f", "--flush_interval", help="Seconds between two writes of the online time(default: 1.0)")
+    parser.add_argument("-t", "--auth_threads", help="Threads hashing the passwords(default: 4)")
+    parser.add_argument("-i", "--hash_iterations", help="PBKDF2 iterations of new password hashes(default: 100000)")
+    parser.add_argument("-r", "--round_spread", help="Seconds over which the 21 point games of the rooms start(default: 1.0)")
+    parser.add_argument("-x", "--solution_index", help="21 point game answer index, built if missing(default: solutions21.idx)")
+    parser.add_argument("-M", "--metrics", help="Unix socket path or host:port serving Prometheus metrics over HTTP")
+    parser.add_argument("-A", "--admins", help="Comma separated players allowed to run $stats")
+    parser.add_argument("-L", "--login_timeout", help="Seconds a connection may stay idle before logging in, 0 means never(default: 0)")
+    parser.add_argument("-H", "--hall_timeout", help="Seconds a player may stay idle in the game hall, 0 means never(default: 0)")
+    parser.add_argument("-R", "--room_timeout", help="Seconds a player may stay idle in a room, 0 means never(default: 0)")
+    parser.add_argument("-P", "--heartbeat", help="Send $ping after this many idle seconds and disconnect if no answer comes, 0 means off(default: 0)")
+    parser.add_argument("-T", "--rate_limits", help="Token buckets of the command classes %s as class=RATE:BURST,... e.g. %s, or none(default: none)" % (
+        ','.join(RateLimiter.CLASSES), RateLimiter.DEFAULT_LIMITS))
+    parser.add_argument("-D", "--rate_policy", choices=['defer', 'reject'], help="What to do with the commands over the rate limit, the connection is not read until the budget refills(default: defer)")
+    parser.add_argument("-e", "--history_lines", help="Recent chats kept for each room, the game hall and each private chat, 0 means none(default: 50)")
+    parser.add_argument("-E", "--history_memory", help="Max bytes of all the recent chats, the least recently active channels are dropped first(default: 8388608)")
+    parser.add_argument("-V", "--private_history", action="store_true", help="Also keep the recent private chats for $history @username")
+    parser.add_argument("-g", "--resume_grace", help="Seconds a disconnected session is kept for $resume, 0 means logout at once(default: 0)")
+    parser.add_argument("-C", "--capture", help="Append the received traffic to this file, replayed with bench/bench_replay.py")
+    parser.add_argument("-U", "--handoff", help="Unix socket path for restarts, a server started with the same path takes the connections over")
     args = parser.parse_args(args=sys_args)
     if args.host:
         host = args.host
@@ -425,9 +1567,96 @@ def main(sys_args):
         game_time_delta = int(args.time_delta)
     if args.time_duration:
         game_time_duration = int(args.time_duration)
+    if args.backend:
+        poller_backend = args.backend
+    if args.max_output_buffer:
+        max_output_buffer = int(args.max_output_buffer)
+    if args.slow_consumer:
+        slow_consumer_policy = args.slow_consumer
+    if args.max_line_len:
+        max_line_len = int(args.max_line_len)
+    if args.workers:
+        workers = int(args.workers)
+    if args.flush_interval:
+        flush_interval = float(args.flush_interval)
+    if args.auth_threads:
+        auth_threads = int(args.auth_threads)
+    if args.hash_iterations:
+        hash_iterations = int(args.hash_iterations)
+    if args.round_spread:
+        round_spread = float(args.round_spread)
+    if args.solution_index:
+        solution_index = args.solution_index
+    if args.metrics:
+        metrics_address = args.metrics
+    if args.admins:
+        admins = args.admins.split(',')
+    if args.login_timeout:
+        login_timeout = int(args.login_timeout)
+    if args.hall_timeout:
+        hall_timeout = int(args.hall_timeout)
+    if args.room_timeout:
+        room_timeout = int(args.room_timeout)
+    if args.heartbeat:
+        heartbeat = int(args.heartbeat)
+    if args.rate_limits:
+        rate_limits = args.rate_limits
+    try:
+        rate_limits = RateLimiter.parse_limits(rate_limits)
+    except ValueError as e:
+        parser.error(str(e))
+    if args.rate_policy:
+        rate_policy = args.rate_policy
+    if args.history_lines:
+        history_lines = int(args.history_lines)
+    if args.history_memory:
+        history_memory = int(args.history_memory)
+    if args.private_history:
+        private_history = True
+    if args.resume_grace:
+        resume_grace = int(args.resume_grace)
+    if args.capture:
+        capture_path = args.capture
+        if workers > 1:
+            parser.error("--capture only supports a single worker")
+    if args.handoff:
+        handoff_path = args.handoff
+        if args.asyncio or workers > 1:
+            parser.error("--handoff only supports a single worker without --asyncio")
+    if args.asyncio:
+        use_asyncio = True
+        if workers > 1:
+            parser.error("--asyncio does not support multiple workers")
+
+    def create_game_hall():
+        return GameHall(host, port, max_connect_num, dbname, game_time_delta, game_time_duration, poller_backend,
+                        max_output_buffer, slow_consumer_policy, max_line_len, flush_interval, auth_threads,
+                        hash_iterations, round_spread, solution_index, metrics_address, admins, login_timeout,
+                        hall_timeout, room_timeout, heartbeat, handoff_path, rate_limits, rate_policy,
+                        history_lines, history_memory, private_history, resume_grace, resume_secret,
+                        capture_path)
     # start game hall server
-    gh = GameHall(host, port, max_connect_num, dbname, game_time_delta, game_time_duration)
-    gh.run()
+    if use_asyncio:
+        import AsyncGameHall
+        AsyncGameHall.AsyncGameHall(host, port, max_connect_num, dbname, game_time_delta, game_time_duration,
+                                    max_output_buffer=max_output_buffer, slow_consumer_policy=slow_consumer_policy,
+                                    max_line_len=max_line_len, flush_interval=flush_interval,
+                                    auth_threads=auth_threads, hash_iterations=hash_iterations,
+                                    round_spread=round_spread, solution_index=solution_index,
+                                    metrics_address=metrics_address, admins=admins, login_timeout=login_timeout,
+                                    hall_timeout=hall_timeout, room_timeout=room_timeout, heartbeat=heartbeat,
+                                    rate_limits=rate_limits, rate_policy=rate_policy, history_lines=history_lines,
+                                    history_memory=history_memory, private_history=private_history,
+                                    resume_grace=resume_grace, resume_secret=resume_secret,
+                                    capture_path=capture_path).run()
+    elif workers > 1:  # one game hall per process, rooms are sharded among them
+        def worker_main(bus):
+            gh = create_game_hall()
+            gh.bus = bus
+            gh.run()
+        ShardBus.start_shards(workers, worker_main)
+    else:
+        create_game_hall().run()
 
 if __name__ == '__main__':
     main(sys.argv[1:])
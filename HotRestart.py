@@ -0,0 +1,129 @@
+"""
+Hand the sockets and the state of a running game hall over to a new process, so the server can
+be restarted without dropping a connection
+
+The running server listens on a unix socket. A new server started with the same path connects to
+it, the old one stops accepting and reading, waits for the commands in progress, then sends a
+JSON snapshot of its sessions and rooms followed by the listening socket and every client socket
+with SCM_RIGHTS. It exits once the new server acknowledges, and keeps serving if no ack comes.
+Connections arriving meanwhile wait in the backlog of the listening socket.
+"""
+import array
+import errno
+import json
+import os
+import socket
+import struct
+import ShardBus
+
+SNAPSHOT_SIZE = struct.Struct('>I')
+MAX_FDS_PER_MSG = 250  # the kernel accepts at most 253 descriptors in one message
+ACK = b'K'
+
+
+def listen(path):
+    """
+    Unix socket where the next server asks for the handover, a stale path is replaced
+    """
+    try:
+        os.unlink(path)
+    except OSError as e:
+        if e.errno != errno.ENOENT:
+            raise
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.bind(path)
+    sock.listen(1)
+    sock.setblocking(0)
+    return sock
+
+
+def connect(path, timeout=30):
+    """
+    Connect to the server running at path, None if there is none
+    """
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.settimeout(timeout)
+    try:
+        sock.connect(path)
+    except socket.error as e:
+        sock.close()
+        if e.errno in (errno.ENOENT, errno.ECONNREFUSED):
+            return None
+        raise
+    return sock
+
+
+def send_state(sock, state, fds, timeout=10):
+    """
+    Send the snapshot and the descriptors, return True once the new server has taken them over
+    """
+    sock.setblocking(1)
+    sock.settimeout(timeout)
+    state['num_fds'] = len(fds)
+    data = json.dumps(state, separators=(',', ':')).encode('utf-8')
+    try:
+        sock.sendall(SNAPSHOT_SIZE.pack(len(data)) + data)
+        for i in range(0, len(fds), MAX_FDS_PER_MSG):
+            send_fds(sock, fds[i:i + MAX_FDS_PER_MSG])
+        return sock.recv(1) == ACK
+    except socket.error:
+        return False
+
+
+def recv_state(sock):
+    """
+    Receive what send_state sent, return the snapshot and the list of descriptors
+    """
+    size = SNAPSHOT_SIZE.unpack(recv_exactly(sock, SNAPSHOT_SIZE.size))[0]
+    state = ShardBus.native_strings(json.loads(recv_exactly(sock, size).decode('utf-8')))
+    fds = []
+    while len(fds) < state['num_fds']:
+        fds.extend(recv_fds(sock, min(state['num_fds'] - len(fds), MAX_FDS_PER_MSG)))
+    sock.sendall(ACK)
+    return state, fds
+
+
+def socket_from_fd(fd):
+    """
+    Socket object of a received TCP descriptor, the descriptor itself is closed
+    """
+    sock = socket.fromfd(fd, socket.AF_INET, socket.SOCK_STREAM)
+    os.close(fd)
+    return sock
+
+
+def recv_exactly(sock, size):
+    """
+    Read size bytes, never more, so the bytes carrying the descriptors are left in the socket
+    """
+    data = b''
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            raise socket.error(errno.ECONNRESET, "The previous server closed the connection")
+        data += chunk
+    return data
+
+
+def send_fds(sock, fds):
+    if hasattr(sock, 'sendmsg'):
+        sock.sendmsg([b'F'], [(socket.SOL_SOCKET, socket.SCM_RIGHTS, array.array('i', fds))])
+    else:  # python 2 has no sendmsg, one descriptor per message on a blocking socket
+        sock.settimeout(None)
+        for fd in fds:
+            ShardBus.send_fd(sock, fd)
+
+
+def recv_fds(sock, count):
+    if not hasattr(sock, 'recvmsg'):
+        sock.settimeout(None)
+        return [ShardBus.recv_fd(sock) for i in range(count)]
+    int_size = array.array('i').itemsize
+    msg, ancdata, flags, addr = sock.recvmsg(1, socket.CMSG_SPACE(count * int_size))
+    fds = array.array('i')
+    for level, kind, data in ancdata:
+        if level == socket.SOL_SOCKET and kind == socket.SCM_RIGHTS:
+            fds.frombytes(data[:len(data) - len(data) % int_size])
+    if len(fds) != count:
+        raise socket.error(errno.EPROTO, "Expected %d file descriptors, received %d" % (count, len(fds)))
+    return list(fds)
@@ -0,0 +1,50 @@
+import bisect
+
+
+class Leaderboard:
+    """
+    Wins and best score of every player who won a 21 point game, ranked in memory
+
+    The players are kept sorted by (-wins, -best score, name), so a win moves one entry with two
+    bisects, the top N is a slice and the rank of a player is a bisect. None of them depends on
+    the number of rounds played, only the load at startup reads one row per winner.
+    """
+    def __init__(self):
+        self.stats = {}  # mapping from player name to (wins, best score)
+        self.order = []  # (-wins, -best score, name) sorted, the leader first
+
+    def load(self, rows):
+        """
+        Replace the index with (name, wins, best score) rows
+        """
+        self.stats = dict((name, (wins, best)) for name, wins, best in rows)
+        self.order = sorted((-wins, -best, name) for name, (wins, best) in self.stats.items())
+
+    def add_win(self, name, value):
+        old = self.stats.get(name)
+        if old is None:
+            wins, best = 1, value
+        else:
+            del self.order[bisect.bisect_left(self.order, (-old[0], -old[1], name))]
+            wins, best = old[0] + 1, max(old[1], value)
+        self.stats[name] = (wins, best)
+        bisect.insort(self.order, (-wins, -best, name))
+
+    def top(self, n):
+        """
+        Return (name, wins, best score) of the n first players
+        """
+        return [(name, -wins, -best) for wins, best, name in self.order[:n]]
+
+    def rank(self, name):
+        """
+        Return (rank starting at 1, wins, best score) of a player, None if the player never won
+        """
+        stats = self.stats.get(name)
+        if stats is None:
+            return None
+        wins, best = stats
+        return bisect.bisect_left(self.order, (-wins, -best, name)) + 1, wins, best
+
+    def __len__(self):
+        return len(self.stats)
@@ -0,0 +1,101 @@
+class LineFramer(object):
+    """
+    Incremental splitter turning a stream of received bytes into complete command lines
+
+    The bytes of a recv are scanned in place, only the unfinished tail of a segment is
+    copied into the framer, so a segment carrying many pipelined commands costs one copy
+    per command.
+    """
+    __slots__ = ('max_line_len', 'partial', 'discarding')
+
+    def __init__(self, max_line_len=4096):
+        self.max_line_len = max_line_len
+        self.partial = None  # bytearray of the unfinished line carried over from previous segments
+        self.discarding = False  # skipping the rest of a line that is too long
+
+    def feed(self, data, length=None):
+        """
+        Feed the first length bytes of the bytearray data, return the completed lines without
+        the line terminator, a line exceeding max_line_len is reported once as None
+        """
+        if length is None:
+            length = len(data)
+        view = memoryview(data)
+        lines = []
+        start = 0
+        while start < length:
+            end = data.find(b'\n', start, length)
+            if end < 0:
+                break
+            if self.discarding:  # end of the long line
+                self.discarding = False
+            elif self.partial:
+                if len(self.partial) + end - start > self.max_line_len:
+                    lines.append(None)
+                else:
+                    self.partial += view[start:end]
+                    lines.append(self._to_line(self.partial))
+                self.partial = None
+            elif end - start > self.max_line_len:
+                lines.append(None)
+            else:
+                lines.append(self._to_line(view[start:end]))
+            start = end + 1
+        if start < length and not self.discarding:  # keep the unfinished tail
+            if self.pending_size() + length - start > self.max_line_len:
+                self.partial = None
+                self.discarding = True
+                lines.append(None)
+            elif self.partial is None:
+                self.partial = bytearray(view[start:length])
+            else:
+                self.partial += view[start:length]
+        return lines
+
+    def pending_size(self):
+        return len(self.partial) if self.partial is not None else 0
+
+    def pending_data(self):
+        return bytes(self.partial) if self.partial is not None else b''
+
+    @staticmethod
+    def join_lines(lines):
+        """
+        Encode lines returned by feed again, e.g. to hand them over to another process
+        """
+        return b''.join(line + b'\n' for line in lines if line is not None)
+
+    @staticmethod
+    def is_heartbeat(line):
+        return line is not None and line.strip() == b'$pong'
+
+    @staticmethod
+    def _to_line(chunk):
+        if isinstance(chunk, memoryview):
+            line = chunk.tobytes()
+        else:
+            line = bytes(chunk)
+        if line.endswith(b'\r'):
+            line = line[:-1]
+        return line
+
+
+def split_request_id(line):
+    """
+    Split a "#id command" line into (id, command), the id is a decimal number and None for an
+    untagged line, which is returned untouched
+    """
+    if line[:1] != b'#':
+        return None, line
+    request_id, sep, command = line.partition(b' ')
+    if not sep or not request_id[1:].isdigit():
+        return None, line
+    return request_id[1:], command.lstrip()
+
+
+def tag_lines(request_id, data):
+    """
+    Prefix every line of the encoded data with "#id ", the echo of a tagged command
+    """
+    prefix = b'#' + request_id + b' '
+    return prefix + data[:-1].replace(b'\n', b'\n' + prefix) + data[-1:]
@@ -0,0 +1,228 @@
+import bisect
+import errno
+import os
+import socket
+import threading
+
+# upper bounds in seconds, from 50us to 10s
+DEFAULT_BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1.0, 2.5, 5.0, 10.0)
+
+
+class Counter:
+    """
+    Monotonic counter, the hot path simply does counter.value += n
+    """
+    kind = 'counter'
+
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help_text = help_text
+        self.value = 0
+
+    def samples(self):
+        return [('', self.value)]
+
+
+class Gauge:
+    """
+    Value read from a function when the metrics are collected
+    """
+    kind = 'gauge'
+
+    def __init__(self, name, help_text, func):
+        self.name = name
+        self.help_text = help_text
+        self.func = func
+
+    def samples(self):
+        return [('', self.func())]
+
+
+class Histogram:
+    """
+    Cumulative histogram with fixed buckets, observe() costs one bisect
+    """
+    kind = 'histogram'
+
+    def __init__(self, name, help_text, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.bounds = list(buckets)
+        self.counts = [0] * (len(self.bounds) + 1)  # the last one is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def samples(self):
+        res = []
+        total = 0
+        for bound, n in zip(self.bounds + ['+Inf'], self.counts):
+            total += n
+            res.append(('_bucket{le="%s"}' % bound, total))
+        res.append(('_sum', self.sum))
+        res.append(('_count', self.count))
+        return res
+
+    def percentile(self, p):
+        """
+        Upper bound of the bucket holding the p quantile
+        """
+        rank = self.count * p
+        total = 0
+        for bound, n in zip(self.bounds, self.counts):
+            total += n
+            if total >= rank:
+                return bound
+        return float('inf')
+
+
+class Collector:
+    """
+    Labelled samples computed when the metrics are collected, func returns [(labels dict, value)]
+    """
+    def __init__(self, name, kind, help_text, func):
+        self.name = name
+        self.kind = kind
+        self.help_text = help_text
+        self.func = func
+
+    def samples(self):
+        res = []
+        for labels, value in self.func():
+            label_text = ','.join('%s="%s"' % (k, str(v).replace('\\', '\\\\').replace('"', '\\"'))
+                                  for k, v in sorted(labels.items()))
+            res.append(('{%s}' % label_text, value))
+        return res
+
+
+class Metrics:
+    """
+    Registry of the server metrics, formatted as Prometheus text
+    """
+    def __init__(self, prefix='kgamehall_'):
+        self.prefix = prefix
+        self.metrics = []
+
+    def add(self, metric):
+        metric.name = self.prefix + metric.name
+        self.metrics.append(metric)
+        return metric
+
+    def counter(self, name, help_text):
+        return self.add(Counter(name, help_text))
+
+    def gauge(self, name, help_text, func):
+        return self.add(Gauge(name, help_text, func))
+
+    def histogram(self, name, help_text, buckets=DEFAULT_BUCKETS):
+        return self.add(Histogram(name, help_text, buckets))
+
+    def collector(self, name, kind, help_text, func):
+        return self.add(Collector(name, kind, help_text, func))
+
+    def format_prometheus(self):
+        lines = []
+        for m in self.metrics:
+            lines.append("# HELP %s %s" % (m.name, m.help_text))
+            lines.append("# TYPE %s %s" % (m.name, m.kind))
+            for suffix, value in m.samples():
+                lines.append("%s%s %s" % (m.name, suffix, format_value(value)))
+        return "\n".join(lines) + "\n"
+
+    def format_text(self):
+        """
+        Short human readable summary, histograms are shown as count, mean and p99, the labelled
+        collectors are left to their own tables
+        """
+        lines = []
+        for m in self.metrics:
+            name = m.name[len(self.prefix):]
+            if isinstance(m, Collector):
+                continue
+            if isinstance(m, Histogram):
+                mean = m.sum / m.count if m.count else 0.0
+                p99 = m.percentile(0.99) if m.count else 0.0
+                lines.append("%s: count %d, mean %.3fms, p99 <= %.3fms" % (name, m.count, mean * 1e3, p99 * 1e3))
+            else:
+                for suffix, value in m.samples():
+                    lines.append("%s%s: %s" % (name, suffix, format_value(value)))
+        return "\n".join(lines) + "\n"
+
+
+def format_value(value):
+    if isinstance(value, float):
+        return repr(value)
+    return str(value)
+
+
+class MetricsServer:
+    """
+    Serve the Prometheus text over HTTP on a local unix socket path or a host:port address
+
+    A daemon thread answers the scrapes, it only reads the metrics so the event loop is never
+    blocked by a slow client.
+    """
+    def __init__(self, metrics, address):
+        self.metrics = metrics
+        self.address = address
+        self.sock = None
+        self.thread = None
+
+    def start(self):
+        if '/' in self.address:  # unix socket path
+            try:
+                os.unlink(self.address)
+            except OSError as e:
+                if e.errno != errno.ENOENT:
+                    raise
+            self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self.sock.bind(self.address)
+        else:
+            host, port = self.address.rsplit(':', 1)
+            self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            self.sock.bind((host or '127.0.0.1', int(port)))
+        self.sock.listen(16)
+        self.thread = threading.Thread(target=self.serve, name="metrics-server")
+        self.thread.daemon = True
+        self.thread.start()
+
+    def serve(self):
+        while True:
+            try:
+                conn, address = self.sock.accept()
+            except socket.error:  # closed by stop
+                break
+            try:
+                conn.settimeout(2.0)
+                request = b''
+                while b'\r\n\r\n' not in request and b'\n\n' not in request and len(request) < 8192:
+                    chunk = conn.recv(4096)
+                    if not chunk:
+                        break
+                    request += chunk
+                body = self.metrics.format_prometheus().encode('utf-8')
+                conn.sendall(b"HTTP/1.0 200 OK\r\nContent-Type: text/plain; version=0.0.4\r\n"
+                             b"Content-Length: " + str(len(body)).encode('ascii') + b"\r\n\r\n" + body)
+            except socket.error:
+                pass
+            finally:
+                conn.close()
+
+    def stop(self):
+        if self.sock is not None:
+            try:
+                self.sock.shutdown(socket.SHUT_RDWR)
+            except socket.error:
+                pass
+            self.sock.close()
+            if '/' in self.address:
+                try:
+                    os.unlink(self.address)
+                except OSError:
+                    pass
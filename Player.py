@@ -1,26 +1,72 @@
-import datetime
+import time
+import LineFramer
 
+monotonic = getattr(time, 'monotonic', time.time)  # python 2 has no monotonic clock
 
-class Player:
-    def __init__(self, sock):
+
+def now_ms():
+    return int(monotonic() * 1000)
+
+
+def set_clock(func):
+    """
+    Replace the monotonic clock of the sessions, e.g. by the virtual clock of a replay, return the
+    clock replaced so the caller can put it back
+    """
+    global monotonic
+    previous, monotonic = monotonic, func
+    return previous
+
+
+class Player(object):  # a new style class, __slots__ is ignored by python 2 classic classes
+    """
+    One connection, kept small since most of them are idle: no instance dict, integer
+    timestamps and the buffers only exist while they hold data
+    """
+    __slots__ = ('sock', 'framer', 'username', 'login_time', 'out_buffer', 'closed', 'migrate_to', 'paused',
+                 'deferred_lines', 'last_active', 'last_seen', 'pinged',
+                 'wheel_slot', 'protocol', 'request_id', 'buckets', 'throttle')
+
+    def __init__(self, sock, max_line_len=4096):
         sock.setblocking(0)
         self.sock = sock
+        self.framer = LineFramer.LineFramer(max_line_len)  # splits received data into commands
         self.username = None
-        self.login_time = None
+        self.login_time = None  # milliseconds of the monotonic clock
+        self.out_buffer = None  # bytearray of the data waiting for the socket to become writable
+        self.closed = False
+        self.migrate_to = None  # shard the player is handed over to, see GameHall.migrate_player
+        self.paused = False  # commands are not dispatched while an asynchronous command runs
+        self.deferred_lines = None  # commands received while paused
+        self.last_active = 0  # monotonic second of the last command other than $pong
+        self.last_seen = 0  # monotonic second of the last data received
+        self.pinged = False  # a heartbeat was sent and nothing has been received since
+        self.wheel_slot = None  # slot in the idle timing wheel of the game hall
+        self.protocol = None  # BinaryProtocol.Codec of the connection, None for the text protocol
+        self.request_id = None  # id of the tagged command running, echoed by its replies
+        self.buckets = None  # token buckets of the rate limited command classes, see RateLimiter
+        self.throttle = None  # timer ending the pause of a connection over its rate limit
 
     def fileno(self):
         return self.sock.fileno()
 
     def login(self, username):
         self.username = username
-        self.login_time = datetime.datetime.now()
+        self.login_time = now_ms()
+
+    def restore_login(self, username, online_time):
+        """
+        Continue a session started in another process online_time seconds ago
+        """
+        self.login(username)
+        self.login_time -= int(online_time * 1000)
 
     def logout(self):
         self.username = None
         self.login_time = None
 
     def get_online_time(self):
-        return (datetime.datetime.now() - self.login_time).seconds
+        return (now_ms() - self.login_time) // 1000
 
     def set_username(self, username):
         self.username = username
@@ -30,3 +76,38 @@ class Player:
 
     def is_already_login(self):
         return self.login_time is not None
+
+    def pending_output_size(self):
+        return len(self.out_buffer) if self.out_buffer is not None else 0
+
+    def queue_output(self, data):
+        if self.out_buffer is None:
+            self.out_buffer = bytearray(data)
+        else:
+            self.out_buffer += data
+
+    def output_sent(self, size):
+        """
+        Remove the first size bytes of the output, the buffer is released once empty
+        """
+        del self.out_buffer[:size]
+        if not self.out_buffer:
+            self.out_buffer = None
+
+    def take_output(self):
+        """
+        Return and clear all the queued output
+        """
+        data = bytes(self.out_buffer) if self.out_buffer is not None else b''
+        self.out_buffer = None
+        return data
+
+    def defer_lines(self, lines):
+        if self.deferred_lines is None:
+            self.deferred_lines = list(lines)
+        else:
+            self.deferred_lines.extend(lines)
+
+    def take_deferred_lines(self):
+        lines, self.deferred_lines = self.deferred_lines, None
+        return lines or []
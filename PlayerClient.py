@@ -1,20 +1,28 @@
 import socket
 import select
 import sys
+import BinaryProtocol
 
 MAX_MESSAGE_LENGTH = 2048
+PING = b'$ping\n'
 
 
 class PlayerClient:
-    def __init__(self, host, port):
+    def __init__(self, host, port, protocol=None):
         self.host = host
         self.port = port
+        self.protocol = protocol  # 'binary' or 'zlib' to negotiate the binary protocol, None for text
         self.server_sock = None
+        self.framer = None  # BinaryProtocol.BinaryFramer once the binary protocol is on
+        self.text = b''  # text received before the binary protocol is on
+        self.waiting_lines = []  # commands typed before the server accepted the binary protocol
 
     def run(self):
         self.server_sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         self.server_sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
         self.server_sock.connect((self.host, self.port))
+        if self.protocol is not None:
+            self.server_sock.sendall(('$protocol %s\n' % self.protocol).encode('ascii'))
         all_socks = [sys.stdin, self.server_sock]
         while True:
             read_socks, write_socks, error_socks = select.select(all_socks, [], [])
@@ -23,19 +31,78 @@ class PlayerClient:
                     msg = sock.recv(MAX_MESSAGE_LENGTH)
                     if not msg:
                         sys.exit(1)
-                    else:
-                        sys.stdout.write(msg)
+                    if self.protocol is not None:
+                        self.show(self.handle_binary(msg))
+                        continue
+                    if PING in msg:  # heartbeat of the server, answered without showing it
+                        msg = msg.replace(PING, b'')
+                        self.server_sock.sendall(b'$pong\n')
+                    self.show(msg)
                 else:
                     msg = sys.stdin.readline()
-                    self.server_sock.sendall(msg)
+                    if self.framer is not None:
+                        self.send_binary(msg)
+                    elif self.protocol is not None:  # frames are only sent once the server switched
+                        self.waiting_lines.append(msg)
+                    else:
+                        self.server_sock.sendall(msg.encode('utf-8') if str is not bytes else msg)
+
+    def send_binary(self, msg):
+        frame = BinaryProtocol.encode_command(msg)
+        if frame is None:
+            self.show(b"Wrong command, type $help to get instructions\n")
+        else:
+            self.server_sock.sendall(frame)
+
+    def handle_binary(self, msg):
+        """
+        Return the text to show of the data received in binary mode, the server replies to
+        $protocol in text and frames everything after it
+        """
+        if self.framer is None:
+            self.text += msg
+            ack = ('Protocol %s\n' % self.protocol).encode('ascii')
+            pos = self.text.find(ack)
+            if pos < 0:
+                if b'Wrong command' in self.text:  # the server only speaks text
+                    self.protocol = None
+                    msg, self.text = self.text, b''
+                    for line in self.waiting_lines:
+                        self.server_sock.sendall(line.encode('utf-8') if str is not bytes else line)
+                    self.waiting_lines = []
+                    return msg
+                return b''
+            end = pos + len(ack)
+            msg, rest = self.text[:end], self.text[end:]
+            self.text = b''
+            self.framer = BinaryProtocol.BinaryFramer(1 << 20)
+            for line in self.waiting_lines:
+                self.send_binary(line)
+            self.waiting_lines = []
+            return msg + self.handle_binary(rest)
+        res = []
+        for frame in self.framer.feed(bytearray(msg)):
+            if frame is None:
+                continue
+            opcode, payload, request_id = frame
+            if opcode == BinaryProtocol.OP_PING:  # heartbeat of the server, answered without showing it
+                self.server_sock.sendall(BinaryProtocol.encode_command('$pong'))
+            else:
+                res.append(BinaryProtocol.decode_text(opcode, payload).encode('utf-8'))
+        return b''.join(res)
+
+    def show(self, msg):
+        if msg:
+            sys.stdout.write(msg.decode('utf-8', 'replace') if str is not bytes else msg)
+            sys.stdout.flush()
 
 
 def main():
     port = 34567
-    if len(sys.argv) < 2:
-        print "Usage: python PlayerClient.py [hostname]"
+    if len(sys.argv) < 2 or (len(sys.argv) > 2 and sys.argv[2] not in BinaryProtocol.CODECS):
+        print("Usage: python PlayerClient.py [hostname] [binary|zlib]")
         sys.exit(1)
-    pc = PlayerClient(sys.argv[1], port)
+    pc = PlayerClient(sys.argv[1], port, sys.argv[2] if len(sys.argv) > 2 else None)
     pc.run()
 
 if __name__ == '__main__':
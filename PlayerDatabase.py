@@ -0,0 +1,180 @@
+import sqlite3
+import threading
+
+SELECT_USER = "SELECT password, online_time FROM user_login WHERE username=?"
+INSERT_USER = "INSERT INTO user_login VALUES (?, ?, ?)"
+UPDATE_PASSWORD = "UPDATE user_login SET password=? WHERE username=?"
+ADD_ONLINE_TIME = "UPDATE user_login SET online_time=online_time+? WHERE username=?"
+INSERT_RESULT = "INSERT INTO game_results (room, winner, expression, value, finished_at) VALUES (?, ?, ?, ?, ?)"
+INSERT_WINNER = "INSERT OR IGNORE INTO leaderboard VALUES (?, 0, 0)"
+ADD_WINS = "UPDATE leaderboard SET wins=wins+?, best=MAX(best, ?) WHERE username=?"
+SELECT_LEADERBOARD = "SELECT username, wins, best FROM leaderboard"
+CREATE_TABLES = [
+    "CREATE TABLE user_login ( username TEXT PRIMARY KEY, password TEXT, online_time INTEGER)",
+    "CREATE TABLE game_results (id INTEGER PRIMARY KEY, room TEXT, winner TEXT, expression TEXT, value REAL, "
+    "finished_at REAL)",
+    # wins and best score of each player, summed from game_results in the same transaction so
+    # the leaderboard is loaded without scanning the results
+    "CREATE TABLE leaderboard (username TEXT PRIMARY KEY, wins INTEGER, best REAL)",
+]
+
+
+class PlayerDatabase:
+    """
+    Player accounts and 21 point game results stored in SQLite with write-behind
+
+    Online time deltas are summed in memory and written by a background thread in one
+    transaction per flush interval, so a burst of logouts costs one commit instead of one
+    fsync each. Reads add the deltas that are not yet committed. The results of the rounds
+    are appended in the same transaction.
+    """
+    def __init__(self, dbname, flush_interval=1.0):
+        self.dbname = dbname
+        self.flush_interval = flush_interval
+        self.local = threading.local()  # connection of each thread reading or creating accounts
+        self.connections = []
+        self.lock = threading.Lock()
+        self.pending = {}  # mapping from username to online time not yet written
+        self.flushing = {}  # deltas being written by the writer thread
+        self.results = []  # (room, winner, expression, value, finished_at) not yet written
+        self.flush_lock = threading.Lock()  # one flush at a time, the writer thread or flush_now
+        self.commit_count = 0
+        self.stop_event = threading.Event()
+        self.writer = None
+
+    def connect(self):
+        # statements are kept prepared in the per-connection statement cache
+        conn = sqlite3.connect(self.dbname, timeout=30, cached_statements=16, check_same_thread=False)
+        if self.dbname != ':memory:':
+            conn.execute("PRAGMA journal_mode=WAL")  # readers do not wait for the writer thread
+            conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def thread_conn(self):
+        conn = getattr(self.local, 'conn', None)
+        if conn is None:
+            conn = self.local.conn = self.connect()
+            with self.lock:
+                self.connections.append(conn)
+        return conn
+
+    def open(self):
+        """
+        Create the tables if they do not exist and start the writer thread
+        """
+        conn = self.thread_conn()
+        for create in CREATE_TABLES:
+            try:
+                conn.execute(create)
+                conn.commit()
+            except sqlite3.OperationalError:
+                pass  # table already exist
+        self.writer = threading.Thread(target=self.write_loop, name="online-time-writer")
+        self.writer.daemon = True
+        self.writer.start()
+
+    def close(self):
+        """
+        Stop the writer thread, the buffered deltas are written before it returns
+        """
+        if self.writer is not None:
+            self.stop_event.set()
+            self.writer.join()
+            self.writer = None
+        with self.lock:
+            connections, self.connections = self.connections, []
+        for conn in connections:
+            conn.close()
+        self.local = threading.local()
+
+    def add_user(self, username, encrypt_password):
+        """
+        Insert a new account, return False if the user already exists
+        """
+        conn = self.thread_conn()
+        try:
+            with conn:
+                conn.execute(INSERT_USER, (username, encrypt_password, 0))
+            return True
+        except sqlite3.IntegrityError:
+            return False  # user already exist
+
+    def set_password(self, username, encrypt_password):
+        conn = self.thread_conn()
+        with conn:
+            conn.execute(UPDATE_PASSWORD, (encrypt_password, username))
+
+    def get_user(self, username):
+        """
+        Return (encrypted password, online time) of a user, or None if the user does not exist
+        """
+        while True:
+            with self.lock:
+                extra = self.pending.get(username, 0) + self.flushing.get(username, 0)
+                commit_count = self.commit_count
+            res = self.thread_conn().execute(SELECT_USER, (username,)).fetchone()
+            with self.lock:
+                if commit_count == self.commit_count:  # no flush committed meanwhile, extra is not counted twice
+                    break
+        if res is None:
+            return None
+        return res[0], res[1] + extra
+
+    def add_online_time(self, username, time_to_add):
+        with self.lock:
+            self.pending[username] = self.pending.get(username, 0) + time_to_add
+
+    def add_result(self, room, winner, expression, value, finished_at):
+        with self.lock:
+            self.results.append((room, winner, expression, value, finished_at))
+
+    def load_leaderboard(self):
+        """
+        Return (username, wins, best score) of every player who won, the results not yet written excluded
+        """
+        return self.thread_conn().execute(SELECT_LEADERBOARD).fetchall()
+
+    def flush_now(self):
+        """
+        Write the buffered data from the calling thread, return once everything added before is committed
+        """
+        self.flush(self.thread_conn())
+
+    def write_loop(self):
+        conn = self.connect()
+        try:
+            while not self.stop_event.wait(self.flush_interval):
+                self.flush(conn)
+            self.flush(conn)
+        finally:
+            conn.close()
+
+    def flush(self, conn):
+        with self.flush_lock:
+            with self.lock:
+                if not self.pending and not self.results:
+                    return
+                self.flushing, self.pending = self.pending, {}
+                results, self.results = self.results, []
+            batch = [(delta, username) for username, delta in self.flushing.items()]
+            wins = {}  # mapping from winner to [wins, best score] of the batch
+            for room, winner, expression, value, finished_at in results:
+                w = wins.setdefault(winner, [0, value])
+                w[0] += 1
+                w[1] = max(w[1], value)
+            try:
+                with conn:  # one transaction for the whole batch
+                    conn.executemany(ADD_ONLINE_TIME, batch)
+                    conn.executemany(INSERT_RESULT, results)
+                    conn.executemany(INSERT_WINNER, [(winner,) for winner in wins])
+                    conn.executemany(ADD_WINS, [(w[0], w[1], winner) for winner, w in wins.items()])
+            except sqlite3.Error:  # e.g. database locked for too long, retry with the next batch
+                with self.lock:
+                    for username, delta in self.flushing.items():
+                        self.pending[username] = self.pending.get(username, 0) + delta
+                    self.flushing = {}
+                    self.results[:0] = results
+                return
+            with self.lock:
+                self.flushing = {}
+                self.commit_count += 1
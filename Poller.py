@@ -0,0 +1,167 @@
+import select
+import socket
+
+
+class SelectPoller:
+    """
+    Readiness backend based on select.select, works everywhere but rescans all fds on every call
+    and is limited to FD_SETSIZE (usually 1024) descriptors
+    """
+    name = 'select'
+
+    def __init__(self):
+        self.readers = {}  # mapping from fd to registered object
+        self.writers = {}  # mapping from fd to registered object, only objects that want to write
+
+    def register(self, obj, read=True, write=False):
+        fd = obj.fileno()
+        if read:
+            self.readers[fd] = obj
+        if write:
+            self.writers[fd] = obj
+
+    def modify(self, obj, read=True, write=False):
+        fd = obj.fileno()
+        self.readers.pop(fd, None)
+        self.writers.pop(fd, None)
+        self.register(obj, read, write)
+
+    def unregister(self, obj):
+        fd = obj.fileno()
+        self.readers.pop(fd, None)
+        self.writers.pop(fd, None)
+
+    def poll(self, timeout=None):
+        """
+        Wait until some registered objects are ready, return (readable, writable, error) lists
+        """
+        if not self.readers and not self.writers:
+            if timeout:
+                import time
+                time.sleep(timeout)
+            return [], [], []
+        all_fds = list(set(self.readers) | set(self.writers))
+        try:
+            read_fds, write_fds, error_fds = select.select(list(self.readers), list(self.writers), all_fds, timeout)
+        except select.error:  # interrupted by a signal
+            return [], [], []
+        objs = dict(self.readers)
+        objs.update(self.writers)
+        return [objs[fd] for fd in read_fds], [objs[fd] for fd in write_fds], [objs[fd] for fd in error_fds]
+
+    def close(self):
+        self.readers = {}
+        self.writers = {}
+
+
+class EpollPoller:
+    """
+    Readiness backend based on Linux epoll, the kernel keeps the interest list so the cost of
+    a poll only depends on the number of ready fds
+    """
+    name = 'epoll'
+
+    def __init__(self):
+        self.epoll = select.epoll()
+        self.fd_map = []  # registered object of each fd, a list indexed by fd is smaller than a dict
+
+    @staticmethod
+    def _event_mask(read, write):
+        mask = 0
+        if read:
+            mask |= select.EPOLLIN
+        if write:
+            mask |= select.EPOLLOUT
+        return mask
+
+    def register(self, obj, read=True, write=False):
+        fd = obj.fileno()
+        self.epoll.register(fd, self._event_mask(read, write))
+        if fd >= len(self.fd_map):  # fds are small integers, reused by the kernel
+            self.fd_map.extend([None] * (fd + 1 - len(self.fd_map)))
+        self.fd_map[fd] = obj
+
+    def modify(self, obj, read=True, write=False):
+        self.epoll.modify(obj.fileno(), self._event_mask(read, write))
+
+    def unregister(self, obj):
+        fd = obj.fileno()
+        if 0 <= fd < len(self.fd_map) and self.fd_map[fd] is not None:
+            self.fd_map[fd] = None
+            self.epoll.unregister(fd)
+
+    def poll(self, timeout=None):
+        """
+        Wait until some registered objects are ready, return (readable, writable, error) lists
+        """
+        if timeout is None:
+            timeout = -1
+        read_objs, write_objs, error_objs = [], [], []
+        try:
+            events = self.epoll.poll(timeout)
+        except IOError:  # interrupted by a signal
+            return read_objs, write_objs, error_objs
+        for fd, mask in events:
+            obj = self.fd_map[fd]
+            if obj is None:
+                continue
+            if mask & (select.EPOLLIN | select.EPOLLHUP):  # a hang up is reported as an empty read
+                read_objs.append(obj)
+            if mask & select.EPOLLOUT:
+                write_objs.append(obj)
+            if mask & select.EPOLLERR:
+                error_objs.append(obj)
+        return read_objs, write_objs, error_objs
+
+    def close(self):
+        self.epoll.close()
+        self.fd_map = []
+
+
+class Waker:
+    """
+    Self-pipe registered in the poller, lets another thread interrupt a poll
+    """
+    def __init__(self):
+        self.reader, self.writer = socket.socketpair()
+        self.reader.setblocking(0)
+        self.writer.setblocking(0)
+
+    def fileno(self):
+        return self.reader.fileno()
+
+    def wake(self):
+        try:
+            self.writer.send(b'x')
+        except socket.error:  # the pipe is full, a wake up is already pending
+            pass
+
+    def drain(self):
+        try:
+            while self.reader.recv(4096):
+                pass
+        except socket.error:
+            pass
+
+    def close(self):
+        self.reader.close()
+        self.writer.close()
+
+
+BACKENDS = {
+    'select': SelectPoller,
+    'epoll': EpollPoller,
+}
+
+
+def create_poller(backend='auto'):
+    """
+    Create a readiness backend, 'auto' means epoll when available, otherwise select
+    """
+    if backend == 'auto':
+        backend = 'epoll' if hasattr(select, 'epoll') else 'select'
+    if backend not in BACKENDS:
+        raise ValueError("Unknown poller backend: %s" % backend)
+    if backend == 'epoll' and not hasattr(select, 'epoll'):
+        raise ValueError("epoll is not supported on this platform")
+    return BACKENDS[backend]()
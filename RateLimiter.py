@@ -0,0 +1,61 @@
+import Player
+
+CLASSES = ('chat', 'chatall', 'room', 'login', 'game')
+DEFAULT_LIMITS = 'chat=5:20,chatall=1:5,room=2:10,login=1:5,game=2:5'  # suggested for -T, nothing is limited without it
+
+
+def parse_limits(spec):
+    """
+    Parse "class=RATE:BURST,..." into a mapping from class to (tokens per second, bucket size),
+    "none" means no limit. A class that is not listed is not limited
+    """
+    limits = {}
+    if spec == 'none':
+        return limits
+    for item in spec.split(','):
+        name, _, value = item.partition('=')
+        rate, _, burst = value.partition(':')
+        if name not in CLASSES:
+            raise ValueError("Unknown command class %s, use one of %s" % (name, ', '.join(CLASSES)))
+        rate = float(rate)
+        burst = float(burst) if burst else max(rate, 1.0)
+        if rate <= 0 or burst < 1:
+            raise ValueError("The rate of %s must be positive and its burst at least 1" % name)
+        limits[name] = (rate, burst)
+    return limits
+
+
+class RateLimiter:
+    """
+    Token buckets of the players, one per command class
+
+    A bucket holds at most burst tokens and refills at rate tokens per second, each command takes
+    one. The buckets of a player are a flat list of (tokens, time of the last refill) pairs created
+    on its first limited command, and they are only refilled when a command of their class comes,
+    so idle players cost nothing.
+    """
+    def __init__(self, limits, clock=Player.monotonic):
+        self.clock = clock
+        self.index = dict((name, i) for i, name in enumerate(CLASSES))
+        self.rates = [limits[name][0] if name in limits else None for name in CLASSES]
+        self.bursts = [limits[name][1] if name in limits else None for name in CLASSES]
+
+    def take(self, player, rate_class):
+        """
+        Take a token for a command of the class, return 0 or the seconds until a token is available
+        """
+        i = self.index[rate_class]
+        rate = self.rates[i]
+        if rate is None:
+            return 0
+        now = self.clock()
+        buckets = player.buckets
+        if buckets is None:
+            buckets = player.buckets = [x for burst in self.bursts for x in (burst, now)]
+        tokens = min(self.bursts[i], buckets[2 * i] + (now - buckets[2 * i + 1]) * rate)
+        buckets[2 * i + 1] = now
+        if tokens >= 1:
+            buckets[2 * i] = tokens - 1
+            return 0
+        buckets[2 * i] = tokens
+        return (1 - tokens) / rate
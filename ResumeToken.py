@@ -0,0 +1,39 @@
+"""
+Signed tokens resuming a session after a disconnect
+
+A token is "name.nonce.signature": the user name in url-safe base64 so the token is one word,
+the nonce of the session and an HMAC-SHA256 of both with the secret of the server. Checking one
+needs no database, and a token only resumes the session whose nonce it carries, so an old token
+is worthless once the session ended or was resumed with it.
+"""
+import base64
+import hashlib
+import hmac
+
+import Fanout
+
+
+def issue(secret, name, nonce):
+    encoded = Fanout.to_str(base64.urlsafe_b64encode(Fanout.to_bytes(name))).rstrip('=')  # a str on python 2 too
+    return '%s.%s.%s' % (encoded, nonce, signature(secret, encoded, nonce))
+
+
+def signature(secret, encoded, nonce):
+    return hmac.new(secret, ('%s.%s' % (encoded, nonce)).encode('ascii'), hashlib.sha256).hexdigest()[:32]
+
+
+def verify(secret, token):
+    """
+    Return (name, nonce) of a token signed with secret, None if it is not one
+    """
+    parts = token.split('.')
+    if len(parts) != 3:
+        return None
+    encoded, nonce, mac = parts
+    try:
+        if not hmac.compare_digest(signature(secret, encoded, nonce), mac):
+            return None
+        name = Fanout.to_str(base64.urlsafe_b64decode((encoded + '=' * (-len(encoded) % 4)).encode('ascii')))
+    except (TypeError, ValueError):  # not ascii, or not base64
+        return None
+    return name, nonce
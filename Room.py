@@ -1,13 +1,23 @@
+import fractions
+import ExpressionEvaluator
+import Fanout
+
+
 class Room:
-    def __init__(self, name):
+    def __init__(self, name, fanout, evaluator, solutions=None, record_result=None):
         self.name = name
-        self.players = []
+        self.fanout = fanout  # Fanout of the game hall, used to send messages to players
+        self.evaluator = evaluator  # ExpressionEvaluator shared by the rooms, checks the answers
+        self.solutions = solutions  # SolutionIndex with the best answer of every puzzle
+        self.players = Fanout.Channel(name)
         self.is_game_start = False
         self.already_has_a_winner = False
         self.game_msg = ""
         self.game_number = set()
         self.player_point = {} # mapping from players to 21 game points
-        self.valid_math_expression_symbol = '0123456789+-*/)('
+        self.valid_math_expression_symbol = ExpressionEvaluator.SYMBOLS
+        self.round_timer = None  # next start or end of the 21 point game, scheduled by the game hall
+        self.record_result = record_result  # called with (room, winner name, expression, value) when a round is won
 
     def start_21game(self):
         """
@@ -28,7 +38,7 @@ class Room:
         max_point = None
         winner = None
         if not self.already_has_a_winner:
-            for k, v in self.player_point.iteritems():
+            for k, v in self.player_point.items():
                 if v[0] > 21: # answer exceed 21
                     continue
                 if max_point is None or v[0] > max_point:
@@ -39,13 +49,17 @@ class Room:
             else:
                 self.boardcast("21 point game: " + winner.get_username() + " is the winner(" +
                                self.player_point[winner][1] + "=" + str(max_point) + ")\n")
+                self.win(winner, self.player_point[winner][1], max_point)
+        if self.solutions is not None:
+            best, expr = self.solutions.lookup(self.game_number)
+            if best is not None:
+                self.boardcast("21 point game: the best answer is " + expr + "=" + str(best) + "\n")
         self.is_game_start = False
 
     def handle_21game_player_answer(self, player, msg):
         """
         Handle the 21 point game answer of a player
         """
-        import string
         if not self.is_game_start:
             self.send_msg_to_player(player, "The 21 point game is not yet started\n")
             return
@@ -55,82 +69,105 @@ class Room:
         if player in self.player_point: # player can only submit answer once
             self.send_msg_to_player(player, "You have already submit an answer\n")
             return
-        # check to see whether the answer is valid
         math_exp = msg.strip()
-        for c in math_exp:
-            if c not in string.whitespace and c not in self.valid_math_expression_symbol:
+        try:
+            ans, ans_nums = self.evaluator.evaluate(math_exp)
+        except ExpressionEvaluator.ExpressionError as e:
+            if e.reason == 'symbol':
                 self.send_msg_to_player(player, "Invalid symbols\n")
-                return
-        # extract numbers from math_exp
-        ans_nums = []
-        i = 0
-        sl = len(math_exp)
-        while i < sl:
-            while i < sl and math_exp[i] not in string.digits:
-                i += 1
-            if i >= sl:
-                break
-            x = 0
-            while i < sl and math_exp[i] in string.digits:
-                x = x * 10 + ord(math_exp[i]) - ord('0')
-                i += 1
-            ans_nums.append(x)
-        ans_nums.sort()
+            elif e.reason == 'complex':
+                self.send_msg_to_player(player, "21 point game: math expression too complex\n")
+            else:
+                self.send_msg_to_player(player, "21 point game: invalid math expression\n")
+            return
         # test if two sets are equal
         if len(ans_nums) != 4:
             self.send_msg_to_player(player, "21 point game: use less than 4 numbers\n")
             return
-        for i in range(4):
-            if self.game_number[i] != ans_nums[i]:
-                self.send_msg_to_player(player, "21 point game: use invalid numbers\n")
-                return
-        try:
-            ans = eval(math_exp)
-            if ans == 21: # the player wins
-                self.already_has_a_winner = True
-                self.boardcast("21 point game: " + player.get_username() + \
-                               " wins(" + math_exp + "=" + str(ans) + ")\n")
-            elif ans > 21:
-                self.send_msg_to_player(player, "21 point game: invalid answer(>21)\n")
-            else:
-                self.player_point[player] = (ans, math_exp)
-        except SyntaxError:
-            self.send_msg_to_player(player, "21 point game: invalid math expression\n")
+        if list(ans_nums) != self.game_number:
+            self.send_msg_to_player(player, "21 point game: use invalid numbers\n")
+            return
+        if ans == 21: # the player wins
+            self.already_has_a_winner = True
+            self.boardcast("21 point game: " + player.get_username() + \
+                           " wins(" + math_exp + "=" + str(ans) + ")\n")
+            self.win(player, math_exp, ans)
+        elif ans > 21:
+            self.send_msg_to_player(player, "21 point game: invalid answer(>21)\n")
+        else:
+            self.player_point[player] = (ans, math_exp)
 
-    @staticmethod
-    def send_msg_to_player(player, msg):
-        try:
-            player.sock.sendall(msg.encode())
-        except Exception:  # ignore send error
-            pass
+    def win(self, player, math_exp, ans):
+        if self.record_result is not None:
+            self.record_result(self, player.get_username(), math_exp, ans)
+
+    def send_msg_to_player(self, player, msg):
+        self.fanout.send(player, msg)
 
     def generate_21game_number(self):
         """
         Generate 4 number for the 21 point game
         """
         import random
-        self.game_number = []
-        for i in range(4):
-            self.game_number.append(random.randint(1, 10))
-        self.game_number.sort()
+        if self.solutions is not None:  # only puzzles that can reach 21
+            self.game_number = self.solutions.random_puzzle()
+        else:
+            self.game_number = []
+            for i in range(4):
+                self.game_number.append(random.randint(1, 10))
+            self.game_number.sort()
         self.game_msg = "21 point game: " + " ".join(str(x) for x in self.game_number) \
-            + "(python math expression, valid symbols are '" \
+            + "(math expression, valid symbols are '" \
             + self.valid_math_expression_symbol + "')\n"
 
+    def snapshot(self, absent=()):
+        """
+        State of the room and of its 21 point game, the players are identified by their name. The
+        players in absent are left out
+        """
+        return {'name': self.name,
+                'players': [player.get_username() for player in self.players if player not in absent],
+                'started': self.is_game_start, 'has_winner': self.already_has_a_winner,
+                'numbers': list(self.game_number), 'message': self.game_msg,
+                'points': [[player.get_username(), str(ans), expr] for player, (ans, expr) in self.player_point.items()
+                           if player.get_username() is not None and player not in absent],
+                'round_at': self.round_timer.when if self.round_timer is not None else None}
+
+    def restore(self, state, player_map):
+        """
+        Continue the game of a snapshot taken by another process, player_map maps names to players
+        """
+        for name in state['players']:
+            self.add_player(player_map[name])
+        self.is_game_start = state['started']
+        self.already_has_a_winner = state['has_winner']
+        self.game_number = state['numbers']
+        self.game_msg = state['message']
+        self.player_point = dict((player_map[name], (fractions.Fraction(ans), expr))
+                                 for name, ans, expr in state['points'] if name in player_map)
+
     def get_name(self):
         return self.name
 
     def add_player(self, player):
-        self.players.append(player)
+        self.players.add(player)
 
     def remove_player(self, player):
         self.players.remove(player)
+        self.player_point.pop(player, None)  # an answer only counts while its player is in the room
+
+    def replace_player(self, old, new):
+        """
+        The session of old goes on with the connection new, its answer of the running game too
+        """
+        self.players.remove(old)
+        self.players.add(new)
+        if old in self.player_point:
+            self.player_point[new] = self.player_point.pop(old)
 
     def num_of_players(self):
         return len(self.players)
 
     def boardcast(self, msg, except_player=None):
-        for p in self.players:
-            if except_player is None or p != except_player:
-                self.send_msg_to_player(p, msg)
+        return self.fanout.publish(self.players, msg, except_player)
 
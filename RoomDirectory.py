@@ -0,0 +1,145 @@
+import bisect
+import BinaryProtocol
+from Fanout import to_bytes
+
+ROOMS_PER_PAGE = 20
+SORT_ORDERS = ('name', 'players')
+
+
+def prefix_end(prefix):
+    """
+    Smallest string greater than every string starting with prefix, None when there is none
+    """
+    while prefix:
+        try:
+            return prefix[:-1] + chr(ord(prefix[-1]) + 1)
+        except ValueError:  # the last character is already the largest one
+            prefix = prefix[:-1]
+    return None
+
+
+class RoomDirectory:
+    """
+    Listing of every room of the game hall and its number of players, local or on another shard
+
+    The room names are kept sorted, and grouped by number of players for the occupancy order, so a
+    change of a room costs a few bisects and a page is a slice of each group found by bisecting the
+    prefix: listing a page depends on the page size and the number of distinct occupancies, not on
+    the number of rooms. Each room line is encoded once when the room changes and the rendered
+    pages are cached until the next change.
+    """
+    def __init__(self, page_size=ROOMS_PER_PAGE, max_cached_pages=256):
+        self.page_size = page_size
+        self.max_cached_pages = max_cached_pages
+        self.players = {}  # mapping from room name to number of players
+        self.lines = {}  # mapping from room name to its encoded listing line
+        self.entries = {}  # mapping from room name to its entry in the binary listing
+        self.names = []  # sorted room names
+        self.levels = []  # sorted distinct numbers of players, negated so the largest comes first
+        self.by_players = {}  # mapping from number of players to the sorted names of those rooms
+        self.pages = {}  # mapping from (prefix, sort, page, protocol) to the rendered page
+
+    def update(self, name, num_players):
+        """
+        Record the number of players of a room, 0 removes it
+        """
+        old = self.players.get(name, 0)
+        if old == num_players:
+            return
+        self.pages.clear()
+        if old:
+            self.remove_level(name, old)
+        if num_players:
+            if not old:
+                bisect.insort(self.names, name)
+            self.players[name] = num_players
+            self.lines[name] = to_bytes("%s(%d players)\n" % (name, num_players))
+            self.entries[name] = BinaryProtocol.encode_room(to_bytes(name), num_players)
+            self.add_level(name, num_players)
+        else:
+            del self.names[bisect.bisect_left(self.names, name)]
+            del self.players[name]
+            del self.lines[name]
+            del self.entries[name]
+
+    def add_level(self, name, num_players):
+        names = self.by_players.get(num_players)
+        if names is None:
+            names = self.by_players[num_players] = []
+            bisect.insort(self.levels, -num_players)
+        bisect.insort(names, name)
+
+    def remove_level(self, name, num_players):
+        names = self.by_players[num_players]
+        del names[bisect.bisect_left(names, name)]
+        if not names:
+            del self.by_players[num_players]
+            del self.levels[bisect.bisect_left(self.levels, -num_players)]
+
+    def __len__(self):
+        return len(self.names)
+
+    def __contains__(self, name):
+        return name in self.players
+
+    def prefix_range(self, prefix, names=None):
+        """
+        Positions in the sorted names, every room by default, of the names starting with prefix
+        """
+        if names is None:
+            names = self.names
+        if not prefix:
+            return 0, len(names)
+        lo = bisect.bisect_left(names, prefix)
+        end = prefix_end(prefix)
+        hi = len(names) if end is None else bisect.bisect_left(names, end, lo)
+        return lo, hi
+
+    def select(self, prefix, sort, start, stop):
+        """
+        Names of the matching rooms from position start to stop in the given order
+        """
+        if sort == 'name':
+            lo, hi = self.prefix_range(prefix)
+            return self.names[lo + start:min(lo + stop, hi)]
+        res = []
+        skipped = 0
+        for level in self.levels:  # the distinct numbers of players, not the rooms
+            names = self.by_players[-level]
+            lo, hi = self.prefix_range(prefix, names)
+            if skipped + hi - lo > start:
+                res.extend(names[lo + max(start - skipped, 0):min(lo + stop - skipped, hi)])
+            skipped += hi - lo
+            if skipped >= stop:
+                break
+        return res
+
+    def render(self, page=1, prefix='', sort='name', protocol=None):
+        """
+        Return the encoded listing of a page, starting at 1, or None if the page does not exist.
+        The listing is text, or the (opcode, payload) of an OP_ROOMS frame of the binary protocol,
+        framed by the caller with the request id of the command
+        """
+        key = (prefix, sort, page, protocol)
+        data = self.pages.get(key)
+        if data is not None:
+            return data
+        lo, hi = self.prefix_range(prefix)
+        total = hi - lo
+        num_pages = max((total + self.page_size - 1) // self.page_size, 1)
+        if page < 1 or page > num_pages:
+            return None
+        start = (page - 1) * self.page_size
+        names = self.select(prefix, sort, start, start + self.page_size)
+        if protocol is None:
+            lines = self.lines
+            data = to_bytes("Num of rooms: %d, page %d/%d\n" % (total, page, num_pages)) + b''.join(
+                lines[name] for name in names)
+        else:
+            entries = self.entries
+            data = protocol.encode(BinaryProtocol.OP_ROOMS, BinaryProtocol.encode_rooms(
+                total, page, num_pages, [entries[name] for name in names]))
+        if len(self.pages) >= self.max_cached_pages:
+            self.pages.clear()
+        self.pages[key] = data
+        return data
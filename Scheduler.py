@@ -0,0 +1,79 @@
+import heapq
+import itertools
+import time
+import traceback
+
+
+class Timer:
+    """
+    A callback scheduled at an absolute time, cancel() keeps it from running
+    """
+    __slots__ = ('when', 'callback', 'args', 'cancelled')
+
+    def __init__(self, when, callback, args):
+        self.when = when
+        self.callback = callback
+        self.args = args
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+
+class Scheduler:
+    """
+    Deadline scheduler backed by a binary heap
+
+    The event loop uses next_timeout() as its poll timeout, so it sleeps until the next deadline
+    instead of waking up periodically. Cancelled timers stay in the heap and are skipped when
+    they come out.
+    """
+    def __init__(self, clock=time.time):
+        self.clock = clock
+        self.heap = []  # (when, sequence, Timer), the sequence keeps timers with the same deadline in order
+        self.sequence = itertools.count()
+
+    def call_at(self, when, callback, *args):
+        timer = Timer(when, callback, args)
+        heapq.heappush(self.heap, (when, next(self.sequence), timer))
+        return timer
+
+    def call_later(self, delay, callback, *args):
+        return self.call_at(self.clock() + delay, callback, *args)
+
+    def next_timeout(self):
+        """
+        Return the seconds until the next deadline, 0 if a timer is due, None if nothing is scheduled
+        """
+        when = self.next_deadline()
+        if when is None:
+            return None
+        return max(0.0, when - self.clock())
+
+    def next_deadline(self):
+        """
+        Return the time of the next timer that is not cancelled, None if nothing is scheduled
+        """
+        while self.heap and self.heap[0][2].cancelled:
+            heapq.heappop(self.heap)
+        return self.heap[0][0] if self.heap else None
+
+    def run_due(self):
+        """
+        Run the timers whose deadline has passed, timers added meanwhile wait for the next call. A
+        timer that raises is reported and the others still run, e.g. one room failing its round
+        does not stop the server
+        """
+        now = self.clock()
+        due = []
+        while self.heap and self.heap[0][0] <= now:
+            due.append(heapq.heappop(self.heap)[2])
+        for timer in due:
+            if not timer.cancelled:
+                try:
+                    timer.callback(*timer.args)
+                except Exception:
+                    traceback.print_exc()
+
+    def __len__(self):
+        return len(self.heap)
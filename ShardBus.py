@@ -0,0 +1,206 @@
+import array
+import errno
+import json
+import os
+import signal
+import socket
+import zlib
+import LineFramer
+
+
+class ShardPeer:
+    """
+    Connection to another shard, messages are JSON objects, one per line
+    """
+    def __init__(self, shard_id, sock, fd_sock):
+        sock.setblocking(0)
+        self.shard_id = shard_id
+        self.sock = sock
+        self.fd_sock = fd_sock  # blocking unix socket only used to pass player sockets
+        self.framer = LineFramer.LineFramer(max_line_len=1 << 24)
+        self.out_buffer = bytearray()
+
+    def fileno(self):
+        return self.sock.fileno()
+
+
+class ShardBus:
+    """
+    Local IPC bus between the GameHall worker processes of a sharded server
+
+    Every pair of shards is connected by two unix socket pairs, a non-blocking one carrying
+    JSON messages and a blocking one used to hand a player socket over with SCM_RIGHTS.
+    """
+    def __init__(self, shard_id, num_shards, peer_socks, fd_socks):
+        self.shard_id = shard_id
+        self.num_shards = num_shards
+        self.peers = {}  # mapping from shard id to ShardPeer
+        for other, sock in peer_socks.items():
+            self.peers[other] = ShardPeer(other, sock, fd_socks[other])
+        self.hall = None
+        self.recv_buffer = bytearray(65536)
+
+    def attach(self, hall):
+        """
+        Register the peers in the poller of the hall, messages are delivered to hall.handle_bus_message
+        """
+        self.hall = hall
+        for peer in self.peers.values():
+            hall.poller.register(peer)
+
+    def owns(self, obj):
+        return isinstance(obj, ShardPeer)
+
+    def shard_of_room(self, roomname):
+        """
+        Rooms are pinned to a shard by a stable hash of their name
+        """
+        if not isinstance(roomname, bytes):
+            roomname = roomname.encode('utf-8')
+        return (zlib.crc32(roomname) & 0xffffffff) % self.num_shards
+
+    def send(self, shard_id, msg):
+        peer = self.peers[shard_id]
+        pending = len(peer.out_buffer)
+        peer.out_buffer += json.dumps(msg, separators=(',', ':')).encode('utf-8') + b'\n'
+        if pending == 0 and not self.flush(peer):
+            self.hall.poller.modify(peer, read=True, write=True)
+
+    def broadcast(self, msg):
+        for shard_id in self.peers:
+            self.send(shard_id, msg)
+
+    def flush(self, peer):
+        """
+        Write as much buffered data as the peer accepts, return True if the buffer is empty
+        """
+        try:
+            sent = peer.sock.send(peer.out_buffer)
+            del peer.out_buffer[:sent]
+        except socket.error as e:
+            if e.errno not in (errno.EAGAIN, errno.EWOULDBLOCK, errno.EINTR):
+                raise
+        return len(peer.out_buffer) == 0
+
+    def handle_write(self, peer):
+        if self.flush(peer):
+            self.hall.poller.modify(peer, read=True, write=False)
+
+    def handle_read(self, peer):
+        try:
+            recv_len = peer.sock.recv_into(self.recv_buffer)
+        except socket.error as e:
+            if e.errno in (errno.EAGAIN, errno.EWOULDBLOCK, errno.EINTR):
+                return
+            raise
+        if not recv_len:  # the other shard is gone, nothing sensible is left to do
+            raise SystemExit("Shard %d lost connection to shard %d" % (self.shard_id, peer.shard_id))
+        for line in peer.framer.feed(self.recv_buffer, recv_len):
+            self.hall.handle_bus_message(peer.shard_id, native_strings(json.loads(line.decode('utf-8'))))
+
+    def send_fd(self, shard_id, fd):
+        send_fd(self.peers[shard_id].fd_sock, fd)
+
+    def recv_fd(self, shard_id):
+        return recv_fd(self.peers[shard_id].fd_sock)
+
+
+def native_strings(obj):
+    """
+    json returns unicode strings, python 2 code works with utf-8 encoded str
+    """
+    if str is bytes:
+        if isinstance(obj, dict):
+            return dict((native_strings(k), native_strings(v)) for k, v in obj.items())
+        if isinstance(obj, list):
+            return [native_strings(x) for x in obj]
+        if isinstance(obj, unicode):
+            return obj.encode('utf-8')
+    return obj
+
+
+def send_fd(sock, fd):
+    """
+    Pass a file descriptor over a unix socket
+    """
+    if hasattr(sock, 'sendmsg'):
+        sock.sendmsg([b'F'], [(socket.SOL_SOCKET, socket.SCM_RIGHTS, array.array('i', [fd]))])
+    else:  # python 2 has no sendmsg
+        import _multiprocessing
+        _multiprocessing.sendfd(sock.fileno(), fd)
+
+
+def recv_fd(sock):
+    """
+    Receive a file descriptor sent by send_fd, block until it arrives
+    """
+    if hasattr(sock, 'recvmsg'):
+        int_size = array.array('i').itemsize
+        msg, ancdata, flags, addr = sock.recvmsg(1, socket.CMSG_LEN(int_size))
+        for level, kind, data in ancdata:
+            if level == socket.SOL_SOCKET and kind == socket.SCM_RIGHTS:
+                return array.array('i', data[:int_size])[0]
+        raise socket.error("No file descriptor received")
+    else:
+        import _multiprocessing
+        return _multiprocessing.recvfd(sock.fileno())
+
+
+def start_shards(num_shards, worker_main):
+    """
+    Fork num_shards worker processes connected by a full mesh of unix sockets and wait for them,
+    worker_main(bus) runs in each worker
+    """
+    channels = {}
+    for i in range(num_shards):
+        for j in range(i + 1, num_shards):
+            channels[(i, j)] = (socket.socketpair(), socket.socketpair())
+    pids = []
+    for shard_id in range(num_shards):
+        pid = os.fork()
+        if pid == 0:  # worker
+            peer_socks, fd_socks = {}, {}
+            for (i, j), ((a, b), (fa, fb)) in channels.items():
+                if i == shard_id:
+                    peer_socks[j], fd_socks[j] = a, fa
+                    b.close()
+                    fb.close()
+                elif j == shard_id:
+                    peer_socks[i], fd_socks[i] = b, fb
+                    a.close()
+                    fa.close()
+                else:
+                    for s in (a, b, fa, fb):
+                        s.close()
+            try:
+                worker_main(ShardBus(shard_id, num_shards, peer_socks, fd_socks))
+            finally:
+                os._exit(1)
+        pids.append(pid)
+    for (a, b), (fa, fb) in channels.values():
+        for s in (a, b, fa, fb):
+            s.close()
+
+    stopping = []
+
+    def stop_workers(signum, frame):
+        if stopping:  # signal each worker only once, a second signal would interrupt its shutdown
+            return
+        stopping.append(True)
+        for pid in pids:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except OSError:
+                pass
+    signal.signal(signal.SIGTERM, stop_workers)
+    signal.signal(signal.SIGINT, stop_workers)
+    while pids:  # when one worker dies the others can not reach its rooms any more, stop them all
+        try:
+            pid, status = os.wait()
+        except OSError as e:
+            if e.errno == errno.EINTR:
+                continue
+            break
+        if pid in pids:
+            pids.remove(pid)
+            stop_workers(None, None)
@@ -0,0 +1,202 @@
+"""
+Precomputed answers of the 21 point game
+
+For every sorted multiset of four numbers in [lo, hi] the index stores the best value reachable
+without going over the target and a sample expression. Rebuild it with
+
+    python SolutionIndex.py [-o solutions21.idx] [-j PROCESSES] [--lo 1] [--hi 10] [--ops +-*/]
+"""
+import argparse
+import fractions
+import itertools
+import multiprocessing
+import os
+import random
+import struct
+
+MAGIC = b'K21I'
+VERSION = 1
+HEADER = struct.Struct('<4sBBBBBB')  # magic, version, lo, hi, numbers per puzzle, target, length of ops
+ENTRY = struct.Struct('<hHB')  # numerator, denominator, length of the expression
+
+
+def combine(a, b, ops):
+    """
+    Yield (value, expression) of every way to combine two sub expressions with ops
+    """
+    (va, ea), (vb, eb) = a, b
+    if '+' in ops:
+        yield va + vb, '(%s+%s)' % (ea, eb)
+    if '-' in ops:
+        yield va - vb, '(%s-%s)' % (ea, eb)
+        yield vb - va, '(%s-%s)' % (eb, ea)
+    if '*' in ops:
+        yield va * vb, '(%s*%s)' % (ea, eb)
+    if '/' in ops:
+        if vb != 0:
+            yield va / vb, '(%s/%s)' % (ea, eb)
+        if va != 0:
+            yield vb / va, '(%s/%s)' % (eb, ea)
+
+
+def reachable(items, ops, results):
+    """
+    Add every value reachable with all the (value, expression) items to results, value -> expression
+    """
+    if len(items) == 1:
+        value, expr = items[0]
+        results.setdefault(value, expr)
+        return
+    for i in range(len(items)):
+        for j in range(i + 1, len(items)):
+            rest = items[:i] + items[i + 1:j] + items[j + 1:]
+            for item in combine(items[i], items[j], ops):
+                reachable(rest + [item], ops, results)
+
+
+def solve(numbers, ops='+-*/', target=21):
+    """
+    Return (best value not over target, sample expression) of numbers, or (None, None)
+    """
+    results = {}
+    reachable([(fractions.Fraction(n), str(n)) for n in numbers], ops, results)
+    best = None
+    for value in results:
+        if value <= target and (best is None or value > best):
+            best = value
+    if best is None:
+        return None, None
+    expr = results[best]
+    if expr.startswith('('):
+        expr = expr[1:-1]
+    return best, expr
+
+
+def solve_args(args):
+    return solve(*args)
+
+
+class SolutionIndex:
+    """
+    Best value and sample expression of every puzzle, keyed by the sorted tuple of its numbers
+    """
+    def __init__(self, lo=1, hi=10, count=4, ops='+-*/', target=21):
+        self.lo = lo
+        self.hi = hi
+        self.count = count
+        self.ops = ops
+        self.target = target
+        self.entries = {}  # mapping from sorted numbers to (best value, expression)
+        self.solvable = []  # puzzles whose best value is the target
+
+    def puzzles(self):
+        return itertools.combinations_with_replacement(range(self.lo, self.hi + 1), self.count)
+
+    def build(self, processes=None):
+        """
+        Solve every puzzle, in processes worker processes when processes is not 1
+        """
+        puzzles = list(self.puzzles())
+        jobs = [(p, self.ops, self.target) for p in puzzles]
+        if processes == 1:
+            answers = [solve_args(job) for job in jobs]
+        else:
+            pool = multiprocessing.Pool(processes)
+            try:
+                answers = pool.map(solve_args, jobs, chunksize=16)
+            finally:
+                pool.close()
+                pool.join()
+        self.set_entries(zip(puzzles, answers))
+
+    def set_entries(self, entries):
+        self.entries = dict(entries)
+        self.solvable = sorted(p for p, (best, expr) in self.entries.items() if best == self.target)
+
+    def lookup(self, numbers):
+        """
+        Return (best value, sample expression) of the numbers, in any order
+        """
+        return self.entries.get(tuple(sorted(numbers)), (None, None))
+
+    def random_puzzle(self, require_solvable=True):
+        """
+        Return a sorted list of numbers, one whose best value is the target if require_solvable
+        """
+        if require_solvable and self.solvable:
+            return list(random.choice(self.solvable))
+        return sorted(random.randint(self.lo, self.hi) for i in range(self.count))
+
+    def save(self, path):
+        ops = self.ops.encode('ascii')
+        data = [HEADER.pack(MAGIC, VERSION, self.lo, self.hi, self.count, self.target, len(ops)), ops]
+        for puzzle in self.puzzles():
+            best, expr = self.entries[puzzle]
+            if best is None:
+                data.append(ENTRY.pack(0, 0, 0))
+                continue
+            expr = expr.encode('ascii')
+            data.append(ENTRY.pack(best.numerator, best.denominator, len(expr)))
+            data.append(expr)
+        with open(path, 'wb') as f:
+            f.write(b''.join(data))
+
+    @classmethod
+    def load(cls, path):
+        """
+        Read an index written by save, the puzzles are stored in the order of puzzles() so only
+        the answers are in the file
+        """
+        with open(path, 'rb') as f:
+            data = f.read()
+        magic, version, lo, hi, count, target, ops_len = HEADER.unpack_from(data, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError("%s is not a 21 point solution index" % path)
+        pos = HEADER.size
+        index = cls(lo, hi, count, data[pos:pos + ops_len].decode('ascii'), target)
+        pos += ops_len
+        entries = []
+        for puzzle in index.puzzles():
+            numerator, denominator, expr_len = ENTRY.unpack_from(data, pos)
+            pos += ENTRY.size
+            if denominator == 0:
+                entries.append((puzzle, (None, None)))
+                continue
+            expr = str(data[pos:pos + expr_len].decode('ascii'))
+            pos += expr_len
+            entries.append((puzzle, (fractions.Fraction(numerator, denominator), expr)))
+        index.set_entries(entries)
+        return index
+
+
+def load_or_build(path):
+    """
+    Load the index at path, build and save the default one if the file does not exist
+    """
+    try:
+        return SolutionIndex.load(path)
+    except IOError:
+        index = SolutionIndex()
+        index.build()
+        tmp_path = '%s.%d' % (path, os.getpid())  # several shards may build it at the same time
+        index.save(tmp_path)
+        os.rename(tmp_path, path)
+        return index
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rebuild the 21 point game solution index")
+    parser.add_argument("-o", "--output", default="solutions21.idx", help="Index file(default: solutions21.idx)")
+    parser.add_argument("-j", "--processes", type=int, help="Worker processes(default: cpu count)")
+    parser.add_argument("--lo", type=int, default=1, help="Smallest number(default: 1)")
+    parser.add_argument("--hi", type=int, default=10, help="Largest number(default: 10)")
+    parser.add_argument("--ops", default="+-*/", help="Operators(default: +-*/)")
+    args = parser.parse_args()
+    index = SolutionIndex(args.lo, args.hi, ops=args.ops)
+    index.build(args.processes)
+    index.save(args.output)
+    print("%d puzzles, %d reach %d exactly, saved to %s" % (len(index.entries), len(index.solvable),
+                                                           index.target, args.output))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,60 @@
+class TimingWheel:
+    """
+    Hashed timing wheel of items expiring after a number of ticks
+
+    Scheduling, removing and expiring an item are O(1), advance() only looks at the slots of
+    the ticks that passed. An item is in at most one slot, recorded in item.wheel_slot. A delay
+    longer than the wheel is clamped to one turn, the owner reschedules the item when it comes
+    out too early.
+    """
+    def __init__(self, num_slots):
+        self.num_slots = num_slots
+        self.slots = {}  # mapping from slot index to the set of items, only non empty slots are kept
+        self.current = None  # last tick handled by advance
+        self.size = 0
+
+    def schedule(self, item, ticks, now):
+        """
+        Expire item ticks after the tick now
+        """
+        self.remove(item)
+        if self.current is None:
+            self.current = now
+        ticks = min(max(ticks, 1), self.num_slots - 1)
+        slot = (max(now, self.current) + ticks) % self.num_slots
+        self.slots.setdefault(slot, set()).add(item)
+        item.wheel_slot = slot
+        self.size += 1
+
+    def remove(self, item):
+        slot = item.wheel_slot
+        if slot is None:
+            return
+        items = self.slots[slot]
+        items.discard(item)
+        if not items:
+            del self.slots[slot]
+        item.wheel_slot = None
+        self.size -= 1
+
+    def advance(self, now):
+        """
+        Move the wheel to the tick now and return the items that expired
+        """
+        expired = []
+        if self.current is None:
+            self.current = now
+            return expired
+        ticks = min(now - self.current, self.num_slots)  # after a whole turn every slot has expired
+        for i in range(1, ticks + 1):
+            items = self.slots.pop((self.current + i) % self.num_slots, None)
+            if items:
+                for item in items:
+                    item.wheel_slot = None
+                self.size -= len(items)
+                expired.extend(items)
+        self.current = max(self.current, now)
+        return expired
+
+    def __len__(self):
+        return self.size
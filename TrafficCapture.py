@@ -0,0 +1,255 @@
+"""
+Capture of the traffic received by the game hall and its deterministic replay
+
+With -C PATH the server appends every connection, every chunk of received data and every close
+to PATH, each as a RECORD header followed by the data. A Replay feeds such a capture back into a
+GameHall in the same process: the connections are ReplaySockets that accept and count whatever
+is sent, the poller does nothing, the clock is a VirtualClock set to the time of each event and
+of each timer, and the password checks run on the replay thread, so the same capture produces
+the same replies with any build and at any speed.
+"""
+import itertools
+import random
+import struct
+import time
+import zlib
+
+import Player
+
+MAGIC = b'KGHCAP1\n'
+START = struct.Struct('>d')  # unix time of the start of the capture
+RECORD = struct.Struct('>IIBI')  # milliseconds since the start, connection id, kind, data length
+CONNECT = 0
+DATA = 1
+CLOSE = 2
+
+cpu_time = getattr(time, 'process_time', None) or time.clock  # python 2 has no process_time
+
+
+class CaptureWriter:
+    """
+    Appends the received traffic to a capture file, written through the buffer of the file
+    """
+    def __init__(self, path, clock=time.time):
+        self.clock = clock
+        self.start = clock()
+        self.file = open(path, 'wb')
+        self.file.write(MAGIC + START.pack(self.start))
+        self.ids = {}  # mapping from player to connection id
+        self.next_id = itertools.count(1)
+
+    def connect(self, player):
+        conn_id = self.ids[player] = next(self.next_id)
+        self.write(conn_id, CONNECT)
+        return conn_id
+
+    def data(self, player, data):
+        conn_id = self.ids.get(player)
+        if conn_id is None:  # connected before the capture, e.g. taken over from the previous server
+            conn_id = self.connect(player)
+        self.write(conn_id, DATA, data)
+
+    def close(self, player):
+        conn_id = self.ids.pop(player, None)
+        if conn_id is not None:
+            self.write(conn_id, CLOSE)
+
+    def write(self, conn_id, kind, data=b''):
+        elapsed = int((self.clock() - self.start) * 1000)
+        self.file.write(RECORD.pack(elapsed, conn_id, kind, len(data)))
+        if data:
+            self.file.write(data)
+
+    def close_file(self):
+        self.file.close()
+
+
+class CaptureReader:
+    """
+    Iterates over the (seconds since the start, connection id, kind, data) events of a capture
+    """
+    def __init__(self, path):
+        self.file = open(path, 'rb')
+        if self.file.read(len(MAGIC)) != MAGIC:
+            raise ValueError("%s is not a KGameHall capture" % path)
+        self.start = START.unpack(self.file.read(START.size))[0]
+
+    def __iter__(self):
+        read = self.file.read
+        while True:
+            header = read(RECORD.size)
+            if len(header) < RECORD.size:  # the end, or the last record of a server that was killed
+                break
+            elapsed, conn_id, kind, size = RECORD.unpack(header)
+            data = read(size) if size else b''
+            if len(data) < size:
+                break
+            yield elapsed / 1000.0, conn_id, kind, data
+
+    def close(self):
+        self.file.close()
+
+
+class VirtualClock:
+    """
+    Clock that only moves when the replay sets it, both time() and monotonic() read it
+    """
+    def __init__(self, now):
+        self.now = now
+
+    def time(self):
+        return self.now
+
+    def monotonic(self):
+        return self.now
+
+
+class ReplaySocket:
+    """
+    Socket stand-in of a replayed connection, everything sent is accepted, counted and checksummed
+    """
+    def __init__(self):
+        self.bytes_sent = 0
+        self.crc = 0
+        self.closed = False
+
+    def setblocking(self, flag):
+        pass
+
+    def fileno(self):
+        return -1
+
+    def send(self, data):
+        self.bytes_sent += len(data)
+        self.crc = zlib.crc32(bytes(data) if str is bytes else data, self.crc)  # python 2 wants a str
+        return len(data)
+
+    def close(self):
+        self.closed = True
+
+
+class ReplayPoller:
+    """
+    Poller stand-in, a replayed socket is always writable and only read when the replay says so
+    """
+    def register(self, obj, read=True, write=False):
+        pass
+
+    def modify(self, obj, read=True, write=False):
+        pass
+
+    def unregister(self, obj):
+        pass
+
+    def close(self):
+        pass
+
+
+class Replay:
+    """
+    Feed a capture into a GameHall created with a VirtualClock, at the captured pace divided by
+    speed or as fast as possible with speed 0. The hall is set up as run() would do it, without
+    sockets, threads or metrics server
+    """
+    def __init__(self, hall, reader, speed=0, seed=0):
+        self.hall = hall
+        self.reader = reader
+        self.speed = speed
+        self.clock = hall.clock
+        self.sockets = {}  # mapping from connection id to ReplaySocket
+        self.players = {}  # mapping from connection id to Player
+        self.events = 0
+        self.handler_time = 0.0  # CPU seconds spent in the game hall, the password checks excluded
+        self.auth_time = 0.0  # CPU seconds spent checking passwords
+        random.seed(seed)  # the same 21 point game numbers
+        hall.check_and_create_user_login_table()
+        hall.load_solution_index()
+        hall.poller = ReplayPoller()
+        hall.auth_pool.notify = lambda: None  # the jobs are run by end_iteration
+
+    def run(self):
+        """
+        Replay every event, the sessions follow the virtual clock until the replay returns
+        """
+        previous = Player.set_clock(self.clock.monotonic)
+        try:
+            self.replay_events()
+        finally:
+            Player.set_clock(previous)
+
+    def replay_events(self):
+        wall_start = time.time()
+        for elapsed, conn_id, kind, data in self.reader:
+            if self.speed:
+                delay = wall_start + elapsed / self.speed - time.time()
+                if delay > 0:
+                    time.sleep(delay)
+            self.advance(self.reader.start + elapsed)
+            start = cpu_time()
+            if kind == CONNECT:
+                sock = self.sockets[conn_id] = ReplaySocket()
+                self.players[conn_id] = self.hall.handle_new_player(sock)
+            elif kind == DATA:
+                self.feed(self.players[conn_id], data)
+            elif kind == CLOSE:
+                player = self.players.pop(conn_id)
+                if not player.closed:
+                    self.hall.handle_player_disconnect(player)
+            self.end_iteration(start)
+            self.events += 1
+
+    def feed(self, player, data):
+        """
+        Received data goes through the shared receive buffer like after a recv_into
+        """
+        hall = self.hall
+        size = hall.buffer_len
+        for i in range(0, len(data), size):
+            chunk = data[i:i + size]
+            hall.recv_buffer[:len(chunk)] = chunk
+            if not player.closed:
+                hall.handle_received_data(player, len(chunk))
+
+    def advance(self, when):
+        """
+        Move the clock to when, running the timers due before at their own time
+        """
+        scheduler = self.hall.scheduler
+        while True:
+            deadline = scheduler.next_deadline()
+            if deadline is None or deadline > when:
+                break
+            self.clock.now = max(self.clock.now, deadline)
+            start = cpu_time()
+            scheduler.run_due()
+            self.end_iteration(start)
+        self.clock.now = max(self.clock.now, when)
+
+    def end_iteration(self, start):
+        """
+        What the event loop does after the events of an iteration, the password checks are run
+        right away so their replies do not depend on the speed of the worker threads
+        """
+        hall = self.hall
+        self.handler_time += cpu_time() - start
+        auth_start = cpu_time()
+        ran = hall.auth_pool.run_pending()
+        self.auth_time += cpu_time() - auth_start
+        start = cpu_time()
+        if ran:
+            hall.auth_pool.run_completions()
+        hall.flush_dirty_players()
+        hall.close_pending_players()
+        self.handler_time += cpu_time() - start
+
+    def bytes_sent(self):
+        return sum(sock.bytes_sent for sock in self.sockets.values())
+
+    def checksum(self):
+        """
+        CRC of the replies of every connection, equal for two builds that answered the same
+        """
+        crc = 0
+        for conn_id in sorted(self.sockets):
+            crc = zlib.crc32(struct.pack('>II', conn_id, self.sockets[conn_id].crc & 0xffffffff), crc)
+        return crc & 0xffffffff
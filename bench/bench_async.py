@@ -0,0 +1,60 @@
+"""
+Compare the select/epoll loop server with the asyncio server under the same chat load
+
+Usage: python bench/bench_async.py [-c CLIENTS] [-r ROOMS] [-m MESSAGES] [-j CLIENT_PROCESSES] [--jitter]
+
+--jitter also waits for a 21 point game round of each variant (up to a minute) and reports how
+late the round started compared with the whole minute.
+"""
+import argparse
+import datetime
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import bench_shards
+
+VARIANTS = [
+    ('loop', []),
+    ('asyncio', ['-a']),
+]
+
+
+def measure_jitter(server_args, port):
+    db = os.path.join(tempfile.mkdtemp(), 'jitter.db')
+    server = subprocess.Popen([sys.executable, 'GameHallServer.py', '-p', str(port), '-n', db, '-d', '1', '-l', '5']
+                              + server_args, cwd=bench_shards.ROOT, stdout=open(os.devnull, 'w'))
+    time.sleep(1.0)
+    try:
+        s = socket.create_connection(('127.0.0.1', port))
+        s.sendall(b'$register jitter pw\n$build jitter\n')
+        data = bench_shards.read_until(s, b'21 point game: ', timeout=75.0)
+        now = datetime.datetime.now()
+        if b'21 point game: ' not in data:
+            return None
+        return now.second + now.microsecond / 1e6
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Loop server versus asyncio server benchmark")
+    parser.add_argument("-c", "--clients", type=int, default=200, help="Number of clients")
+    parser.add_argument("-r", "--rooms", type=int, default=20, help="Number of rooms")
+    parser.add_argument("-m", "--messages", type=int, default=200, help="Chat messages sent by every client")
+    parser.add_argument("-j", "--processes", type=int, default=4, help="Client processes")
+    parser.add_argument("--jitter", action="store_true", help="Also measure the start delay of a game round")
+    args = parser.parse_args()
+    print("%-8s %12s %10s %14s %12s" % ("variant", "delivered", "seconds", "lines/second", "jitter(ms)"))
+    for i, (name, server_args) in enumerate(VARIANTS):
+        received, elapsed = bench_shards.run_once(server_args, 37100 + i, args.clients, args.rooms, args.messages,
+                                                  args.processes)
+        jitter = measure_jitter(server_args, 37110 + i) if args.jitter else None
+        print("%-8s %12d %10.2f %14.0f %12s" % (name, received, elapsed, received / elapsed,
+                                                 "-" if jitter is None else "%.0f" % (jitter * 1e3)))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+"""
+Measure the cost of one hall chat broadcast inside the server process
+
+Usage: python bench/bench_fanout.py [-n 1000,5000] [-i ITERATIONS]
+
+The players are socketpairs logged in to a GameHall that is not running, the measured time is
+handle_player_chat plus the batched write at the end of the loop iteration.
+"""
+import argparse
+import os
+import socket
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import GameHallServer
+import Poller
+
+
+def raise_fd_limit(wanted):
+    try:
+        import resource
+        soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+        if hard != resource.RLIM_INFINITY:
+            wanted = min(wanted, hard)
+        if soft < wanted:
+            resource.setrlimit(resource.RLIMIT_NOFILE, (wanted, hard))
+        return resource.getrlimit(resource.RLIMIT_NOFILE)[0]
+    except (ImportError, ValueError):
+        return None
+
+
+def bench_hall(num_players, iterations):
+    hall = GameHallServer.GameHall('', 0, 10, ':memory:', 30, 15)
+    hall.poller = Poller.create_poller()
+    peers = []
+    for i in range(num_players):
+        a, b = socket.socketpair()
+        b.setblocking(0)
+        peers.append(b)
+        hall.handle_new_player(a)
+        hall.complete_login(hall.all_socks[-1], 'player%d' % i)
+    hall.flush_dirty_players()
+    speaker = hall.all_socks[0]
+
+    def drain():
+        for b in peers:
+            try:
+                while b.recv(65536):
+                    pass
+            except socket.error:
+                pass
+    drain()
+    total = 0.0
+    for i in range(iterations):
+        start = time.time()
+        hall.handle_player_chat(speaker, '$chat hello everyone in the hall')
+        hall.flush_dirty_players()
+        total += time.time() - start
+        if i % 50 == 49:
+            drain()
+    for b in peers:
+        b.close()
+    for p in hall.all_socks:
+        p.sock.close()
+    return total / iterations
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Hall broadcast cost benchmark")
+    parser.add_argument("-n", "--players", default="1000,5000", help="Comma separated numbers of players in the hall")
+    parser.add_argument("-i", "--iterations", type=int, default=200, help="Broadcasts per measurement")
+    args = parser.parse_args()
+    counts = [int(x) for x in args.players.split(',')]
+    fd_limit = raise_fd_limit(max(counts) * 2 + 64)
+    print("%-10s %14s %16s" % ("players", "ms/broadcast", "us/recipient"))
+    for n in counts:
+        if fd_limit is not None and n * 2 + 64 > fd_limit:
+            print("%-10d skipped (fd limit %d)" % (n, fd_limit))
+            continue
+        cost = bench_hall(n, args.iterations)
+        print("%-10d %14.2f %16.2f" % (n, cost * 1e3, cost * 1e6 / max(n - 1, 1)))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,117 @@
+"""
+Measure how much a few players flooding $chatall cost the others, with and without rate limits
+
+Usage: python bench/bench_flood.py [-n LISTENERS] [-f FLOODERS] [-t SECONDS]
+
+For every variant a server is started, LISTENERS players wait in the game hall and FLOODERS
+players send $chatall as fast as the server reads them. Meanwhile a quiet player sends
+$online_time every 10 ms. The table shows the chat lines delivered per second to all the
+listeners, which is the fan-out work done for the flooders, and the reply times of the quiet player.
+"""
+import argparse
+import os
+import select
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from bench_shards import ROOT, read_until
+sys.path.insert(0, ROOT)
+import RateLimiter
+
+VARIANTS = [
+    ('no limit', []),
+    ('defer', ['-T', RateLimiter.DEFAULT_LIMITS]),
+    ('reject', ['-T', RateLimiter.DEFAULT_LIMITS, '-D', 'reject']),
+]
+
+
+def login(port, name):
+    s = socket.create_connection(('127.0.0.1', port))
+    s.sendall(('$register %s pw\n' % name).encode())
+    read_until(s, b'success')
+    return s
+
+
+def drain(socks, stop, counts):
+    for s in socks:
+        s.setblocking(0)
+    while not stop.is_set():
+        r, w, e = select.select(socks, [], [], 0.1)
+        for s in r:
+            try:
+                counts[0] += s.recv(65536).count(b'\n')
+            except socket.error:
+                pass
+
+
+def flood(sock, stop):
+    data = b'$chatall flood flood flood flood flood flood flood\n' * 100
+    sock.setblocking(0)
+    while not stop.is_set():
+        r, w, e = select.select([sock], [sock], [], 0.1)
+        if r:
+            sock.recv(65536)
+        if w:
+            try:
+                sock.send(data)
+            except socket.error:
+                pass
+
+
+def run_variant(server_args, port, num_listeners, num_flooders, seconds):
+    db = os.path.join(tempfile.mkdtemp(), 'flood.db')
+    server = subprocess.Popen([sys.executable, 'GameHallServer.py', '-p', str(port), '-n', db, '-i', '1000']
+                              + server_args, cwd=ROOT, stdout=open(os.devnull, 'w'))
+    time.sleep(1.5)
+    try:
+        listeners = [login(port, 'listener%d' % i) for i in range(num_listeners)]
+        flooders = [login(port, 'flooder%d' % i) for i in range(num_flooders)]
+        probe = login(port, 'probe')
+        stop = threading.Event()
+        counts = [0]
+        threads = [threading.Thread(target=drain, args=(listeners, stop, counts))]
+        threads += [threading.Thread(target=flood, args=(s, stop)) for s in flooders]
+        for t in threads:
+            t.start()
+        time.sleep(0.5)
+        delivered = counts[0]
+        start = time.time()
+        latencies = []
+        while time.time() - start < seconds:
+            t = time.time()
+            probe.sendall(b'$online_time\n')
+            read_until(probe, b'Online time')
+            latencies.append(time.time() - t)
+            time.sleep(0.01)
+        delivered = (counts[0] - delivered) / (time.time() - start)
+        stop.set()
+        for t in threads:
+            t.join()
+        for s in listeners + flooders + [probe]:
+            s.close()
+    finally:
+        server.terminate()
+        server.wait()
+    latencies.sort()
+    return delivered, latencies[len(latencies) // 2], latencies[len(latencies) * 99 // 100], latencies[-1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Chat flood benchmark")
+    parser.add_argument("-n", "--listeners", type=int, default=500, help="Players in the game hall, at most 1000")
+    parser.add_argument("-f", "--flooders", type=int, default=2, help="Players flooding $chatall")
+    parser.add_argument("-t", "--seconds", type=float, default=5.0, help="Seconds of flood per variant")
+    parser.add_argument("-p", "--port", type=int, default=37800, help="Server port")
+    args = parser.parse_args()
+    print("%-10s %16s %10s %10s %10s" % ("variant", "chat lines/s", "p50(ms)", "p99(ms)", "max(ms)"))
+    for name, server_args in VARIANTS:
+        delivered, p50, p99, slowest = run_variant(server_args, args.port, args.listeners, args.flooders,
+                                                   args.seconds)
+        print("%-10s %16.0f %10.2f %10.2f %10.2f" % (name, delivered, p50 * 1000, p99 * 1000, slowest * 1000))
+
+if __name__ == '__main__':
+    main()
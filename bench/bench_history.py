@@ -0,0 +1,103 @@
+"""
+Cost of keeping the recent chats of the rooms and replaying them to the players who join
+
+Usage: python bench/bench_history.py [-r ROOMS] [-m MESSAGES] [-j JOINS]
+
+For every variant a server is started, a keeper player builds each of ROOMS rooms and sends
+MESSAGES chats in it. Then a probe player joins JOINS of the rooms one after the other and
+reads the catch-up it gets. The table shows the chats handled per second, the memory the server
+grew by, the bytes of history it reports, and the time and bytes of a join.
+"""
+import argparse
+import os
+import re
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+from bench_memory import rss_bytes
+from bench_shards import ROOT
+from bench_restart import read_until
+
+VARIANTS = [
+    ('off', ['-e', '0']),
+    ('50 lines', []),
+    ('200 lines', ['-e', '200']),
+    ('200, 1 MB', ['-e', '200', '-E', '1048576']),
+]
+
+
+def login(port, name):
+    s = socket.create_connection(('127.0.0.1', port))
+    s.sendall(('$register %s pw\n' % name).encode())
+    read_until(s, b'success')
+    return s
+
+
+def history_bytes(sock):
+    """
+    Size of the history reported by $stats, the probe is an admin
+    """
+    sock.sendall(b'$stats\n')
+    data = read_until(sock, b'chat_history_channels').decode()
+    match = re.search(r'chat_history_bytes: (\d+)', data)
+    return int(match.group(1)) if match else 0
+
+
+def run_variant(server_args, port, num_rooms, messages, joins):
+    db = os.path.join(tempfile.mkdtemp(), 'history.db')
+    server = subprocess.Popen([sys.executable, 'GameHallServer.py', '-p', str(port), '-n', db, '-i', '1000',
+                               '-T', 'none', '-A', 'probe'] + server_args, cwd=ROOT, stdout=open(os.devnull, 'w'))
+    time.sleep(1.5)
+    keepers = []
+    try:
+        probe = login(port, 'probe')
+        keepers = [login(port, 'keeper%d' % i) for i in range(num_rooms)]
+        for i, s in enumerate(keepers):
+            s.sendall(('$build room%d\n' % i).encode())
+            read_until(s, b'success')
+        before = rss_bytes(server.pid)
+        chat = b''.join(b'$chat message %04d of a conversation going on in this room\n' % j for j in range(messages))
+        start = time.time()
+        for s in keepers:
+            s.sendall(chat + b'$online_time\n')
+        for s in keepers:
+            read_until(s, b'Online time', 60.0)
+        rate = num_rooms * messages / (time.time() - start)
+        grown = rss_bytes(server.pid) - before
+        stored = history_bytes(probe)
+        times = []
+        received = 0
+        for i in range(joins):
+            start = time.time()
+            probe.sendall(('$join room%d\n$online_time\n' % (i * num_rooms // joins)).encode())
+            received += len(read_until(probe, b'Online time'))
+            times.append(time.time() - start)
+        times.sort()
+    finally:
+        server.terminate()
+        server.wait()
+        for s in keepers:
+            s.close()
+    return rate, grown, stored, times[len(times) // 2], received / float(joins)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Chat history benchmark")
+    parser.add_argument("-r", "--rooms", type=int, default=500, help="Rooms, each with a keeper player")
+    parser.add_argument("-m", "--messages", type=int, default=200, help="Chats sent in each room")
+    parser.add_argument("-j", "--joins", type=int, default=100, help="Rooms joined by the probe")
+    parser.add_argument("-p", "--port", type=int, default=37900, help="Server port")
+    args = parser.parse_args()
+    print("%-10s %12s %12s %14s %10s %12s" % ("variant", "chats/s", "rss(KB)", "history(KB)", "join(ms)",
+                                               "join bytes"))
+    for name, server_args in VARIANTS:
+        rate, grown, stored, join_time, join_bytes = run_variant(server_args, args.port, args.rooms, args.messages,
+                                                                 args.joins)
+        print("%-10s %12.0f %12d %14d %10.2f %12.0f" % (name, rate, grown // 1024, stored // 1024, join_time * 1000,
+                                                       join_bytes))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+"""
+Cost of recording the 21 point game results and of the leaderboard with many rounds
+
+Usage: python bench/bench_leaderboard.py [-n 100000,1000000] [-p PLAYERS] [-b BATCH]
+
+For every number of rounds a fresh database gets that many random results, written in batches
+of BATCH like the writer thread does. Then the leaderboard is loaded the way the server starts,
+from the per-player summary table, and compared with aggregating the results table. The in-memory
+index is filled with the same rounds to time a win, $leaderboard 10 and $rank.
+"""
+import argparse
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import Leaderboard
+import PlayerDatabase
+
+AGGREGATE = "SELECT winner, COUNT(*), MAX(value) FROM game_results GROUP BY winner"
+
+
+def bench_rounds(num_rounds, num_players, batch):
+    tmp = tempfile.mkdtemp()
+    database = PlayerDatabase.PlayerDatabase(os.path.join(tmp, 'leaderboard.db'), flush_interval=3600)
+    database.open()
+    names = ['player%d' % i for i in range(num_players)]
+    rounds = [(random.choice(names), float(random.choice((21, 21, 20, 19, 18)))) for i in range(num_rounds)]
+    try:
+        start = time.time()
+        for i, (name, value) in enumerate(rounds):
+            database.add_result('room%d' % (i % 1000), name, '(1+2)*(3+4)', value, start)
+            if (i + 1) % batch == 0:
+                database.flush_now()
+        database.flush_now()
+        write = (time.time() - start) / num_rounds
+        conn = database.thread_conn()
+        start = time.time()
+        leaderboard = Leaderboard.Leaderboard()
+        leaderboard.load(database.load_leaderboard())
+        load = time.time() - start
+        start = time.time()
+        conn.execute(AGGREGATE).fetchall()
+        aggregate = time.time() - start
+    finally:
+        database.close()
+        shutil.rmtree(tmp)
+    index = Leaderboard.Leaderboard()
+    start = time.time()
+    for name, value in rounds:
+        index.add_win(name, value)
+    win = (time.time() - start) / num_rounds
+    start = time.time()
+    for i in range(1000):
+        index.top(10)
+    top = (time.time() - start) / 1000
+    start = time.time()
+    for name in names[:1000]:
+        index.rank(name)
+    rank = (time.time() - start) / min(1000, len(names))
+    return write, load, aggregate, win, top, rank
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Leaderboard benchmark")
+    parser.add_argument("-n", "--rounds", default="100000,1000000", help="Comma separated numbers of rounds")
+    parser.add_argument("-p", "--players", type=int, default=100000, help="Number of distinct winners")
+    parser.add_argument("-b", "--batch", type=int, default=1000, help="Results written per transaction")
+    args = parser.parse_args()
+    print("%9s %12s %12s %14s %10s %10s %10s" % ("rounds", "write(us)", "load(ms)", "aggregate(ms)", "win(us)",
+                                                 "top10(us)", "rank(us)"))
+    for n in [int(x) for x in args.rounds.split(',')]:
+        write, load, aggregate, win, top, rank = bench_rounds(n, args.players, args.batch)
+        print("%9d %12.2f %12.1f %14.1f %10.2f %10.2f %10.2f" % (n, write * 1e6, load * 1000, aggregate * 1000,
+                                                                 win * 1e6, top * 1e6, rank * 1e6))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,140 @@
+"""
+Login storm benchmark, chat latency of the players already online while thousands of clients log in
+
+Usage: python bench/bench_login_storm.py [-n LOGINS] [-i HASH_ITERATIONS] [-t AUTH_THREADS] [-a]
+
+The database is seeded with LOGINS accounts, then a pinger player sends private chats to itself
+while all the clients send $login at once. The latency of the pings is reported before and during
+the storm, with the default pool the pings keep flowing while the passwords are hashed.
+"""
+import argparse
+import os
+import resource
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+import AuthWorkerPool
+import PlayerDatabase
+import Poller
+from bench_shards import read_until
+
+
+def seed_database(dbname, num_users, iterations):
+    db = PlayerDatabase.PlayerDatabase(dbname)
+    db.open()
+    stored = AuthWorkerPool.hash_password('pw', iterations)  # the same salt for every account is fine here
+    conn = db.thread_conn()
+    with conn:
+        conn.executemany(PlayerDatabase.INSERT_USER, [('storm%d' % i, stored, 0) for i in range(num_users)] +
+                         [('pinger', stored, 0)])
+    db.close()
+
+
+def pinger(port, stop_event, samples):
+    """
+    Send a private chat to itself every 10ms, record (send time, round trip) of each one
+    """
+    s = socket.create_connection(('127.0.0.1', port))
+    s.sendall(b'$login pinger pw\n')
+    read_until(s, b'Login success')
+    n = 0
+    while not stop_event.is_set():
+        token = ('ping%d' % n).encode()
+        start = time.time()
+        s.sendall(b'$chat@pinger ' + token + b'\n')
+        if token not in read_until(s, token):
+            break
+        samples.append((start, time.time() - start))
+        n += 1
+        time.sleep(0.01)
+    s.close()
+
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+def report(name, values):
+    print("%-8s %8d %10.2f %10.2f %10.2f" % (name, len(values), percentile(values, 0.5) * 1e3,
+                                             percentile(values, 0.99) * 1e3, max(values or [0]) * 1e3))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Login storm benchmark")
+    parser.add_argument("-n", "--logins", type=int, default=10000, help="Number of clients logging in at once")
+    parser.add_argument("-i", "--hash_iterations", type=int, default=10000, help="PBKDF2 iterations of the accounts")
+    parser.add_argument("-t", "--auth_threads", type=int, default=4, help="Auth worker threads of the server")
+    parser.add_argument("-a", "--asyncio", action="store_true", help="Benchmark the asyncio server")
+    parser.add_argument("-p", "--port", type=int, default=37100, help="Server port")
+    args = parser.parse_args()
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))  # inherited by the server
+    if args.logins + 100 > hard:
+        parser.error("the fd limit %d is too low for %d logins" % (hard, args.logins))
+
+    db = os.path.join(tempfile.mkdtemp(), 'storm.db')
+    seed_database(db, args.logins, args.hash_iterations)
+    server_args = ['-p', str(args.port), '-n', db, '-d', '1000', '-u', str(args.logins + 100),
+                   '-t', str(args.auth_threads), '-i', str(args.hash_iterations)]
+    if args.asyncio:
+        server_args.append('-a')
+    server = subprocess.Popen([sys.executable, 'GameHallServer.py'] + server_args, cwd=ROOT,
+                              stdout=open(os.devnull, 'w'))
+    time.sleep(1.0)
+    try:
+        stop_event = threading.Event()
+        samples = []
+        ping_thread = threading.Thread(target=pinger, args=(args.port, stop_event, samples))
+        ping_thread.start()
+        time.sleep(2.0)
+        clients = []
+        for i in range(args.logins):
+            clients.append(socket.create_connection(('127.0.0.1', args.port)))
+        poller = Poller.create_poller()
+        received = {}
+        for s in clients:
+            s.setblocking(0)
+            poller.register(s)
+            received[s] = b''
+        storm_start = time.time()
+        for i, s in enumerate(clients):
+            s.sendall(('$login storm%d pw\n' % i).encode())
+        done = 0
+        while done < len(clients) and time.time() - storm_start < 600:
+            readable, writable, error = poller.poll(1.0)
+            for s in readable:
+                try:
+                    chunk = s.recv(4096)
+                except socket.error:
+                    continue
+                received[s] += chunk
+                if not chunk or b'Login success' in received[s]:
+                    poller.unregister(s)
+                    done += 1
+        storm_end = time.time()
+        time.sleep(1.0)
+        stop_event.set()
+        ping_thread.join()
+        for s in clients:
+            s.close()
+    finally:
+        server.terminate()
+        server.wait()
+
+    print("%d logins in %.2f seconds (%.0f logins/second), %d hash iterations, %d auth threads" % (
+        done, storm_end - storm_start, done / (storm_end - storm_start), args.hash_iterations, args.auth_threads))
+    print("%-8s %8s %10s %10s %10s" % ("chat", "pings", "p50(ms)", "p99(ms)", "max(ms)"))
+    report("before", [rtt for start, rtt in samples if start < storm_start])
+    report("storm", [rtt for start, rtt in samples if storm_start <= start < storm_end])
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+"""
+Memory used by the server for each connection
+
+Usage: python bench/bench_memory.py [-n CONNECTIONS] [--server-args "-a"]
+
+The resident memory of a fresh server is read from /proc before and after opening CONNECTIONS
+connections that stay silent (idle), after all of them log in and stay in the hall (logged in),
+and after each of them sent a chat and a partial command (active).
+"""
+import argparse
+import os
+import resource
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from bench_shards import ROOT
+
+
+def rss_bytes(pid):
+    with open('/proc/%d/status' % pid) as f:
+        for line in f:
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1]) * 1024
+    return 0
+
+
+def settle(socks, seconds=1.0):
+    """
+    Wait for the server to handle everything, dropping whatever it sent
+    """
+    deadline = time.time() + seconds
+    while time.time() < deadline:
+        for s in socks:
+            try:
+                while s.recv(65536):
+                    pass
+            except socket.error:
+                pass
+        time.sleep(0.1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Per connection memory benchmark")
+    parser.add_argument("-n", "--connections", type=int, default=5000, help="Number of connections")
+    parser.add_argument("-p", "--port", type=int, default=37300, help="Server port")
+    parser.add_argument("--server-args", default="", help="Extra options of the server")
+    args = parser.parse_args()
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))  # inherited by the server
+    if args.connections + 100 > hard:
+        parser.error("the fd limit %d is too low for %d connections" % (hard, args.connections))
+
+    db = os.path.join(tempfile.mkdtemp(), 'memory.db')
+    server = subprocess.Popen([sys.executable, 'GameHallServer.py', '-p', str(args.port), '-n', db, '-d', '1000',
+                               '-u', str(args.connections + 100), '-i', '1000'] + args.server_args.split(),
+                              cwd=ROOT, stdout=open(os.devnull, 'w'))
+    time.sleep(1.5)
+    try:
+        base = rss_bytes(server.pid)
+        socks = []
+        for i in range(args.connections):
+            s = socket.create_connection(('127.0.0.1', args.port))
+            s.setblocking(0)
+            socks.append(s)
+        settle(socks)
+        idle = rss_bytes(server.pid)
+        for i, s in enumerate(socks):
+            s.sendall(('$register mem%d pw\n' % i).encode())
+        settle(socks, 3.0)
+        logged_in = rss_bytes(server.pid)
+        for i, s in enumerate(socks):
+            s.sendall(('$chat@mem%d hello\n$chat' % ((i + 1) % len(socks))).encode())  # the last command is unfinished
+        settle(socks)
+        active = rss_bytes(server.pid)
+    finally:
+        server.terminate()
+        server.wait()
+    n = float(args.connections)
+    print("%d connections, server rss %.1f MB before" % (args.connections, base / 1e6))
+    print("%-10s %12s %14s" % ("state", "rss(MB)", "bytes/conn"))
+    for name, rss in (("idle", idle), ("logged in", logged_in), ("active", active)):
+        print("%-10s %12.1f %14.0f" % (name, rss / 1e6, (rss - base) / n))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,65 @@
+"""
+Throughput of one connection sending commands one at a time or pipelined with request ids (python 3)
+
+Usage: python3 bench/bench_pipeline.py [-n COMMANDS] [-w 1,16,256] [--server-args "-a"]
+
+A server is started with a fresh database, a GameHallClient logs in and sends COMMANDS
+$online_time with at most WINDOW of them in flight, in the text and the binary protocol. A window
+of 1 is the round trip per command that untagged replies force on a client.
+"""
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from GameHallClient import GameHallClient
+from bench_shards import ROOT
+
+
+async def run_window(port, protocol, name, num_commands, window):
+    client = GameHallClient('127.0.0.1', port, protocol)
+    await client.connect()
+    reply = await client.request('$register %s pw' % name)
+    if 'success' not in reply:
+        raise RuntimeError(reply)
+    slots = asyncio.Semaphore(window)
+
+    async def one():
+        async with slots:
+            await client.request('$online_time')
+    start = time.time()
+    await asyncio.gather(*[one() for i in range(num_commands)])
+    elapsed = time.time() - start
+    await client.close()
+    return num_commands / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pipelined commands benchmark")
+    parser.add_argument("-n", "--commands", type=int, default=20000, help="Commands per measure")
+    parser.add_argument("-w", "--windows", default="1,16,256", help="Comma separated numbers of commands in flight")
+    parser.add_argument("-p", "--port", type=int, default=37500, help="Server port")
+    parser.add_argument("--server-args", default="", help="Extra options of the server")
+    args = parser.parse_args()
+    db = os.path.join(tempfile.mkdtemp(), 'pipeline.db')
+    server = subprocess.Popen([sys.executable, 'GameHallServer.py', '-p', str(args.port), '-n', db, '-i', '1000']
+                              + args.server_args.split(), cwd=ROOT, stdout=open(os.devnull, 'w'))
+    time.sleep(1.5)
+    try:
+        print("%-8s %8s %14s" % ("protocol", "window", "commands/s"))
+        k = 0
+        for protocol in (None, 'binary'):
+            for window in [int(x) for x in args.windows.split(',')]:
+                k += 1
+                rate = asyncio.run(run_window(args.port, protocol, 'pipe%d' % k, args.commands, window))
+                print("%-8s %8d %14.0f" % (protocol or 'text', window, rate))
+    finally:
+        server.terminate()
+        server.wait()
+
+if __name__ == '__main__':
+    main()
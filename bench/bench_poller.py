@@ -0,0 +1,93 @@
+"""
+Measure the cost of one event loop iteration for each readiness backend
+
+Usage: python bench/bench_poller.py [-n 1000,10000,50000] [-a ACTIVE] [-i ITERATIONS]
+
+Every connection is one end of a socketpair, both ends are registered in the poller so n
+connections take n descriptors, and ACTIVE of them have one pending byte, which is the usual shape
+of a hall full of idle players. select only takes descriptors below FD_SETSIZE (1024), it is
+measured at the counts where every descriptor fits, 1000 included, and skipped above.
+"""
+import argparse
+import os
+import socket
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import Poller
+
+FD_SETSIZE = 1024  # select.select raises ValueError for a larger fd
+
+
+class Conn:
+    def __init__(self, sock):
+        self.sock = sock
+
+    def fileno(self):
+        return self.sock.fileno()
+
+
+def raise_fd_limit(wanted):
+    try:
+        import resource
+        soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+        if hard != resource.RLIM_INFINITY:
+            wanted = min(wanted, hard)
+        if soft < wanted:
+            resource.setrlimit(resource.RLIMIT_NOFILE, (wanted, hard))
+        return resource.getrlimit(resource.RLIMIT_NOFILE)[0]
+    except (ImportError, ValueError):
+        return None
+
+
+def bench_backend(backend, pairs, active, iterations):
+    poller = Poller.create_poller(backend)
+    try:
+        for a, b in pairs:
+            poller.register(Conn(a))
+            poller.register(Conn(b))
+        for a, b in pairs[:active]:
+            b.send(b'x')
+        poller.poll(0)  # warm up
+        start = time.time()
+        for i in range(iterations):
+            poller.poll(0)
+        return (time.time() - start) / iterations
+    finally:
+        poller.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Event loop cost per iteration benchmark")
+    parser.add_argument("-n", "--connections", default="1000,10000,50000", help="Comma separated connection counts")
+    parser.add_argument("-a", "--active", type=int, default=10, help="Number of connections with pending input")
+    parser.add_argument("-i", "--iterations", type=int, default=200, help="Iterations per measurement")
+    args = parser.parse_args()
+    counts = [int(x) for x in args.connections.split(',')]
+    fd_limit = raise_fd_limit(max(counts) + 64)
+    backends = ['select'] + (['epoll'] if hasattr(Poller.select, 'epoll') else [])
+    print("%-12s %-8s %s" % ("connections", "backend", "usec/iteration"))
+    for n in counts:
+        if fd_limit is not None and n + 64 > fd_limit:
+            print("%-12d %-8s skipped (fd limit %d)" % (n, '-', fd_limit))
+            continue
+        pairs = [socket.socketpair() for i in range((n + 1) // 2)]
+        highest = max(s.fileno() for pair in pairs for s in pair)
+        try:
+            for backend in backends:
+                if backend == 'select' and highest >= FD_SETSIZE:
+                    print("%-12d %-8s skipped (fd %d, select takes fds below %d)" % (n, backend, highest, FD_SETSIZE))
+                    continue
+                try:
+                    cost = bench_backend(backend, pairs, min(args.active, n), args.iterations)
+                    print("%-12d %-8s %.1f" % (n, backend, cost * 1e6))
+                except ValueError as e:  # select can not handle fds above FD_SETSIZE
+                    print("%-12d %-8s unsupported (%s)" % (n, backend, e))
+        finally:
+            for a, b in pairs:
+                a.close()
+                b.close()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,102 @@
+"""
+Compare the text protocol with the binary protocol, plain and zlib compressed
+
+Usage: python bench/bench_protocol.py [-n PLAYERS] [-r ROOMS] [-i ITERATIONS]
+
+The players are socketpairs logged in to a GameHall that is not running, all of them speaking the
+protocol under test. For each command the table shows the bytes sent by the client, the bytes
+written by the server for all the recipients, and the server time from the received bytes to the
+end of the batched write. The room directory is changed before every $rooms, so the listing is
+rendered each time instead of coming from the page cache.
+"""
+import argparse
+import os
+import random
+import socket
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import BinaryProtocol
+import GameHallServer
+import Poller
+from bench_fanout import raise_fd_limit
+
+LONG_TEXT = ' '.join(random.choice(('the', 'game', 'hall', 'room', 'point', 'answer', 'winner', 'players', 'round',
+                                    'twenty', 'one', 'next', 'time')) for i in range(100))
+COMMANDS = (('chatall', '$chatall hello everyone'),
+            ('chatall long', '$chatall ' + LONG_TEXT),
+            ('private', '$chat@player1 are you there'),
+            ('online_time', '$online_time'),
+            ('rooms', '$rooms page 2 sort players'))
+
+
+def bench_protocol(protocol, num_players, num_rooms, iterations):
+    hall = GameHallServer.GameHall('', 0, 10, ':memory:', 30, 15)
+    hall.poller = Poller.create_poller()
+    peers = []
+    for i in range(num_players):
+        a, b = socket.socketpair()
+        b.setblocking(0)
+        peers.append(b)
+        hall.handle_new_player(a)
+        player = hall.all_socks[-1]
+        if protocol != 'text':
+            hall.dispatch_lines(player, [('$protocol ' + protocol).encode('ascii')])
+        hall.complete_login(player, 'player%d' % i)
+    for i in range(num_rooms):
+        hall.room_directory.update('room%d' % i, random.randint(1, 20))
+    hall.flush_dirty_players()
+    speaker = hall.all_socks[0]
+
+    def drain():
+        for b in peers:
+            try:
+                while b.recv(65536):
+                    pass
+            except socket.error:
+                pass
+    drain()
+    res = []
+    for kind, command in COMMANDS:
+        if protocol == 'text':
+            data = (command + '\n').encode('utf-8')
+        else:
+            data = BinaryProtocol.encode_command(command)
+        sent = hall.bytes_sent.value
+        total = 0.0
+        for i in range(iterations):
+            hall.room_directory.update('room%d' % random.randrange(num_rooms), random.randint(1, 20))
+            start = time.time()
+            hall.dispatch_lines(speaker, speaker.framer.feed(bytearray(data)))
+            hall.flush_dirty_players()
+            total += time.time() - start
+            if i % 10 == 9:
+                drain()
+        drain()
+        res.append((kind, len(data), (hall.bytes_sent.value - sent) / float(iterations), total / iterations))
+    for b in peers:
+        b.close()
+    for p in hall.all_socks:
+        p.sock.close()
+    return res
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Text and binary protocol benchmark")
+    parser.add_argument("-n", "--players", type=int, default=200, help="Number of players")
+    parser.add_argument("-r", "--rooms", type=int, default=1000, help="Number of rooms in the directory")
+    parser.add_argument("-i", "--iterations", type=int, default=200, help="Commands per measurement")
+    args = parser.parse_args()
+    raise_fd_limit(args.players * 2 + 64)
+    results = dict((protocol, bench_protocol(protocol, args.players, args.rooms, args.iterations))
+                   for protocol in ('text', 'binary', 'zlib'))
+    print("%d players, %d rooms" % (args.players, args.rooms))
+    print("%-13s %-8s %10s %12s %12s" % ("command", "protocol", "bytes in", "bytes out", "us/command"))
+    for i, (kind, command) in enumerate(COMMANDS):
+        for protocol in ('text', 'binary', 'zlib'):
+            kind, size_in, size_out, seconds = results[protocol][i]
+            print("%-13s %-8s %10d %12.0f %12.1f" % (kind, protocol, size_in, size_out, seconds * 1e6))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+"""
+Replay a traffic capture into a game hall and report the time spent handling it
+
+Usage: python bench/bench_replay.py CAPTURE [-s SPEED] [-n DBNAME] [-T RATE_LIMITS] [-g RESUME_GRACE]
+                                     [-i HASH_ITERATIONS]
+
+The capture is recorded by a server started with -C CAPTURE. The replay runs in this process on
+a VirtualClock, so the 21 point game rounds, idle timeouts and rate limits happen at the captured
+times whatever the speed. The handler CPU time covers the game hall code, the password checks are
+reported apart. The checksum of the replies is the same for two builds that answered the same,
+compare it before comparing the times. The accounts are created in a copy of DBNAME, or in an
+empty database if none is given.
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import GameHallServer
+import RateLimiter
+import TrafficCapture
+
+
+def replay(path, speed, dbname, rate_limits, resume_grace, hash_iterations):
+    tmp = tempfile.mkdtemp()
+    db = os.path.join(tmp, 'replay.db')
+    if dbname:
+        shutil.copy(dbname, db)
+    reader = TrafficCapture.CaptureReader(path)
+    hall = GameHallServer.GameHall('', 0, 1000, db, 1, 30, hash_iterations=hash_iterations,
+                                   rate_limits=RateLimiter.parse_limits(rate_limits), flush_interval=3600,
+                                   resume_grace=resume_grace, resume_secret=b'replay', clock=TrafficCapture.VirtualClock(reader.start))
+    try:
+        r = TrafficCapture.Replay(hall, reader, speed)
+        start = time.time()
+        r.run()
+        wall = time.time() - start
+    finally:
+        reader.close()
+        hall.database.close()
+        shutil.rmtree(tmp)
+    return r, hall, wall
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Traffic capture replay")
+    parser.add_argument("capture", help="File written by a server started with -C")
+    parser.add_argument("-s", "--speed", type=float, default=0, help="Times the captured pace, 0 means as fast as possible(default: 0)")
+    parser.add_argument("-n", "--dbname", help="Player database copied before the replay, for the accounts created before the capture")
+    parser.add_argument("-T", "--rate_limits", default='none', help="Rate limits of the captured server(default: none)")
+    parser.add_argument("-g", "--resume_grace", type=int, default=0, help="Resume grace of the captured server(default: 0)")
+    parser.add_argument("-i", "--hash_iterations", type=int, default=1000, help="PBKDF2 iterations of the new accounts(default: 1000)")
+    args = parser.parse_args()
+    r, hall, wall = replay(args.capture, args.speed, args.dbname, args.rate_limits, args.resume_grace,
+                         args.hash_iterations)
+    print("events %d, connections %d, captured %.1f s, replayed in %.2f s" % (
+        r.events, len(r.sockets), r.clock.now - r.reader.start, wall))
+    print("handler cpu %.3f s, auth cpu %.3f s, sent %d bytes, checksum %08x" % (
+        r.handler_time, r.auth_time, r.bytes_sent(), r.checksum()))
+    print(hall.dispatcher.format_stats())
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,119 @@
+"""
+Measure a zero-downtime restart of a server with many connected players
+
+Usage: python bench/bench_restart.py [-n 100,1000,5000] [-r PLAYERS_PER_ROOM]
+
+For every player count a server is started with a handoff socket, the players log in and join
+rooms, then a second server is started with the same options and takes the connections over.
+A probe connection sends $online_time in a loop during the restart, its slowest answer is the
+downtime seen by a player. The startup and pause columns are reported by the new server: the
+time from its start to serving, and the time the old server stopped serving before that. At the
+end every player sends a command, all of them must answer.
+"""
+import argparse
+import os
+import re
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from bench_fanout import raise_fd_limit
+from bench_shards import ROOT
+
+
+def read_until(sock, token, timeout=10.0):
+    """
+    Blocking read, select can not watch the thousands of descriptors of the players
+    """
+    data = b''
+    sock.settimeout(timeout)
+    try:
+        while token not in data:
+            chunk = sock.recv(65536)
+            if not chunk:
+                break
+            data += chunk
+    except socket.error:
+        pass
+    return data
+
+
+def probe(port, stop, latencies):
+    s = socket.create_connection(('127.0.0.1', port))
+    s.sendall(b'$register probe pw\n')
+    read_until(s, b'success')
+    while not stop.is_set():
+        start = time.time()
+        s.sendall(b'$online_time\n')
+        if b'Online time' not in read_until(s, b'Online time'):
+            break
+        latencies.append(time.time() - start)
+        time.sleep(0.001)
+    s.close()
+
+
+def bench_restart(num_players, per_room, port):
+    tmp = tempfile.mkdtemp()
+    command = [sys.executable, '-u', 'GameHallServer.py', '-p', str(port), '-n', os.path.join(tmp, 'restart.db'),
+               '-i', '1000', '-U', os.path.join(tmp, 'handoff.sock')]
+    old = subprocess.Popen(command, cwd=ROOT, stdout=subprocess.PIPE)
+    new = None
+    socks = []
+    try:
+        old.stdout.readline()
+        socks = [socket.create_connection(('127.0.0.1', port)) for i in range(num_players)]
+        for i, s in enumerate(socks):
+            s.sendall(('$register bench%d pw\n' % i).encode())
+        for i, s in enumerate(socks):
+            read_until(s, b'success')
+            room = 'room%d' % (i // per_room)
+            s.sendall(('$build %s\n' % room if i % per_room == 0 else '$join %s\n' % room).encode())
+        for s in socks:
+            read_until(s, b'\n')
+        stop = threading.Event()
+        latencies = []
+        prober = threading.Thread(target=probe, args=(port, stop, latencies))
+        prober.start()
+        time.sleep(0.5)
+        start = time.time()
+        new = subprocess.Popen(command, cwd=ROOT, stdout=subprocess.PIPE)
+        line = new.stdout.readline().decode()
+        old.wait()
+        restart = time.time() - start
+        time.sleep(0.5)
+        stop.set()
+        prober.join()
+        for s in socks:
+            s.sendall(b'$online_time\n')
+        alive = sum(1 for s in socks if b'Online time' in read_until(s, b'Online time', 5.0))
+    finally:
+        for server in (old, new):
+            if server is not None and server.poll() is None:
+                server.terminate()
+                server.wait()
+        for s in socks:
+            s.close()
+    match = re.search(r'([\d.]+) ms without serving, started in ([\d.]+) ms', line)
+    pause, startup = (float(x) for x in match.groups()) if match else (float('nan'), float('nan'))
+    return restart, startup, pause, max(latencies or [0]), alive
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Zero-downtime restart benchmark")
+    parser.add_argument("-n", "--players", default="100,1000,5000", help="Comma separated numbers of players")
+    parser.add_argument("-r", "--per_room", type=int, default=10, help="Players per room")
+    parser.add_argument("-p", "--port", type=int, default=37600, help="Server port")
+    args = parser.parse_args()
+    counts = [int(x) for x in args.players.split(',')]
+    raise_fd_limit(max(counts) * 2 + 64)
+    print("%8s %12s %12s %10s %16s %8s" % ("players", "restart(ms)", "startup(ms)", "pause(ms)", "slowest reply(ms)",
+                                           "alive"))
+    for n in counts:
+        restart, startup, pause, slowest, alive = bench_restart(n, args.per_room, args.port)
+        print("%8d %12.1f %12.1f %10.1f %16.1f %8d" % (n, restart * 1000, startup, pause, slowest * 1000, alive))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,127 @@
+"""
+Reconnect storm benchmark, every player of a full server drops and comes back at once
+
+Usage: python bench/bench_resume.py [-n PLAYERS] [-r ROOM_SIZE] [-i HASH_ITERATIONS] [-a]
+
+PLAYERS accounts log in and fill rooms of ROOM_SIZE players. Then all the connections are closed
+and opened again, first coming back with the $resume token of the session, then dropped again and
+coming back with $login and $join like a client without tokens. The table shows how long the storm
+took and the bytes each client read until its reply: a resume checks no password, queries no
+database and broadcasts nothing to the room.
+"""
+import argparse
+import os
+import re
+import resource
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+import Poller
+from bench_login_storm import seed_database
+
+TOKEN = re.compile(br'Resume token: (\S+)')
+
+
+def connect(port, num):
+    return [socket.create_connection(('127.0.0.1', port)) for i in range(num)]
+
+
+def storm(clients, commands, marker):
+    """
+    Send its commands to every client at once, return the seconds until each one read marker and
+    what each one read
+    """
+    poller = Poller.create_poller()
+    received = {}
+    for s in clients:
+        s.setblocking(0)
+        poller.register(s)
+        received[s] = b''
+    start = time.time()
+    for s, command in zip(clients, commands):
+        s.sendall(command)
+    done = 0
+    while done < len(clients) and time.time() - start < 600:
+        readable, writable, error = poller.poll(1.0)
+        for s in readable:
+            try:
+                chunk = s.recv(65536)
+            except socket.error:
+                continue
+            received[s] += chunk
+            if not chunk or marker in received[s]:
+                poller.unregister(s)
+                done += 1
+    elapsed = time.time() - start
+    poller.close()
+    for s in clients:
+        s.setblocking(1)
+    return elapsed, [received[s] for s in clients]
+
+
+def report(name, elapsed, replies):
+    done = sum(1 for data in replies if b'Online time' in data)
+    print("%-8s %8d %10.2f %12.0f %12.0f" % (name, done, elapsed, done / elapsed,
+                                             sum(len(data) for data in replies) / float(len(replies))))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Reconnect storm benchmark")
+    parser.add_argument("-n", "--players", type=int, default=2000, help="Players reconnecting at once")
+    parser.add_argument("-r", "--room_size", type=int, default=4, help="Players in each room")
+    parser.add_argument("-i", "--hash_iterations", type=int, default=10000, help="PBKDF2 iterations of the accounts")
+    parser.add_argument("-a", "--asyncio", action="store_true", help="Benchmark the asyncio server")
+    parser.add_argument("-p", "--port", type=int, default=38100, help="Server port")
+    args = parser.parse_args()
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))  # inherited by the server
+    if 2 * args.players + 100 > hard:
+        parser.error("the fd limit %d is too low for %d players" % (hard, args.players))
+
+    db = os.path.join(tempfile.mkdtemp(), 'resume.db')
+    seed_database(db, args.players, args.hash_iterations)
+    server_args = ['-p', str(args.port), '-n', db, '-d', '1000', '-u', str(args.players + 100),
+                   '-i', str(args.hash_iterations), '-T', 'none', '-g', '600']
+    if args.asyncio:
+        server_args.append('-a')
+    server = subprocess.Popen([sys.executable, 'GameHallServer.py'] + server_args, cwd=ROOT,
+                              stdout=open(os.devnull, 'w'))
+    time.sleep(1.0)
+    names = ['storm%d' % i for i in range(args.players)]
+    rooms = ['room%d' % (i // args.room_size) for i in range(args.players)]
+    try:
+        clients = connect(args.port, args.players)
+        tokens = [None] * args.players
+        for builders in (True, False):  # the first player of each room builds it, the others join
+            indexes = [i for i in range(args.players) if (i % args.room_size == 0) == builders]
+            commands = [('$login %s pw\n%s %s\n$online_time\n' % (names[i], '$build' if builders else '$join',
+                                                                  rooms[i])).encode() for i in indexes]
+            elapsed, replies = storm([clients[i] for i in indexes], commands, b'Online time')
+            for i, data in zip(indexes, replies):
+                tokens[i] = TOKEN.search(data).group(1)
+        print("%-8s %8s %10s %12s %12s" % ("mode", "players", "seconds", "players/s", "bytes/player"))
+        for mode in ('resume', 'login'):
+            for s in clients:
+                s.close()
+            time.sleep(1.0)  # the server sees every disconnect before the storm
+            clients = connect(args.port, args.players)
+            if mode == 'resume':
+                commands = [b'$resume ' + token + b'\n$online_time\n' for token in tokens]
+            else:
+                commands = [('$login %s pw\n$join %s\n$online_time\n' % (names[i], rooms[i])).encode()
+                            for i in range(args.players)]
+            elapsed, replies = storm(clients, commands, b'Online time')
+            report(mode, elapsed, replies)
+        for s in clients:
+            s.close()
+    finally:
+        server.terminate()
+        server.wait()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,63 @@
+"""
+Measure the cost of $rooms and of the room directory updates for many rooms
+
+Usage: python bench/bench_rooms.py [-n 1000,10000,100000] [-i ITERATIONS]
+
+The room directory is filled with rooms of random occupancy, then each listing is rendered with
+the page cache emptied by a room update before every call, the worst case of a busy server. The
+full listing column is what the old $rooms built for every call.
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import RoomDirectory
+
+
+def bench_rooms(num_rooms, iterations):
+    directory = RoomDirectory.RoomDirectory()
+    names = ['room%d' % i for i in range(num_rooms)]
+    start = time.time()
+    for name in names:
+        directory.update(name, random.randint(1, 20))
+    build = (time.time() - start) / num_rooms
+
+    def churn():  # a player joins or leaves a random room, this empties the page cache
+        name = random.choice(names)
+        directory.update(name, max(1, directory.players[name] + random.choice((-1, 1))))
+
+    res = [num_rooms, build]
+    last_page = (num_rooms + directory.page_size - 1) // directory.page_size
+    for page, prefix, sort in ((1, '', 'name'), (last_page, '', 'name'), (last_page // 2, '', 'players'),
+                               (1, 'room1', 'players')):
+        total = 0.0
+        for i in range(iterations):
+            churn()
+            start = time.time()
+            directory.render(page, prefix, sort)
+            total += time.time() - start
+        res.append(total / iterations)
+    start = time.time()
+    for i in range(iterations):
+        b''.join(directory.lines[name] for name in directory.names)
+    res.append((time.time() - start) / iterations)
+    return res
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Room directory benchmark")
+    parser.add_argument("-n", "--rooms", default="1000,10000,100000", help="Comma separated numbers of rooms")
+    parser.add_argument("-i", "--iterations", type=int, default=200, help="Listings per measure")
+    args = parser.parse_args()
+    print("%8s %10s %10s %10s %12s %14s %12s" % ("rooms", "update(us)", "first(us)", "last(us)",
+                                                 "players(us)", "prefix+sort(us)", "full(us)"))
+    for n in [int(x) for x in args.rooms.split(',')]:
+        res = bench_rooms(n, args.iterations)
+        print("%8d %10.2f %10.1f %10.1f %12.1f %14.1f %12.1f" % (res[0], res[1] * 1e6, res[2] * 1e6, res[3] * 1e6,
+                                                                res[4] * 1e6, res[5] * 1e6, res[6] * 1e6))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,131 @@
+"""
+Chat-heavy throughput benchmark of the single process and the sharded multi-core server
+
+Usage: python bench/bench_shards.py [-w 1,2,4] [-c CLIENTS] [-r ROOMS] [-m MESSAGES] [-j CLIENT_PROCESSES]
+
+For every worker count a fresh server is started, the clients are spread over ROOMS rooms and
+each of them sends MESSAGES room chats. The reported rate counts delivered chat lines.
+"""
+import argparse
+import multiprocessing
+import os
+import select
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+
+def read_until(sock, token, timeout=10.0):
+    data = b''
+    deadline = time.time() + timeout
+    while token not in data and time.time() < deadline:
+        r, w, e = select.select([sock], [], [], 0.1)
+        if r:
+            chunk = sock.recv(65536)
+            if not chunk:
+                break
+            data += chunk
+    return data
+
+
+def client_group(port, client_ids, rooms, messages, join_event, chat_event, result_queue):
+    socks = {}
+    for i in client_ids:
+        s = socket.create_connection(('127.0.0.1', port))
+        s.sendall(('$register bench%d pw\n' % i).encode())
+        read_until(s, b'success')
+        socks[i] = s
+    for i, s in socks.items():  # the first client of each room builds it
+        if i < rooms:
+            s.sendall(('$build room%d\n' % i).encode())
+            read_until(s, b'success')
+    result_queue.put(('ready', 0))
+    join_event.wait()
+    for i, s in socks.items():
+        if i >= rooms:
+            s.sendall(('$join room%d\n' % (i % rooms)).encode())
+    time.sleep(1.0)
+    result_queue.put(('joined', 0))
+    chat_event.wait()
+    payload = b''.join(b'$chat benchmsg ' + str(n).encode() + b'\n' for n in range(messages))
+    for s in socks.values():
+        s.setblocking(0)
+    pending = dict((s, payload) for s in socks.values())
+    received = 0
+    idle_since = time.time()
+    while time.time() - idle_since < 2.0:
+        r, w, e = select.select(list(socks.values()), [s for s in pending if pending[s]], [], 0.2)
+        for s in w:
+            try:
+                sent = s.send(pending[s])
+                pending[s] = pending[s][sent:]
+            except socket.error:
+                pass
+        for s in r:
+            try:
+                chunk = s.recv(65536)
+            except socket.error:
+                continue
+            received += chunk.count(b'benchmsg')
+            idle_since = time.time()
+        if w:
+            idle_since = time.time()
+    result_queue.put(('received', received))
+
+
+def run_once(server_args, port, clients, rooms, messages, processes):
+    """
+    Start a server with the extra server_args and run the chat load, return (delivered lines, seconds)
+    """
+    db = os.path.join(tempfile.mkdtemp(), 'bench.db')
+    server = subprocess.Popen([sys.executable, 'GameHallServer.py', '-p', str(port), '-n', db, '-d', '1000', '-T', 'none']
+                              + server_args, cwd=ROOT, stdout=open(os.devnull, 'w'))  # the chat flood is the load
+    time.sleep(1.0)
+    try:
+        join_event = multiprocessing.Event()
+        chat_event = multiprocessing.Event()
+        result_queue = multiprocessing.Queue()
+        groups = [list(range(clients))[k::processes] for k in range(processes)]
+        procs = [multiprocessing.Process(target=client_group,
+                                         args=(port, g, rooms, messages, join_event, chat_event, result_queue))
+                 for g in groups]
+        for p in procs:
+            p.start()
+        for p in procs:
+            result_queue.get()
+        join_event.set()
+        for p in procs:
+            result_queue.get()
+        chat_event.set()
+        start = time.time()
+        received = sum(result_queue.get()[1] for p in procs)
+        elapsed = time.time() - start - 2.0  # minus the idle detection delay
+        for p in procs:
+            p.join()
+        return received, max(elapsed, 1e-6)
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sharded server throughput benchmark")
+    parser.add_argument("-w", "--workers", default="1,2,4", help="Comma separated worker counts")
+    parser.add_argument("-c", "--clients", type=int, default=200, help="Number of clients")
+    parser.add_argument("-r", "--rooms", type=int, default=20, help="Number of rooms")
+    parser.add_argument("-m", "--messages", type=int, default=200, help="Chat messages sent by every client")
+    parser.add_argument("-j", "--processes", type=int, default=4, help="Client processes")
+    args = parser.parse_args()
+    print("cpu count: %d" % multiprocessing.cpu_count())
+    print("%-8s %12s %10s %14s" % ("workers", "delivered", "seconds", "lines/second"))
+    for workers in [int(x) for x in args.workers.split(',')]:
+        received, elapsed = run_once(['-c', str(workers)], 37000 + workers, args.clients, args.rooms, args.messages,
+                                     args.processes)
+        print("%-8d %12d %10.2f %14.0f" % (workers, received, elapsed, received / elapsed))
+
+if __name__ == '__main__':
+    main()
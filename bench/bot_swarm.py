@@ -0,0 +1,322 @@
+"""
+Headless bot swarm, scripted players generating a configurable command mix against a local server
+
+Usage: python3 bench/bot_swarm.py [-n BOTS] [-j PROCESSES] [-t SECONDS] [-r RATE] [--mix chat=30,...]
+                                  [--rooms ROOMS] [--server-args "-a"] [--port PORT --no-server]
+
+Every process runs its share of the bots on one asyncio loop. A bot registers, then picks a command
+from the mix RATE times per second until the end of the run:
+
+    chat      $chat in the hall or the current room
+    chatall   $chatall
+    private   $chat@ a random bot
+    room      $join a random room ($build it if it does not exist), or $leave when in a room
+    21game    $21game with the numbers of the current round
+
+Chat messages carry their send time, so their latency is measured end to end on every delivery.
+The other commands are measured from the send to the reply, $leave and $21game do not always
+reply and are followed by $online_time whose answer marks their end. By default a server is
+started with a fresh database and cheap password hashing, any extra server option is passed with
+--server-args.
+"""
+import argparse
+import asyncio
+import collections
+import math
+import multiprocessing
+import os
+import random
+import re
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+DEFAULT_MIX = 'chat=30,chatall=5,private=25,room=20,21game=20'
+CHAT_KINDS = ('chat', 'chatall', 'private')
+TOKEN_RE = re.compile(r'~(\w+)~(\d+\.\d+)~')
+GAME_RE = re.compile(r'21 point game: (\d+) (\d+) (\d+) (\d+)\(')
+
+
+class Histogram:
+    """
+    Latency histogram with logarithmic buckets, about 2% precision from 1us to minutes. A percentile
+    is interpolated inside its bucket and never exceeds the largest latency recorded
+    """
+    BASE = 1.02
+
+    def __init__(self):
+        self.buckets = collections.Counter()
+        self.count = 0
+        self.max = 0.0
+
+    def add(self, seconds):
+        self.buckets[int(math.log(max(seconds, 1e-6) * 1e6, self.BASE))] += 1
+        self.count += 1
+        self.max = max(self.max, seconds)
+
+    def merge(self, other):
+        self.buckets.update(other.buckets)
+        self.count += other.count
+        self.max = max(self.max, other.max)
+
+    def percentile(self, p):
+        if not self.count:
+            return 0.0
+        rank = self.count * p
+        seen = 0
+        for bucket in sorted(self.buckets):
+            num = self.buckets[bucket]
+            seen += num
+            if seen >= rank:
+                fraction = (rank - (seen - num)) / num  # the bucket is spread evenly on the log scale
+                return min(self.BASE ** (bucket + fraction) / 1e6, self.max)
+        return self.max
+
+
+class Stats:
+    def __init__(self):
+        self.sent = collections.Counter()  # commands sent by kind
+        self.latency = collections.defaultdict(Histogram)  # latency by kind
+
+    def merge(self, other):
+        self.sent.update(other.sent)
+        for kind, hist in other.latency.items():
+            self.latency[kind].merge(hist)
+
+
+class Expectation:
+    def __init__(self, kind, predicate, future):
+        self.kind = kind
+        self.start = time.time()
+        self.predicate = predicate  # called with each reply line, True when the command is done
+        self.future = future
+
+
+class Bot:
+    def __init__(self, swarm, index):
+        self.swarm = swarm
+        self.name = '%s%d' % (swarm.prefix, index)
+        self.reader = None
+        self.writer = None
+        self.pending = collections.deque()  # commands waiting for their reply, in order
+        self.room = None
+        self.game_number = None
+
+    async def connect(self):
+        self.reader, self.writer = await asyncio.open_connection('127.0.0.1', self.swarm.port, limit=1 << 20)
+        self.reader_task = asyncio.ensure_future(self.read_loop())
+        line = await self.request('register', '$register %s pw' % self.name,
+                                  lambda l: 'success' in l or 'already exist' in l)
+        if 'already exist' in line:  # left over by a previous run against the same server
+            await self.request('login', '$login %s pw' % self.name, lambda l: 'Login success' in l)
+
+    async def read_loop(self):
+        while True:
+            line = await self.reader.readline()
+            if not line:
+                break
+            self.handle_line(line.decode('utf-8', 'replace'))
+
+    def handle_line(self, line):
+        if line == '$ping\n':  # heartbeat of the server
+            self.writer.write(b'$pong\n')
+            return
+        m = TOKEN_RE.search(line)
+        if m:  # a chat delivered to this bot
+            self.swarm.stats.latency[m.group(1)].add(time.time() - float(m.group(2)))
+            return
+        m = GAME_RE.match(line)
+        if m:
+            self.game_number = [int(x) for x in m.groups()]
+        if self.pending and self.pending[0].predicate(line):
+            e = self.pending.popleft()
+            self.swarm.stats.latency[e.kind].add(time.time() - e.start)
+            e.future.set_result(line)
+
+    def send(self, kind, command):
+        self.swarm.stats.sent[kind] += 1
+        self.writer.write((command + '\n').encode('utf-8'))
+
+    def request(self, kind, command, predicate):
+        """
+        Send a command, the returned future gets the reply line accepted by predicate
+        """
+        future = asyncio.get_event_loop().create_future()
+        self.pending.append(Expectation(kind, predicate, future))
+        self.send(kind, command)
+        return future
+
+    def token(self, kind):
+        return '~%s~%.6f~' % (kind, time.time())
+
+    async def step(self, kind):
+        if kind == 'chat':
+            self.send(kind, '$chat hello ' + self.token(kind))
+        elif kind == 'chatall':
+            self.send(kind, '$chatall hello all ' + self.token(kind))
+        elif kind == 'private':
+            other = '%s%d' % (self.swarm.prefix, random.randrange(self.swarm.num_bots))
+            self.send(kind, '$chat@%s psst %s' % (other, self.token(kind)))
+        elif kind == 'room':
+            if self.room is None:
+                await self.enter_room('room%d' % random.randrange(self.swarm.rooms))
+            else:
+                self.room = None
+                await self.request_then_sync('leave', '$leave')
+        elif kind == '21game':
+            numbers = list(self.game_number or [1, 2, 3, 4])
+            random.shuffle(numbers)
+            await self.request_then_sync('21game', '$21game (%d+%d)*(%d-%d)' % tuple(numbers))
+
+    async def enter_room(self, room):
+        me = self.name
+        line = await self.request('join', '$join ' + room,
+                                  lambda l: l.startswith('Welcome to room %s, %s\n' % (room, me))
+                                  or 'does not exist' in l or 'already in room' in l)
+        if 'does not exist' in line:
+            line = await self.request('build', '$build ' + room,
+                                      lambda l: l.startswith('Build room') or 'already exist' in l)
+            if 'success' not in line:
+                return
+        self.room = room
+
+    def request_then_sync(self, kind, command):
+        """
+        For commands that may not reply, $online_time is sent right after and its answer ends the command
+        """
+        self.swarm.stats.sent[kind] += 1
+        future = asyncio.get_event_loop().create_future()
+        self.pending.append(Expectation(kind, lambda l: l.startswith('Online time:'), future))
+        self.writer.write((command + '\n$online_time\n').encode('utf-8'))
+        return future
+
+    async def run(self, deadline):
+        weights = self.swarm.weights
+        await asyncio.sleep(random.random() / self.swarm.rate)  # do not start in lock step
+        while time.time() < deadline:
+            start = time.time()
+            kind = weighted_choice(weights)
+            await asyncio.wait_for(self.step(kind), timeout=30.0)
+            await asyncio.sleep(max(0.0, random.expovariate(self.swarm.rate) - (time.time() - start)))
+
+    def close(self):
+        self.reader_task.cancel()
+        self.writer.close()
+
+
+def weighted_choice(weights):
+    r = random.random() * sum(w for kind, w in weights)
+    for kind, w in weights:
+        r -= w
+        if r < 0:
+            return kind
+    return weights[-1][0]
+
+
+class Swarm:
+    def __init__(self, port, prefix, num_bots, rooms, rate, weights):
+        self.port = port
+        self.prefix = prefix
+        self.num_bots = num_bots
+        self.rooms = rooms
+        self.rate = rate  # commands per second of each bot
+        self.weights = weights
+        self.stats = Stats()
+
+    async def run(self, indexes, ready, start_event, seconds):
+        bots = [Bot(self, i) for i in indexes]
+        for k in range(0, len(bots), 100):  # do not overflow the listen backlog
+            await asyncio.gather(*[bot.connect() for bot in bots[k:k + 100]])
+        ready()
+        loop = asyncio.get_event_loop()
+        await loop.run_in_executor(None, start_event.wait)
+        deadline = time.time() + seconds
+        results = await asyncio.gather(*[bot.run(deadline) for bot in bots], return_exceptions=True)
+        await asyncio.sleep(1.0)  # let the last deliveries arrive
+        for bot in bots:
+            bot.close()
+        return sum(1 for r in results if isinstance(r, Exception))
+
+
+def swarm_process(args, indexes, prefix, weights, ready_queue, start_event, result_queue):
+    swarm = Swarm(args.port, prefix, args.bots, args.rooms, args.rate, weights)
+    errors = asyncio.run(swarm.run(indexes, lambda: ready_queue.put(True), start_event, args.seconds))
+    result_queue.put((swarm.stats, errors))
+
+
+def parse_mix(mix):
+    weights = []
+    for item in mix.split(','):
+        kind, weight = item.split('=')
+        if kind not in CHAT_KINDS + ('room', '21game'):
+            raise ValueError("Unknown command type in the mix: %s" % kind)
+        weights.append((kind, float(weight)))
+    return weights
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bot swarm load generator")
+    parser.add_argument("-n", "--bots", type=int, default=1000, help="Number of bots")
+    parser.add_argument("-j", "--processes", type=int, default=2, help="Bot processes")
+    parser.add_argument("-t", "--seconds", type=float, default=20.0, help="Duration of the run")
+    parser.add_argument("-r", "--rate", type=float, default=1.0, help="Commands per second of each bot")
+    parser.add_argument("--rooms", type=int, default=50, help="Number of room names the bots join")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="Command weights(default: %s)" % DEFAULT_MIX)
+    parser.add_argument("--port", type=int, default=37200, help="Server port")
+    parser.add_argument("--no-server", action="store_true", help="Use a server already listening on --port")
+    parser.add_argument("--server-args", default="", help="Extra options of the started server")
+    args = parser.parse_args()
+    weights = parse_mix(args.mix)
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))  # inherited by the server and the bots
+
+    server = None
+    if not args.no_server:
+        db = os.path.join(tempfile.mkdtemp(), 'swarm.db')
+        server = subprocess.Popen([sys.executable, 'GameHallServer.py', '-p', str(args.port), '-n', db,
+                                   '-u', str(args.bots + 100), '-i', '1000'] + args.server_args.split(),
+                                  cwd=ROOT, stdout=open(os.devnull, 'w'))
+        time.sleep(1.0)
+    try:
+        prefix = 'bot%x_' % (int(time.time()) % 0xffff)
+        ready_queue = multiprocessing.Queue()
+        result_queue = multiprocessing.Queue()
+        start_event = multiprocessing.Event()
+        procs = [multiprocessing.Process(target=swarm_process,
+                                         args=(args, list(range(args.bots))[k::args.processes], prefix, weights,
+                                               ready_queue, start_event, result_queue))
+                 for k in range(args.processes)]
+        for p in procs:
+            p.start()
+        for p in procs:
+            ready_queue.get()
+        start_event.set()
+        stats = Stats()
+        errors = 0
+        for p in procs:
+            process_stats, process_errors = result_queue.get()
+            stats.merge(process_stats)
+            errors += process_errors
+        for p in procs:
+            p.join()
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+    print("%d bots, %d processes, %.0f seconds, %.1f commands/second per bot, %d bots failed" % (
+        args.bots, args.processes, args.seconds, args.rate, errors))
+    print("percentiles from a histogram of 2% wide buckets, max is exact")
+    print("%-8s %10s %12s %10s %10s %10s %10s %10s" % ("command", "sent", "samples", "per sec", "~p50(ms)",
+                                                        "~p99(ms)", "~p999(ms)", "max(ms)"))
+    for kind in sorted(set(stats.sent) | set(stats.latency)):
+        hist = stats.latency.get(kind, Histogram())
+        print("%-8s %10d %12d %10.0f %10.2f %10.2f %10.2f %10.2f" % (
+            kind, stats.sent[kind], hist.count, stats.sent[kind] / args.seconds, hist.percentile(0.5) * 1e3,
+            hist.percentile(0.99) * 1e3, hist.percentile(0.999) * 1e3, hist.max * 1e3))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+import hashlib
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import AuthWorkerPool
+
+
+class FakeDatabase:
+    def __init__(self, users):
+        self.users = users
+
+    def get_user(self, username):
+        if username not in self.users:
+            return None
+        return self.users[username], 0
+
+    def set_password(self, username, encrypt_password):
+        self.users[username] = encrypt_password
+
+
+class VerifyPasswordTest(unittest.TestCase):
+    def test_pbkdf2_hash(self):
+        stored = AuthWorkerPool.hash_password('secret', 10)
+        self.assertEqual(AuthWorkerPool.verify_password('secret', stored), (True, False))
+        self.assertEqual(AuthWorkerPool.verify_password('wrong', stored), (False, False))
+
+    def test_legacy_sha256_hash_needs_rehash(self):
+        stored = hashlib.sha256(b'secret').hexdigest()
+        self.assertEqual(AuthWorkerPool.verify_password('secret', stored), (True, True))
+
+    def test_malformed_hash_matches_nothing(self):
+        for stored in ('pbkdf2_sha256$', 'pbkdf2_sha256$ten$salt$00', 'pbkdf2_sha256$10$salt', 'pbkdf2_sha256$0$s$00'):
+            self.assertEqual(AuthWorkerPool.verify_password('secret', stored), (False, False))
+
+
+class AuthWorkerPoolTest(unittest.TestCase):
+    def setUp(self):
+        self.database = FakeDatabase({'alice': AuthWorkerPool.hash_password('pw', 10),
+                                      'bob': hashlib.sha256(b'pw').hexdigest()})
+        self.pool = AuthWorkerPool.AuthWorkerPool(self.database, 0, 10)
+        self.pool.notify = lambda: None
+        self.results = []
+
+    def run_login(self, username, password):
+        self.pool.login(username, password, self.results.append)
+        self.pool.run_pending()
+        self.pool.run_completions()
+        return self.results.pop()
+
+    def test_login(self):
+        self.assertIsNone(self.run_login('alice', 'pw'))
+        self.assertEqual(self.run_login('alice', 'bad'), "Invalid password\n")
+        self.assertEqual(self.run_login('carol', 'pw'), "Player carol doesn't exist\n")
+
+    def test_legacy_hash_is_upgraded(self):
+        self.assertIsNone(self.run_login('bob', 'pw'))
+        self.assertTrue(self.database.users['bob'].startswith('pbkdf2_sha256$10$'))
+
+    def test_online_time(self):
+        self.pool.online_time('alice', self.results.append)
+        self.pool.online_time('carol', self.results.append)
+        self.pool.run_pending()
+        self.pool.run_completions()
+        self.assertEqual(self.results, [0, 0])
+        self.database.get_user = lambda username: ('hash', 42)
+        self.pool.online_time('alice', self.results.append)
+        self.pool.run_pending()
+        self.pool.run_completions()
+        self.assertEqual(self.results[-1], 42)
+
+    def test_failing_job_still_answers(self):
+        def get_user(username):
+            raise KeyError(username)
+        self.database.get_user = get_user
+        stderr, sys.stderr = sys.stderr, open(os.devnull, 'w')  # the traceback of get_user
+        try:
+            result = self.run_login('alice', 'pw')
+        finally:
+            sys.stderr.close()
+            sys.stderr = stderr
+        self.assertEqual(result, "Server error, try again later\n")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,100 @@
+import os
+import sys
+import unittest
+import zlib
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import BinaryProtocol
+from BinaryProtocol import BinaryFramer
+
+
+class BinaryFramerTest(unittest.TestCase):
+    def setUp(self):
+        self.framer = BinaryFramer(300)
+
+    def feed(self, data):
+        return self.framer.feed(bytearray(data))
+
+    def test_short_and_long_frames(self):
+        short = BinaryProtocol.build_frame(BinaryProtocol.OPCODES['$chat'], b'hi')
+        long = BinaryProtocol.build_frame(BinaryProtocol.OPCODES['$chatall'], b'x' * 200)
+        self.assertEqual(len(short), 2 + 2)
+        self.assertEqual(len(long), 5 + 200)
+        self.assertEqual(self.feed(short + long), [(BinaryProtocol.OPCODES['$chat'], b'hi', None),
+                                                   (BinaryProtocol.OPCODES['$chatall'], b'x' * 200, None)])
+
+    def test_request_id(self):
+        frame = BinaryProtocol.encode_command('$join r1', 7)
+        self.assertEqual(self.feed(frame), [(BinaryProtocol.OPCODES['$join'], b'r1', 7)])
+
+    def test_frame_split_over_segments(self):
+        frame = BinaryProtocol.build_frame(BinaryProtocol.OPCODES['$chatall'], b'y' * 200, 3)
+        for i in range(len(frame) - 1):
+            self.assertEqual(self.feed(frame[i:i + 1]), [])
+        self.assertEqual(self.framer.pending_size(), len(frame) - 1)
+        self.assertEqual(self.feed(frame[-1:]), [(BinaryProtocol.OPCODES['$chatall'], b'y' * 200, 3)])
+        self.assertEqual(self.framer.pending_data(), b'')
+
+    def test_oversized_frame_is_skipped(self):
+        big = BinaryProtocol.build_frame(BinaryProtocol.OPCODES['$chatall'], b'z' * 1000)
+        after = BinaryProtocol.encode_command('$help')
+        self.assertEqual(self.feed(big[:100]), [None])
+        self.assertEqual(self.framer.pending_size(), 0)  # the payload is skipped, not buffered
+        self.assertEqual(self.feed(big[100:] + after), [(BinaryProtocol.OPCODES['$help'], b'', None)])
+
+    def test_compressed_frames(self):
+        payload = b'hello ' * 40
+        frame = BinaryProtocol.build_frame(BinaryProtocol.OPCODES['$chatall'] | BinaryProtocol.FLAG_COMPRESSED,
+                                           zlib.compress(payload))
+        self.assertEqual(self.feed(frame), [(BinaryProtocol.OPCODES['$chatall'], payload, None)])
+        bomb = BinaryProtocol.build_frame(BinaryProtocol.OPCODES['$chatall'] | BinaryProtocol.FLAG_COMPRESSED,
+                                          zlib.compress(b'a' * 100000))
+        self.assertEqual(self.feed(bomb), [None])  # over max_len once decompressed
+        broken = BinaryProtocol.build_frame(BinaryProtocol.OPCODES['$chat'] | BinaryProtocol.FLAG_COMPRESSED,
+                                            b'not zlib')
+        self.assertEqual(self.feed(broken), [None])
+
+    def test_join_lines_and_heartbeat(self):
+        frames = self.feed(BinaryProtocol.encode_command('$pong') + BinaryProtocol.encode_command('$rooms', 9))
+        self.assertTrue(BinaryFramer.is_heartbeat(frames[0]))
+        self.assertFalse(BinaryFramer.is_heartbeat(frames[1]))
+        self.assertEqual(BinaryFramer(300).feed(bytearray(BinaryFramer.join_lines(frames + [None]))), frames)
+
+
+class CodecTest(unittest.TestCase):
+    def test_encode_command_fields(self):
+        framer = BinaryFramer()
+        data = b''.join(BinaryProtocol.encode_command(line) for line in
+                        ('$login bob pw', '$chat@alice  hello there', '$chatall hi all', '$21game 1+2'))
+        self.assertEqual(framer.feed(bytearray(data)), [
+            (BinaryProtocol.OPCODES['$login'], b'bob\0pw', None),
+            (BinaryProtocol.OPCODES['$chat@'], b'alice\0hello there', None),
+            (BinaryProtocol.OPCODES['$chatall'], b'hi all', None),
+            (BinaryProtocol.OPCODES['$21game'], b'1+2', None)])
+        self.assertIsNone(BinaryProtocol.encode_command('$nothing'))
+        self.assertIsNone(BinaryProtocol.encode_command('  '))
+
+    def test_zlib_codec_only_compresses_what_shrinks(self):
+        codec = BinaryProtocol.CODECS['zlib']
+        self.assertEqual(codec.encode(BinaryProtocol.OP_PUSH, b'short'), (BinaryProtocol.OP_PUSH, b'short'))
+        opcode, payload = codec.encode(BinaryProtocol.OP_PUSH, b'a' * 1000)
+        self.assertEqual(opcode, BinaryProtocol.OP_PUSH | BinaryProtocol.FLAG_COMPRESSED)
+        self.assertEqual(zlib.decompress(payload), b'a' * 1000)
+        random_bytes = os.urandom(1000)
+        self.assertEqual(codec.encode(BinaryProtocol.OP_PUSH, random_bytes), (BinaryProtocol.OP_PUSH, random_bytes))
+        self.assertEqual(BinaryProtocol.CODECS['binary'].encode(BinaryProtocol.OP_PUSH, b'a' * 1000)[0],
+                         BinaryProtocol.OP_PUSH)
+
+    def test_decode_text(self):
+        rooms = BinaryProtocol.encode_rooms(2, 1, 1, [BinaryProtocol.encode_room(b'r1', 3),
+                                                      BinaryProtocol.encode_room(b'r2', 1)])
+        self.assertEqual(BinaryProtocol.decode_text(BinaryProtocol.OP_ROOMS, rooms),
+                         "Num of rooms: 2, page 1/1\nr1(3 players)\nr2(1 players)\n")
+        online = BinaryProtocol.ONLINE_TIME.pack(BinaryProtocol.ONLINE_HISTORY, 42)
+        self.assertEqual(BinaryProtocol.decode_text(BinaryProtocol.OP_ONLINE_TIME, online),
+                         "History online time: 42 seconds\n")
+        self.assertEqual(BinaryProtocol.decode_text(BinaryProtocol.OP_DONE, b''), "")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,53 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import ChatHistory
+
+
+class ChatHistoryTest(unittest.TestCase):
+    def test_ring_keeps_the_last_lines(self):
+        history = ChatHistory.ChatHistory(max_lines=3)
+        for i in range(5):
+            history.record(('hall',), b'msg%d\n' % i)
+        self.assertEqual(history.replay(('hall',)), b'msg2\nmsg3\nmsg4\n')
+        self.assertEqual(history.size, 15)
+        self.assertEqual(history.replay(('room', 'r1')), b'')
+
+    def test_disabled(self):
+        history = ChatHistory.ChatHistory(max_lines=0)
+        history.record(('hall',), b'hello\n')
+        self.assertEqual(history.replay(('hall',)), b'')
+        self.assertEqual(len(history), 0)
+
+    def test_least_recently_active_channels_go_first(self):
+        history = ChatHistory.ChatHistory(max_lines=10, max_bytes=72)
+        history.record(('room', 'idle'), b'x' * 20)
+        history.record(('room', 'busy'), b'y' * 20)
+        history.record(('hall',), b'z' * 20)
+        history.record(('room', 'busy'), b'y' * 20)  # 80 bytes, evicted down to 63
+        self.assertEqual(history.replay(('room', 'idle')), b'')
+        self.assertEqual(history.replay(('room', 'busy')), b'y' * 40)
+        self.assertEqual(history.replay(('hall',)), b'z' * 20)
+        self.assertEqual(history.size, 60)
+
+    def test_one_channel_over_the_budget_is_trimmed(self):
+        history = ChatHistory.ChatHistory(max_lines=10, max_bytes=50)
+        for i in range(4):
+            history.record(('hall',), b'%d' % i * 20)
+        self.assertEqual(history.replay(('hall',)), b'2' * 20 + b'3' * 20)
+        self.assertEqual(history.size, 40)
+
+    def test_drop(self):
+        history = ChatHistory.ChatHistory()
+        history.record(('room', 'r1'), b'hello\n')
+        history.record(('hall',), b'hi\n')
+        history.drop(('room', 'r1'))
+        history.drop(('room', 'r2'))
+        self.assertEqual(len(history), 1)
+        self.assertEqual(history.size, 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,79 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import CommandDispatcher
+
+
+class FakePlayer:
+    def __init__(self, logged_in):
+        self.logged_in = logged_in
+
+    def is_already_login(self):
+        return self.logged_in
+
+
+class CommandDispatcherTest(unittest.TestCase):
+    def setUp(self):
+        self.calls = []
+        self.dispatcher = CommandDispatcher.CommandDispatcher(
+            lambda player: self.calls.append('not logged in'), lambda player: self.calls.append('wrong'))
+        d = self.dispatcher
+        d.register('$help', lambda player, msg, args: self.calls.append(('help', args)), login_required=False)
+        d.register('$join', lambda player, msg, args: self.calls.append(('join', args)), arity=1)
+        d.register('$rooms', lambda player, msg, args: self.calls.append(('rooms', args)), arity=(0, 2))
+        d.register('$chat', lambda player, msg, args: self.calls.append(('chat', msg)), arity=None, rate_class='chat')
+        d.register('$chat@', lambda player, msg, args: self.calls.append(('private', msg)), arity=None, prefix=True)
+        self.player = FakePlayer(True)
+
+    def dispatch(self, msg, player=None):
+        self.dispatcher.dispatch(player or self.player, msg, msg.split())
+        return self.calls.pop()
+
+    def test_lookup_by_name_and_prefix(self):
+        self.assertEqual(self.dispatch('$help'), ('help', []))
+        self.assertEqual(self.dispatch('$chat hi there'), ('chat', '$chat hi there'))
+        self.assertEqual(self.dispatch('$chat@bob hi'), ('private', '$chat@bob hi'))
+        self.assertEqual(self.dispatch('$chat@ hi'), ('private', '$chat@ hi'))  # answered as an unknown player
+        self.assertEqual(self.dispatch('$nothing'), 'wrong')
+        self.assertEqual(self.dispatch('@bob'), 'wrong')
+
+    def test_arity(self):
+        self.assertEqual(self.dispatch('$join r1'), ('join', ['r1']))
+        self.assertEqual(self.dispatch('$join'), 'wrong')
+        self.assertEqual(self.dispatch('$join r1 r2'), 'wrong')
+        self.assertEqual(self.dispatch('$rooms page 2'), ('rooms', ['page', '2']))
+        self.assertEqual(self.dispatch('$rooms a b c'), 'wrong')
+        self.assertEqual(self.dispatch('$help me'), 'wrong')
+
+    def test_login_required(self):
+        guest = FakePlayer(False)
+        self.assertEqual(self.dispatch('$join r1', guest), 'not logged in')
+        self.assertEqual(self.dispatch('$help', guest), ('help', []))
+
+    def test_admit_only_sees_rate_limited_commands(self):
+        admitted = []
+
+        def admit(player, command):
+            admitted.append(command.name)
+            return False
+        self.dispatcher.admit = admit
+        self.dispatch('$join r1')
+        self.dispatcher.dispatch(self.player, '$chat hi', ['$chat', 'hi'])
+        self.assertEqual(admitted, ['$chat'])
+        self.assertEqual(self.calls, [])
+
+    def test_stats(self):
+        self.dispatch('$help')
+        self.dispatch('$help')
+        self.dispatch('$join r1')
+        stats = dict((name, calls) for name, calls, total_time in self.dispatcher.get_stats())
+        self.assertEqual(stats['$help'], 2)
+        self.assertEqual(stats['$join'], 1)
+        self.assertEqual(stats['$chat@'], 0)
+        self.assertIn('$help', self.dispatcher.format_stats())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,68 @@
+import fractions
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from ExpressionEvaluator import ExpressionError, ExpressionEvaluator
+
+
+class ExpressionEvaluatorTest(unittest.TestCase):
+    def setUp(self):
+        self.evaluator = ExpressionEvaluator()
+
+    def reason(self, text):
+        try:
+            self.evaluator.evaluate(text)
+        except ExpressionError as e:
+            return e.reason
+        self.fail("%r was accepted" % text)
+
+    def test_value_and_numbers(self):
+        self.assertEqual(self.evaluator.evaluate('(1 + 2) * 3 + 4'), (13, (1, 2, 3, 4)))
+        self.assertEqual(self.evaluator.evaluate('2*3+4*4-1'), (21, (1, 2, 3, 4, 4)))
+
+    def test_division_is_exact(self):
+        value, numbers = self.evaluator.evaluate('10/4')
+        self.assertEqual(value, fractions.Fraction(5, 2))
+        self.assertEqual(self.evaluator.evaluate('8/(3-8/3)')[0], 24)
+
+    def test_unary_minus_and_precedence(self):
+        self.assertEqual(self.evaluator.evaluate('-2*-3')[0], 6)
+        self.assertEqual(self.evaluator.evaluate('1-2-3')[0], -4)
+        self.assertEqual(self.evaluator.evaluate('2+3*4')[0], 14)
+
+    def test_rejects_other_symbols(self):
+        for text in ('__import__("os")', '1.5+1', 'a+1', '1e3'):
+            self.assertEqual(self.reason(text), 'symbol', text)
+
+    def test_rejects_bad_syntax(self):
+        for text in ('', '1+', '(1+2', '1+2)', '()', '2**10'):
+            self.assertEqual(self.reason(text), 'syntax', text)
+
+    def test_rejects_division_by_zero(self):
+        self.assertEqual(self.reason('1/(2-2)'), 'zero')
+
+    def test_limits(self):
+        self.assertEqual(self.reason('999*999'), 'complex')  # max_digits
+        self.assertEqual(self.reason('+'.join(['1'] * 40)), 'complex')  # max_length
+        self.assertEqual(self.reason('(' * 17 + '1' + ')' * 17), 'complex')  # max_depth
+        self.assertEqual(self.reason('-' * 17 + '1'), 'complex')
+        self.assertEqual(self.evaluator.evaluate('(' * 16 + '1' + ')' * 16)[0], 1)
+
+    def test_results_and_errors_are_cached(self):
+        self.evaluator.evaluate('1 + 2')
+        self.reason('1/0')
+        self.assertIn('1+2', self.evaluator.cache)
+        self.assertIsInstance(self.evaluator.cache['1/0'], ExpressionError)
+        self.assertEqual(self.reason('1 / 0'), 'zero')
+
+    def test_cache_is_bounded(self):
+        evaluator = ExpressionEvaluator(cache_size=4)
+        for i in range(10):
+            evaluator.evaluate('%d+1' % i)
+        self.assertLessEqual(len(evaluator.cache), 4)
+
+
+if __name__ == '__main__':
+    unittest.main()
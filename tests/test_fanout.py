@@ -0,0 +1,73 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import BinaryProtocol
+import Fanout
+
+
+class FakePlayer:
+    def __init__(self, name, protocol=None):
+        self.name = name
+        self.protocol = protocol
+
+
+class CountingCodec(BinaryProtocol.Codec):
+    def __init__(self, name, compress):
+        BinaryProtocol.Codec.__init__(self, name, compress)
+        self.pushes = 0
+
+    def push(self, data):
+        self.pushes += 1
+        return BinaryProtocol.Codec.push(self, data)
+
+
+class FanoutTest(unittest.TestCase):
+    def setUp(self):
+        self.queued = []
+        self.fanout = Fanout.Fanout(lambda player, data: self.queued.append((player.name, data)), None)
+
+    def test_message_is_encoded_once(self):
+        players = [FakePlayer('p%d' % i) for i in range(3)]
+        for player in players:
+            self.fanout.hall.add(player)
+        data = self.fanout.publish(self.fanout.hall, u'hello \u4e16\u754c\n', except_player=players[0])
+        self.assertEqual(sorted(name for name, sent in self.queued), ['p1', 'p2'])
+        self.assertTrue(all(sent is data for name, sent in self.queued))
+        self.assertEqual(data, u'hello \u4e16\u754c\n'.encode('utf-8'))
+
+    def test_binary_players_get_one_frame_per_protocol(self):
+        binary = CountingCodec('binary', False)
+        zlib = CountingCodec('zlib', True)
+        channel = Fanout.Channel('room r1')
+        for player in (FakePlayer('text'), FakePlayer('b1', binary), FakePlayer('b2', binary), FakePlayer('z1', zlib)):
+            channel.add(player)
+        self.fanout.publish(channel, 'x' * 300 + '\n')
+        self.assertEqual((binary.pushes, zlib.pushes), (1, 1))
+        sent = dict(self.queued)
+        self.assertEqual(sent['text'], b'x' * 300 + b'\n')
+        self.assertIs(sent['b1'], sent['b2'])
+        frames = BinaryProtocol.BinaryFramer(1000).feed(bytearray(sent['z1']))
+        self.assertEqual(frames, [(BinaryProtocol.OP_PUSH, b'x' * 300 + b'\n', None)])
+
+    def test_channel(self):
+        channel = Fanout.Channel('hall')
+        player = FakePlayer('p')
+        channel.add(player)
+        channel.add(player)
+        self.assertIn(player, channel)
+        self.assertEqual(len(channel), 1)
+        channel.remove(player)
+        channel.remove(player)
+        self.assertEqual(list(channel), [])
+
+    def test_conversions(self):
+        self.assertEqual(Fanout.to_bytes('abc'), b'abc')
+        self.assertEqual(Fanout.to_bytes(b'abc'), b'abc')
+        self.assertEqual(Fanout.to_str(b'abc'), 'abc')
+        self.assertIsInstance(Fanout.to_str(b'\xff'), str)  # never raises
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,157 @@
+import os
+import re
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import GameHallServer
+import Player
+import TrafficCapture
+
+TOKEN = re.compile(br'Resume token: (\S+)')
+
+
+class RecordingSocket(TrafficCapture.ReplaySocket):
+    def __init__(self):
+        TrafficCapture.ReplaySocket.__init__(self)
+        self.received = b''
+
+    def send(self, data):
+        self.received += bytes(data)
+        return TrafficCapture.ReplaySocket.send(self, data)
+
+
+class HallTestCase(unittest.TestCase):
+    """
+    A hall on a virtual clock, created with the options of the test case
+    """
+    options = {}
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.clock = TrafficCapture.VirtualClock(1000.0)
+        self.previous_clock = Player.set_clock(self.clock.monotonic)
+        self.hall = GameHallServer.GameHall('', 0, 10, os.path.join(self.tmp, 'hall.db'), 1, 30,
+                                            hash_iterations=1, flush_interval=3600, clock=self.clock,
+                                            **self.options)
+        self.hall.check_and_create_user_login_table()
+        self.hall.poller = TrafficCapture.ReplayPoller()
+        self.hall.auth_pool.notify = lambda: None
+
+    def tearDown(self):
+        Player.set_clock(self.previous_clock)
+        self.hall.database.close()
+        shutil.rmtree(self.tmp)
+
+    def connect(self):
+        sock = RecordingSocket()
+        return sock, self.hall.handle_new_player(sock)
+
+    def send(self, player, data):
+        hall = self.hall
+        hall.recv_buffer[:len(data)] = data
+        hall.handle_received_data(player, len(data))
+        while hall.auth_pool.run_pending():  # a job may hold commands that queue other jobs
+            hall.auth_pool.run_completions()
+        hall.flush_dirty_players()
+
+    def wait(self, seconds):
+        for i in range(seconds):
+            self.clock.now += 1
+            self.hall.scheduler.run_due()
+            self.hall.flush_dirty_players()
+
+
+class IdleTimeoutTest(HallTestCase):
+    options = {'login_timeout': 60, 'hall_timeout': 0, 'room_timeout': 30}
+
+    def test_connection_not_logged_in_is_closed(self):
+        sock, player = self.connect()
+        self.wait(59)
+        self.assertFalse(player.closed)
+        self.wait(2)
+        self.assertTrue(player.closed)
+        self.assertIn(b"Disconnected after 60 seconds of inactivity\n", sock.received)
+
+    def test_timeout_follows_hall_room_and_logout(self):
+        sock, player = self.connect()
+        self.send(player, b'$register alice pw\n')
+        self.assertTrue(player.is_already_login())
+        self.wait(300)  # the game hall has no timeout
+        self.assertFalse(player.closed)
+        self.send(player, b'$build r1\n')
+        self.wait(20)
+        self.send(player, b'$leave\n')
+        self.wait(100)
+        self.assertFalse(player.closed)
+        self.send(player, b'$join r2\n')  # no such room, still in the game hall
+        self.send(player, b'$build r2\n')
+        self.wait(29)
+        self.assertFalse(player.closed)
+        self.send(player, b'$logout\n')
+        self.wait(59)
+        self.assertFalse(player.closed)
+        self.wait(2)
+        self.assertTrue(player.closed)
+
+    def test_player_idle_in_a_room_is_closed(self):
+        sock, player = self.connect()
+        self.send(player, b'$register bob pw\n')
+        self.wait(100)
+        self.send(player, b'$build r1\n')
+        self.wait(29)
+        self.assertFalse(player.closed)
+        self.wait(2)
+        self.assertTrue(player.closed)
+        self.assertIn(b"Disconnected after 30 seconds of inactivity\n", sock.received)
+        self.assertEqual(len(self.hall.idle_wheel), 0)
+
+
+
+class HistoryOnlineTimeTest(HallTestCase):
+    def test_history_online_time_is_read_off_the_loop(self):
+        sock, player = self.connect()
+        self.send(player, b'$register carol pw\n')
+        self.wait(5)
+        self.send(player, b'$logout\n$login carol pw\n#7 $history_online_time\n')
+        self.assertTrue(sock.received.endswith(b"#7 History online time: 5 seconds\n#7 $done\n"))
+
+
+class ResumeTest(HallTestCase):
+    options = {'resume_grace': 10, 'resume_secret': b'test'}
+
+    def setUp(self):
+        HallTestCase.setUp(self)
+        self.alice_sock, self.alice = self.connect()
+        self.send(self.alice, b'$register alice pw\n$build r1\n')
+        self.token = TOKEN.search(self.alice_sock.received).group(1)
+        self.bob_sock, self.bob = self.connect()
+        self.send(self.bob, b'$register bob pw\n$join r1\n')
+        self.hall.handle_player_disconnect(self.alice)
+        self.bob_sock.received = b''
+
+    def test_resume_within_the_grace(self):
+        self.wait(9)
+        sock, player = self.connect()
+        self.send(player, b'$resume ' + self.token + b'\n')
+        self.assertIn(b"Resume success, you are now in room r1\n", sock.received)
+        self.assertEqual(self.hall.room_map['r1'].num_of_players(), 2)
+        self.assertNotIn(b"left", self.bob_sock.received)
+        sock, player = self.connect()
+        self.send(player, b'$resume ' + self.token + b'\n')  # a token is used once
+        self.assertIn(b"The session of this token is over, login again\n", sock.received)
+
+    def test_session_expires_after_the_grace(self):
+        self.wait(11)
+        self.assertIn(b"Player alice has already left the room\n", self.bob_sock.received)
+        self.assertNotIn('alice', self.hall.player_map)
+        sock, player = self.connect()
+        self.send(player, b'$resume ' + self.token + b'\n')
+        self.assertIn(b"The session of this token is over, login again\n", sock.received)
+        self.assertFalse(player.is_already_login())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,35 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import Leaderboard
+
+
+class LeaderboardTest(unittest.TestCase):
+    def setUp(self):
+        self.board = Leaderboard.Leaderboard()
+        self.board.load([('carol', 1, 20), ('alice', 2, 21), ('bob', 2, 19)])
+
+    def test_load_ranks_by_wins_then_best_then_name(self):
+        self.assertEqual(self.board.top(10), [('alice', 2, 21), ('bob', 2, 19), ('carol', 1, 20)])
+        self.assertEqual(self.board.top(1), [('alice', 2, 21)])
+        self.assertEqual(len(self.board), 3)
+
+    def test_add_win_moves_the_player(self):
+        self.board.add_win('carol', 18)
+        self.assertEqual(self.board.rank('carol'), (2, 2, 20))
+        self.board.add_win('carol', 21)
+        self.assertEqual(self.board.rank('carol'), (1, 3, 21))
+        self.assertEqual([name for name, wins, best in self.board.top(10)], ['carol', 'alice', 'bob'])
+        self.assertEqual(len(self.board.order), 3)
+
+    def test_new_winner(self):
+        self.assertIsNone(self.board.rank('dave'))
+        self.board.add_win('dave', 21)
+        self.assertEqual(self.board.rank('dave'), (3, 1, 21))
+        self.assertEqual(self.board.rank('carol'), (4, 1, 20))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,64 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import LineFramer
+
+
+class LineFramerTest(unittest.TestCase):
+    def setUp(self):
+        self.framer = LineFramer.LineFramer(16)
+
+    def feed(self, data):
+        return self.framer.feed(bytearray(data))
+
+    def test_pipelined_lines(self):
+        self.assertEqual(self.feed(b'$help\r\n$rooms\n$online_time\n'), [b'$help', b'$rooms', b'$online_time'])
+        self.assertEqual(self.framer.pending_size(), 0)
+
+    def test_line_split_over_segments(self):
+        self.assertEqual(self.feed(b'$chat he'), [])
+        self.assertEqual(self.feed(b'llo'), [])
+        self.assertEqual(self.framer.pending_data(), b'$chat hello')
+        self.assertEqual(self.feed(b'\n$he'), [b'$chat hello'])
+        self.assertEqual(self.feed(b'lp\n'), [b'$help'])
+
+    def test_only_length_bytes_are_read(self):
+        buf = bytearray(b'$help\n$rooms\nstale data')
+        self.assertEqual(self.framer.feed(buf, 13), [b'$help', b'$rooms'])
+        self.assertEqual(self.framer.pending_size(), 0)
+
+    def test_long_line_is_reported_once(self):
+        self.assertEqual(self.feed(b'x' * 20 + b'\n$help\n'), [None, b'$help'])
+
+    def test_long_line_over_segments_is_skipped(self):
+        self.assertEqual(self.feed(b'x' * 10), [])
+        self.assertEqual(self.feed(b'x' * 10), [None])
+        self.assertEqual(self.feed(b'x' * 100), [])
+        self.assertEqual(self.framer.pending_size(), 0)  # nothing of the long line is kept
+        self.assertEqual(self.feed(b'xx\n$help\n'), [b'$help'])
+
+    def test_join_lines_and_heartbeat(self):
+        lines = self.feed(b'$pong\n' + b'x' * 20 + b'\n$help\n')
+        self.assertEqual(LineFramer.LineFramer.join_lines(lines), b'$pong\n$help\n')
+        self.assertTrue(LineFramer.LineFramer.is_heartbeat(lines[0]))
+        self.assertFalse(LineFramer.LineFramer.is_heartbeat(lines[1]))
+        self.assertFalse(LineFramer.LineFramer.is_heartbeat(lines[2]))
+
+
+class RequestIdTest(unittest.TestCase):
+    def test_tagged_line(self):
+        self.assertEqual(LineFramer.split_request_id(b'#17 $online_time'), (b'17', b'$online_time'))
+        self.assertEqual(LineFramer.split_request_id(b'#3   $chat hi'), (b'3', b'$chat hi'))
+
+    def test_untagged_line_is_untouched(self):
+        for line in (b'$online_time', b'#bob $chat hi', b'#12', b'#', b'# $help', b'#1a $help'):
+            self.assertEqual(LineFramer.split_request_id(line), (None, line))
+
+    def test_tag_lines(self):
+        self.assertEqual(LineFramer.tag_lines(b'5', b'one\ntwo\n'), b'#5 one\n#5 two\n')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,75 @@
+import os
+import shutil
+import socket
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import Metrics
+
+
+class MetricsTest(unittest.TestCase):
+    def setUp(self):
+        self.metrics = Metrics.Metrics()
+        self.commands = self.metrics.counter('commands_total', "Commands handled")
+        self.metrics.gauge('players', "Connected players", lambda: 3)
+        self.latency = self.metrics.histogram('latency_seconds', "Command latency", buckets=(0.001, 0.01))
+        self.metrics.collector('rooms_players', 'gauge', "Players of each room",
+                               lambda: [({'room': 'r"1'}, 2)])
+
+    def test_prometheus_text(self):
+        self.commands.value += 2
+        for value in (0.0005, 0.005, 0.005, 1.0):
+            self.latency.observe(value)
+        lines = self.metrics.format_prometheus().splitlines()
+        self.assertEqual(lines[:3], ["# HELP kgamehall_commands_total Commands handled",
+                                     "# TYPE kgamehall_commands_total counter", "kgamehall_commands_total 2"])
+        self.assertIn("kgamehall_players 3", lines)
+        self.assertIn('kgamehall_latency_seconds_bucket{le="0.001"} 1', lines)
+        self.assertIn('kgamehall_latency_seconds_bucket{le="0.01"} 3', lines)
+        self.assertIn('kgamehall_latency_seconds_bucket{le="+Inf"} 4', lines)
+        self.assertIn("kgamehall_latency_seconds_count 4", lines)
+        self.assertIn('kgamehall_rooms_players{room="r\\"1"} 2', lines)
+
+    def test_percentile_is_a_bucket_bound(self):
+        for value in (0.0005, 0.005, 0.005, 1.0):
+            self.latency.observe(value)
+        self.assertEqual(self.latency.percentile(0.25), 0.001)
+        self.assertEqual(self.latency.percentile(0.5), 0.01)
+        self.assertEqual(self.latency.percentile(0.99), float('inf'))
+
+    def test_text_summary(self):
+        text = self.metrics.format_text()
+        self.assertIn("commands_total: 0", text)
+        self.assertIn("latency_seconds: count 0", text)
+        self.assertNotIn("rooms_players", text)
+
+
+class MetricsServerTest(unittest.TestCase):
+    def test_scrape_over_a_unix_socket(self):
+        tmp = tempfile.mkdtemp()
+        metrics = Metrics.Metrics()
+        metrics.counter('commands_total', "Commands handled").value = 7
+        server = Metrics.MetricsServer(metrics, os.path.join(tmp, 'metrics.sock'))
+        server.start()
+        try:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.connect(server.address)
+            sock.sendall(b"GET /metrics HTTP/1.0\r\n\r\n")
+            response = b''
+            while True:
+                chunk = sock.recv(4096)
+                if not chunk:
+                    break
+                response += chunk
+            sock.close()
+        finally:
+            server.stop()
+            shutil.rmtree(tmp)
+        self.assertTrue(response.startswith(b"HTTP/1.0 200 OK\r\n"))
+        self.assertIn(b"\nkgamehall_commands_total 7\n", response)
+
+
+if __name__ == '__main__':
+    unittest.main()
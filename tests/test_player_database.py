@@ -0,0 +1,60 @@
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import PlayerDatabase
+
+
+class PlayerDatabaseTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp, 'players.db')
+        self.db = PlayerDatabase.PlayerDatabase(self.path, flush_interval=3600)
+        self.db.open()
+
+    def tearDown(self):
+        self.db.close()
+        shutil.rmtree(self.tmp)
+
+    def test_accounts(self):
+        self.assertTrue(self.db.add_user('alice', 'hash1'))
+        self.assertFalse(self.db.add_user('alice', 'hash2'))
+        self.assertEqual(self.db.get_user('alice'), ('hash1', 0))
+        self.db.set_password('alice', 'hash3')
+        self.assertEqual(self.db.get_user('alice'), ('hash3', 0))
+        self.assertIsNone(self.db.get_user('bob'))
+
+    def test_online_time_is_read_before_it_is_written(self):
+        self.db.add_user('alice', 'hash')
+        self.db.add_online_time('alice', 5)
+        self.db.add_online_time('alice', 7)
+        self.assertEqual(self.db.get_user('alice'), ('hash', 12))
+        self.assertEqual(self.db.commit_count, 0)
+        self.db.flush_now()
+        self.assertEqual(self.db.commit_count, 1)
+        self.assertEqual(self.db.get_user('alice'), ('hash', 12))  # not counted twice
+        self.db.flush_now()  # nothing pending, no commit
+        self.assertEqual(self.db.commit_count, 1)
+
+    def test_results_and_leaderboard(self):
+        self.db.add_result('r1', 'alice', '10+10+1', 21, 1.0)
+        self.db.add_result('r2', 'alice', '10+10', 20, 2.0)
+        self.db.add_result('r3', 'bob', '2*10', 20, 3.0)
+        self.assertEqual(self.db.load_leaderboard(), [])
+        self.db.flush_now()
+        self.assertEqual(sorted(self.db.load_leaderboard()), [('alice', 2, 21), ('bob', 1, 20)])
+
+    def test_close_writes_the_buffered_deltas(self):
+        self.db.add_user('alice', 'hash')
+        self.db.add_online_time('alice', 30)
+        self.db.close()
+        self.db = PlayerDatabase.PlayerDatabase(self.path)
+        self.db.open()
+        self.assertEqual(self.db.get_user('alice'), ('hash', 30))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,96 @@
+import os
+import select
+import socket
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import Poller
+
+
+class Conn:
+    def __init__(self, sock):
+        self.sock = sock
+
+    def fileno(self):
+        return self.sock.fileno()
+
+
+class PollerTests(object):
+    """
+    The same checks for every backend, mixed into a TestCase with backend set
+    """
+    backend = None
+
+    def setUp(self):
+        self.poller = Poller.create_poller(self.backend)
+        self.pairs = [socket.socketpair() for i in range(3)]
+        self.conns = [Conn(a) for a, b in self.pairs]
+
+    def tearDown(self):
+        self.poller.close()
+        for a, b in self.pairs:
+            a.close()
+            b.close()
+
+    def test_readable(self):
+        for conn in self.conns:
+            self.poller.register(conn)
+        self.assertEqual(self.poller.poll(0), ([], [], []))
+        self.pairs[1][1].send(b'x')
+        readable, writable, error = self.poller.poll(1.0)
+        self.assertEqual(readable, [self.conns[1]])
+        self.assertEqual(writable, [])
+
+    def test_modify_and_unregister(self):
+        conn = self.conns[0]
+        self.poller.register(conn, read=False, write=True)
+        self.assertEqual(self.poller.poll(0)[1], [conn])
+        self.poller.modify(conn, read=True, write=False)
+        self.assertEqual(self.poller.poll(0), ([], [], []))
+        self.pairs[0][1].send(b'x')
+        self.assertEqual(self.poller.poll(1.0)[0], [conn])
+        self.poller.unregister(conn)
+        self.poller.unregister(conn)  # twice is harmless
+        self.assertEqual(self.poller.poll(0), ([], [], []))
+
+    def test_hang_up_is_readable(self):
+        self.poller.register(self.conns[2])
+        self.pairs[2][1].close()
+        self.assertEqual(self.poller.poll(1.0)[0], [self.conns[2]])
+
+    def test_waker(self):
+        waker = Poller.Waker()
+        try:
+            self.poller.register(waker)
+            waker.wake()
+            waker.wake()
+            self.assertEqual(self.poller.poll(1.0)[0], [waker])
+            waker.drain()
+            self.assertEqual(self.poller.poll(0)[0], [])
+        finally:
+            self.poller.unregister(waker)
+            waker.close()
+
+
+class SelectPollerTest(PollerTests, unittest.TestCase):
+    backend = 'select'
+
+
+@unittest.skipUnless(hasattr(select, 'epoll'), "epoll is Linux only")
+class EpollPollerTest(PollerTests, unittest.TestCase):
+    backend = 'epoll'
+
+
+class CreatePollerTest(unittest.TestCase):
+    def test_unknown_backend(self):
+        self.assertRaises(ValueError, Poller.create_poller, 'kqueue2')
+
+    def test_auto(self):
+        poller = Poller.create_poller()
+        self.assertEqual(poller.name, 'epoll' if hasattr(select, 'epoll') else 'select')
+        poller.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,56 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import RateLimiter
+
+
+class FakePlayer:
+    buckets = None
+
+
+class ParseLimitsTest(unittest.TestCase):
+    def test_parse(self):
+        self.assertEqual(RateLimiter.parse_limits('chat=5:20,login=0.5'), {'chat': (5.0, 20.0), 'login': (0.5, 1.0)})
+        self.assertEqual(RateLimiter.parse_limits('none'), {})
+        self.assertEqual(set(RateLimiter.parse_limits(RateLimiter.DEFAULT_LIMITS)), set(RateLimiter.CLASSES))
+
+    def test_invalid(self):
+        for spec in ('shout=1:2', 'chat=0:5', 'chat=1:0.5', 'chat=fast'):
+            self.assertRaises(ValueError, RateLimiter.parse_limits, spec)
+
+
+class RateLimiterTest(unittest.TestCase):
+    def setUp(self):
+        self.now = 100.0
+        self.limiter = RateLimiter.RateLimiter({'chat': (2.0, 3.0)}, lambda: self.now)
+        self.player = FakePlayer()
+
+    def test_burst_then_rate(self):
+        self.assertEqual([self.limiter.take(self.player, 'chat') for i in range(3)], [0, 0, 0])
+        self.assertAlmostEqual(self.limiter.take(self.player, 'chat'), 0.5)
+        self.now += 0.5
+        self.assertEqual(self.limiter.take(self.player, 'chat'), 0)
+        self.assertAlmostEqual(self.limiter.take(self.player, 'chat'), 0.5)
+
+    def test_refill_stops_at_burst(self):
+        for i in range(3):
+            self.limiter.take(self.player, 'chat')
+        self.now += 60
+        self.assertEqual([self.limiter.take(self.player, 'chat') for i in range(3)], [0, 0, 0])
+        self.assertGreater(self.limiter.take(self.player, 'chat'), 0)
+
+    def test_unlimited_class_creates_no_bucket(self):
+        self.assertEqual(self.limiter.take(self.player, 'chatall'), 0)
+        self.assertIsNone(self.player.buckets)
+
+    def test_classes_have_their_own_bucket(self):
+        limiter = RateLimiter.RateLimiter({'chat': (1.0, 1.0), 'room': (1.0, 1.0)}, lambda: self.now)
+        self.assertEqual(limiter.take(self.player, 'chat'), 0)
+        self.assertEqual(limiter.take(self.player, 'room'), 0)
+        self.assertGreater(limiter.take(self.player, 'chat'), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
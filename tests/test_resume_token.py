@@ -0,0 +1,36 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import Fanout
+import ResumeToken
+
+
+class ResumeTokenTest(unittest.TestCase):
+    def test_issue_and_verify(self):
+        token = ResumeToken.issue(b'secret', 'alice', '1a-0')
+        self.assertEqual(len(token.split()), 1)
+        self.assertEqual(ResumeToken.verify(b'secret', token), ('alice', '1a-0'))
+
+    def test_any_name_is_one_word(self):
+        for name in (Fanout.to_str(u'\u5f20\u4e09'.encode('utf-8')), 'a.b c', '#12'):  # names are native str
+            token = ResumeToken.issue(b'secret', name, '2b-1')
+            self.assertEqual(token.count('.'), 2)
+            self.assertEqual(ResumeToken.verify(b'secret', token), (name, '2b-1'))
+
+    def test_other_secret_or_tampered_token(self):
+        token = ResumeToken.issue(b'secret', 'alice', '1a-0')
+        encoded, nonce, mac = token.split('.')
+        self.assertIsNone(ResumeToken.verify(b'other', token))
+        self.assertIsNone(ResumeToken.verify(b'secret', '.'.join([encoded, '1a-1', mac])))
+        forged = ResumeToken.issue(b'secret', 'mallory', '1a-0').split('.')[0]
+        self.assertIsNone(ResumeToken.verify(b'secret', '.'.join([forged, nonce, mac])))
+
+    def test_malformed_token(self):
+        for token in ('', 'abc', 'a.b', 'a.b.c.d', u'\xe9.1.2', '!!!.1a-0.' + '0' * 32):
+            self.assertIsNone(ResumeToken.verify(b'secret', token))
+
+
+if __name__ == '__main__':
+    unittest.main()
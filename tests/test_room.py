@@ -0,0 +1,53 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import ExpressionEvaluator
+import Fanout
+import Player
+import Room
+
+
+class FakeSock:
+    def setblocking(self, flag):
+        pass
+
+
+class RoomTest(unittest.TestCase):
+    def setUp(self):
+        self.sent = []
+        fanout = Fanout.Fanout(lambda player, data: self.sent.append(Fanout.to_str(data)),
+                               lambda player, msg: self.sent.append(Fanout.to_str(msg)))
+        self.results = []
+        self.room = Room.Room('r1', fanout, ExpressionEvaluator.ExpressionEvaluator(),
+                              record_result=lambda room, *result: self.results.append(result))
+        self.leader = self.join('leader')
+        self.keeper = self.join('keeper')
+        self.room.start_21game()
+        self.room.game_number = [1, 2, 3, 4]
+
+    def join(self, name):
+        player = Player.Player(FakeSock())
+        player.login(name)
+        self.room.add_player(player)
+        return player
+
+    def test_leader_logs_out_mid_round(self):
+        self.room.handle_21game_player_answer(self.leader, '1+2+3+4')
+        self.room.remove_player(self.leader)  # what GameHall.logout does through leave_room
+        self.leader.logout()
+        self.room.end_21game()
+        self.assertIn("21 point game: what a pity, nobody wins the game\n", self.sent)
+        self.assertEqual(self.results, [])
+
+    def test_best_answer_wins_at_the_end(self):
+        self.room.handle_21game_player_answer(self.leader, '1+2+3+4')
+        self.room.handle_21game_player_answer(self.keeper, '1*2+3+4')
+        self.room.end_21game()
+        self.assertIn("21 point game: leader is the winner(1+2+3+4=10)\n", self.sent)
+        self.assertEqual(self.results, [('leader', '1+2+3+4', 10)])
+
+
+if __name__ == '__main__':
+    unittest.main()
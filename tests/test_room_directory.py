@@ -0,0 +1,67 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import BinaryProtocol
+import RoomDirectory
+
+
+class RoomDirectoryTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = RoomDirectory.RoomDirectory(page_size=3)
+        for i, players in enumerate((2, 5, 1, 5, 3, 2, 4)):
+            self.directory.update('room%d' % i, players)
+        self.directory.update('lobby', 1)
+
+    def page(self, page=1, prefix='', sort='name'):
+        data = self.directory.render(page, prefix, sort)
+        return data.decode('utf-8').splitlines() if data is not None else None
+
+    def test_pages_by_name(self):
+        self.assertEqual(self.page(1), ["Num of rooms: 8, page 1/3", "lobby(1 players)", "room0(2 players)",
+                                        "room1(5 players)"])
+        self.assertEqual(self.page(3), ["Num of rooms: 8, page 3/3", "room5(2 players)", "room6(4 players)"])
+        self.assertIsNone(self.page(4))
+        self.assertIsNone(self.page(0))
+
+    def test_pages_by_players(self):
+        self.assertEqual(self.page(1, sort='players')[1:], ["room1(5 players)", "room3(5 players)",
+                                                            "room6(4 players)"])
+        self.assertEqual(self.page(2, sort='players')[1:], ["room4(3 players)", "room0(2 players)",
+                                                            "room5(2 players)"])
+        self.assertEqual(self.page(3, sort='players')[1:], ["lobby(1 players)", "room2(1 players)"])
+
+    def test_prefix(self):
+        self.assertEqual(self.page(1, prefix='lo'), ["Num of rooms: 1, page 1/1", "lobby(1 players)"])
+        self.assertEqual(self.page(3, prefix='room', sort='players'), ["Num of rooms: 7, page 3/3", "room2(1 players)"])
+        self.assertEqual(self.page(1, prefix='zzz'), ["Num of rooms: 0, page 1/1"])
+        self.assertEqual(RoomDirectory.prefix_end('ab'), 'ac')
+
+    def test_update_and_remove(self):
+        self.page(1)
+        self.directory.update('room1', 0)
+        self.directory.update('lobby', 6)
+        self.assertNotIn('room1', self.directory)
+        self.assertEqual(len(self.directory), 7)
+        self.assertEqual(self.page(1, sort='players')[:3], ["Num of rooms: 7, page 1/3", "lobby(6 players)",
+                                                            "room3(5 players)"])
+        self.assertEqual(self.directory.by_players.get(1), ['room2'])
+
+    def test_pages_are_cached_until_a_change(self):
+        first = self.directory.render(1)
+        self.assertIs(self.directory.render(1), first)
+        self.directory.update('room0', 2)  # no change
+        self.assertIs(self.directory.render(1), first)
+        self.directory.update('room0', 3)
+        self.assertIsNot(self.directory.render(1), first)
+
+    def test_binary_listing(self):
+        opcode, payload = self.directory.render(2, protocol=BinaryProtocol.CODECS['binary'])
+        self.assertEqual(opcode, BinaryProtocol.OP_ROOMS)
+        self.assertEqual(BinaryProtocol.decode_rooms(payload),
+                         (8, 2, 3, [('room2', 1), ('room3', 5), ('room4', 3)]))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,32 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import Scheduler
+
+
+class SchedulerTest(unittest.TestCase):
+    def test_failing_timer_does_not_stop_the_others(self):
+        now = [100.0]
+        scheduler = Scheduler.Scheduler(lambda: now[0])
+        ran = []
+
+        def fail():
+            raise TypeError("broken room")
+        scheduler.call_at(101, ran.append, 'first')
+        scheduler.call_at(102, fail)
+        scheduler.call_at(103, ran.append, 'last')
+        now[0] = 110.0
+        stderr, sys.stderr = sys.stderr, open(os.devnull, 'w')  # the traceback of fail
+        try:
+            scheduler.run_due()
+        finally:
+            sys.stderr.close()
+            sys.stderr = stderr
+        self.assertEqual(ran, ['first', 'last'])
+        self.assertIsNone(scheduler.next_deadline())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,66 @@
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import ExpressionEvaluator
+import SolutionIndex
+
+
+class SolveTest(unittest.TestCase):
+    def test_best_value_and_expression(self):
+        best, expr = SolutionIndex.solve([1, 5, 5, 5])
+        self.assertEqual(best, 21)
+        self.assertEqual(ExpressionEvaluator.ExpressionEvaluator().evaluate(expr), (21, (1, 5, 5, 5)))
+        self.assertEqual(SolutionIndex.solve([1, 1, 1, 1])[0], 4)
+        self.assertEqual(SolutionIndex.solve([1, 1, 1, 1], ops='-')[0], 2)  # 1-((1-1)-1)
+
+    def test_fractions_are_exact(self):
+        best, expr = SolutionIndex.solve([3, 3, 8, 8], target=24)
+        self.assertEqual(best, 24)  # 8/(3-8/3)
+        self.assertIn('/', expr)
+
+
+class SolutionIndexTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.index = SolutionIndex.SolutionIndex(lo=1, hi=4)
+        cls.index.build(processes=1)
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_lookup_in_any_order(self):
+        self.assertEqual(len(self.index.entries), 35)
+        self.assertEqual(self.index.lookup([4, 1, 3, 2]), self.index.lookup((1, 2, 3, 4)))
+        self.assertEqual(self.index.lookup([1, 1, 1, 1])[0], 4)
+        self.assertEqual(self.index.lookup([9, 9, 9, 9]), (None, None))
+
+    def test_random_puzzle_is_solvable(self):
+        self.assertTrue(self.index.solvable)
+        for i in range(20):
+            puzzle = self.index.random_puzzle()
+            self.assertEqual(self.index.lookup(puzzle)[0], 21)
+
+    def test_save_and_load(self):
+        path = os.path.join(self.tmp, 'solutions.idx')
+        self.index.save(path)
+        loaded = SolutionIndex.SolutionIndex.load(path)
+        self.assertEqual((loaded.lo, loaded.hi, loaded.ops, loaded.target), (1, 4, '+-*/', 21))
+        self.assertEqual(loaded.entries, self.index.entries)
+        self.assertEqual(loaded.solvable, self.index.solvable)
+
+    def test_load_rejects_other_files(self):
+        path = os.path.join(self.tmp, 'other.idx')
+        with open(path, 'wb') as f:
+            f.write(b'\0' * SolutionIndex.HEADER.size)
+        self.assertRaises(ValueError, SolutionIndex.SolutionIndex.load, path)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,67 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import TimingWheel
+
+
+class Item:
+    def __init__(self, name):
+        self.name = name
+        self.wheel_slot = None
+
+    def __repr__(self):
+        return self.name
+
+
+class TimingWheelTest(unittest.TestCase):
+    def setUp(self):
+        self.wheel = TimingWheel.TimingWheel(10)
+        self.a, self.b, self.c = Item('a'), Item('b'), Item('c')
+
+    def expired(self, now):
+        return sorted(self.wheel.advance(now), key=lambda item: item.name)
+
+    def test_items_expire_at_their_tick(self):
+        self.wheel.schedule(self.a, 3, 100)
+        self.wheel.schedule(self.b, 5, 100)
+        self.assertEqual(len(self.wheel), 2)
+        self.assertEqual(self.expired(102), [])
+        self.assertEqual(self.expired(103), [self.a])
+        self.assertIsNone(self.a.wheel_slot)
+        self.assertEqual(self.expired(110), [self.b])
+        self.assertEqual(len(self.wheel), 0)
+
+    def test_reschedule_and_remove(self):
+        self.wheel.schedule(self.a, 2, 100)
+        self.wheel.schedule(self.a, 6, 100)  # moved, not added twice
+        self.wheel.schedule(self.b, 2, 100)
+        self.wheel.remove(self.b)
+        self.wheel.remove(self.c)  # not in the wheel
+        self.assertEqual(len(self.wheel), 1)
+        self.assertEqual(self.expired(105), [])
+        self.assertEqual(self.expired(106), [self.a])
+
+    def test_delay_is_clamped_to_one_turn(self):
+        self.wheel.schedule(self.a, 0, 100)
+        self.wheel.schedule(self.b, 1000, 100)
+        self.assertEqual(self.expired(101), [self.a])
+        self.assertEqual(self.expired(109), [self.b])  # the owner reschedules an item out too early
+
+    def test_long_pause_expires_everything(self):
+        for item, ticks in ((self.a, 1), (self.b, 5), (self.c, 9)):
+            self.wheel.schedule(item, ticks, 100)
+        self.assertEqual(self.expired(500), [self.a, self.b, self.c])
+        self.assertEqual(len(self.wheel), 0)
+
+    def test_schedule_from_a_late_tick(self):
+        self.wheel.schedule(self.a, 1, 100)
+        self.expired(105)
+        self.wheel.schedule(self.b, 2, 103)  # counted from the tick the wheel reached
+        self.assertEqual(self.expired(106), [])
+        self.assertEqual(self.expired(107), [self.b])
+
+
+if __name__ == '__main__':
+    unittest.main()
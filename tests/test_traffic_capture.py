@@ -0,0 +1,72 @@
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import GameHallServer
+import Player
+import TrafficCapture
+
+
+class FakePlayer:
+    pass
+
+
+class TrafficCaptureTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp, 'traffic.cap')
+        now = [1000.0]
+        writer = TrafficCapture.CaptureWriter(self.path, lambda: now[0])
+        player = FakePlayer()
+        writer.connect(player)
+        now[0] += 0.5
+        writer.data(player, b'$register alice pw\n')
+        now[0] += 2.0
+        writer.data(player, b'$online_time\n')
+        writer.close(player)
+        writer.close_file()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def replay(self, dbname):
+        reader = TrafficCapture.CaptureReader(self.path)
+        hall = GameHallServer.GameHall('', 0, 10, os.path.join(self.tmp, dbname), 1, 30, hash_iterations=1,
+                                       flush_interval=3600, resume_secret=b'replay',
+                                       clock=TrafficCapture.VirtualClock(reader.start))
+        try:
+            r = TrafficCapture.Replay(hall, reader)
+            r.run()
+        finally:
+            reader.close()
+            hall.database.close()
+        return r
+
+    def test_reader_returns_the_written_events(self):
+        reader = TrafficCapture.CaptureReader(self.path)
+        events = list(reader)
+        reader.close()
+        self.assertEqual(reader.start, 1000.0)
+        self.assertEqual(events, [(0.0, 1, TrafficCapture.CONNECT, b''),
+                                  (0.5, 1, TrafficCapture.DATA, b'$register alice pw\n'),
+                                  (2.5, 1, TrafficCapture.DATA, b'$online_time\n'),
+                                  (2.5, 1, TrafficCapture.CLOSE, b'')])
+
+    def test_replay_is_deterministic(self):
+        first = self.replay('first.db')
+        second = self.replay('second.db')
+        self.assertEqual(first.events, 4)
+        self.assertGreater(first.bytes_sent(), 0)
+        self.assertEqual(first.checksum(), second.checksum())
+
+    def test_replay_puts_the_clock_back(self):
+        clock = Player.monotonic
+        self.replay('clock.db')
+        self.assertIs(Player.monotonic, clock)
+
+
+if __name__ == '__main__':
+    unittest.main()